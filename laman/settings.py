@@ -141,3 +141,27 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = 'namefinder:login'
 LOGIN_REDIRECT_URL = 'namefinder:index'
 LOGOUT_REDIRECT_URL = 'namefinder:index'
+
+# Search settings
+# Seconds a regex search may run before it is rejected as too expensive
+REGEX_SEARCH_TIMEOUT = config('REGEX_SEARCH_TIMEOUT', default=2.0, cast=float)
+# Regex results cached per worker process (by pattern)
+REGEX_SEARCH_CACHE_SIZE = config('REGEX_SEARCH_CACHE_SIZE', default=256, cast=int)
+# Seconds browsers may reuse a typeahead response without revalidating
+TYPEAHEAD_CACHE_MAX_AGE = config('TYPEAHEAD_CACHE_MAX_AGE', default=60, cast=int)
+# Most names accepted by one bulk name-matching request
+NAME_MATCH_MAX_BATCH = config('NAME_MATCH_MAX_BATCH', default=50000, cast=int)
+
+# Network settings
+# Most names in an ego network, and most names added per hop (0 = no limit)
+NETWORK_EGO_MAX_NODES = config('NETWORK_EGO_MAX_NODES', default=5000, cast=int)
+NETWORK_EGO_HOP_LIMIT = config('NETWORK_EGO_HOP_LIMIT', default=1000, cast=int)
+# Seconds a request waits for a pooled computation (communities, layouts), and pool processes
+NETWORK_COMPUTE_TIMEOUT = config('NETWORK_COMPUTE_TIMEOUT', default=5.0, cast=float)
+NETWORK_COMPUTE_WORKERS = config('NETWORK_COMPUTE_WORKERS', default=1, cast=int)
+# Networks with more edges are computed by the run_network_jobs process (0 = always inline)
+NETWORK_JOB_MIN_EDGES = config('NETWORK_JOB_MIN_EDGES', default=50000, cast=int)
+# Job processes, where job results are stored, and for how long
+NETWORK_JOB_WORKERS = config('NETWORK_JOB_WORKERS', default=2, cast=int)
+NETWORK_JOB_DIR = config('NETWORK_JOB_DIR', default=str(BASE_DIR / 'network_jobs'))
+NETWORK_JOB_KEEP_HOURS = config('NETWORK_JOB_KEEP_HOURS', default=24, cast=int)
@@ -2,22 +2,45 @@
 API views for AJAX inline editing
 """
 import json
-from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
+from collections import namedtuple
+import numpy as np
+from django.http import JsonResponse, StreamingHttpResponse, FileResponse
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_http_methods, condition
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.csrf import csrf_protect
-from django.db.models import Q
-from .models import Name, Instance, Fragment, Series, NameType, WritingType, CompletenessType, Milieu, Determinative, ChangeLog
+from django.views.decorators.csrf import csrf_protect, csrf_exempt
+from .models import Name, Instance, Fragment, Series, NameType, WritingType, CompletenessType, Milieu, Determinative, PublicationType, ChangeLog, NetworkJob
+from .lookups import lookups
+from .typeahead import name_typeahead
+from .matching import match_names
+from .facets import facet_counts, FACETS, FK_FACETS
+from .regex_engine import RegexTooExpensive
+from .search import date_choices, id_filter, search_filter
+from .versioning import current_version
+from . import network, payload, layouts, metrics, jobs, communities
+from .communities import HAS_LOUVAIN
+
+
+# String forms accepted for boolean fields of JSON requests
+BOOLEAN_STRINGS = {'true': True, '1': True, 'yes': True, 'false': False, '0': False, 'no': False}
+
+
+def lookup_label(tables, model, pk):
+    """Name of a lookup row by id, resolved from the in-memory registry"""
+    obj = tables.get(model, pk) if pk else None
+    return obj.name if obj else None
 
 
 def get_name_data(name):
     """Extract name data as dict for logging"""
+    tables = lookups()
     return {
         'name': name.name,
-        'name_type': name.name_type.name if name.name_type else None,
-        'writing_type': name.writing_type.name if name.writing_type else None,
-        'completeness': name.completeness.name if name.completeness else None,
-        'milieu': name.milieu.name if name.milieu else None,
+        'name_type': lookup_label(tables, NameType, name.name_type_id),
+        'writing_type': lookup_label(tables, WritingType, name.writing_type_id),
+        'completeness': lookup_label(tables, CompletenessType, name.completeness_id),
+        'milieu': lookup_label(tables, Milieu, name.milieu_id),
         'uncertain': name.uncertain,
         'variant_forms': name.variant_forms,
         'correspondence': name.correspondence,
@@ -27,23 +50,25 @@ def get_name_data(name):
 
 def get_instance_data(instance):
     """Extract instance data as dict for logging"""
+    tables = lookups()
     return {
         'name': instance.name.name if instance.name else None,
         'fragment': instance.fragment.series_fragment if instance.fragment else None,
         'line': instance.line,
         'spelling': instance.spelling,
-        'writing_type': instance.writing_type.name if instance.writing_type else None,
-        'determinative': instance.determinative.name if instance.determinative else None,
+        'writing_type': lookup_label(tables, WritingType, instance.writing_type_id),
+        'determinative': lookup_label(tables, Determinative, instance.determinative_id),
         'title_epithet': instance.title_epithet,
     }
 
 
 def get_fragment_data(fragment):
     """Extract fragment data as dict for logging"""
+    tables = lookups()
     return {
-        'series': fragment.series.name if fragment.series else None,
+        'series': lookup_label(tables, Series, fragment.series_id),
         'fragment_number': fragment.fragment_number,
-        'publication_type': fragment.publication_type.name if fragment.publication_type else None,
+        'publication_type': lookup_label(tables, PublicationType, fragment.publication_type_id),
     }
 
 
@@ -416,6 +441,7 @@ def api_revert_change(request, pk):
     
     try:
         change = ChangeLog.objects.get(pk=pk)
+        tables = lookups()
         
         if change.reverted:
             return JsonResponse({'error': 'This change has already been reverted'}, status=400)
@@ -449,16 +475,16 @@ def api_revert_change(request, pk):
                 if change.model_type == 'name':
                     recreate_data['name'] = old_data.get('name', '')
                     if old_data.get('name_type'):
-                        nt = NameType.objects.filter(name=old_data['name_type']).first()
+                        nt = tables.by_label(NameType, old_data['name_type'])
                         if nt: recreate_data['name_type'] = nt
                     if old_data.get('writing_type'):
-                        wt = WritingType.objects.filter(name=old_data['writing_type']).first()
+                        wt = tables.by_label(WritingType, old_data['writing_type'])
                         if wt: recreate_data['writing_type'] = wt
                     if old_data.get('completeness'):
-                        ct = CompletenessType.objects.filter(name=old_data['completeness']).first()
+                        ct = tables.by_label(CompletenessType, old_data['completeness'])
                         if ct: recreate_data['completeness'] = ct
                     if old_data.get('milieu'):
-                        m = Milieu.objects.filter(name=old_data['milieu']).first()
+                        m = tables.by_label(Milieu, old_data['milieu'])
                         if m: recreate_data['milieu'] = m
                     recreate_data['uncertain'] = old_data.get('uncertain', False)
                     recreate_data['variant_forms'] = old_data.get('variant_forms', '')
@@ -468,7 +494,7 @@ def api_revert_change(request, pk):
                     
                 elif change.model_type == 'fragment':
                     if old_data.get('series'):
-                        series = Series.objects.filter(name=old_data['series']).first()
+                        series = tables.by_label(Series, old_data['series'])
                         if series:
                             recreate_data['series'] = series
                     recreate_data['fragment_number'] = old_data.get('fragment_number', '')
@@ -492,10 +518,10 @@ def api_revert_change(request, pk):
                     recreate_data['spelling'] = old_data.get('spelling', '')
                     recreate_data['title_epithet'] = old_data.get('title_epithet', '')
                     if old_data.get('writing_type'):
-                        wt = WritingType.objects.filter(name=old_data['writing_type']).first()
+                        wt = tables.by_label(WritingType, old_data['writing_type'])
                         if wt: recreate_data['writing_type'] = wt
                     if old_data.get('determinative'):
-                        det = Determinative.objects.filter(name=old_data['determinative']).first()
+                        det = tables.by_label(Determinative, old_data['determinative'])
                         if det: recreate_data['determinative'] = det
                     model_class.objects.create(**recreate_data)
                     
@@ -509,16 +535,16 @@ def api_revert_change(request, pk):
                     if change.model_type == 'name':
                         obj.name = old_data.get('name', obj.name)
                         if 'name_type' in old_data:
-                            nt = NameType.objects.filter(name=old_data['name_type']).first() if old_data['name_type'] else None
+                            nt = tables.by_label(NameType, old_data['name_type'])
                             obj.name_type = nt
                         if 'writing_type' in old_data:
-                            wt = WritingType.objects.filter(name=old_data['writing_type']).first() if old_data['writing_type'] else None
+                            wt = tables.by_label(WritingType, old_data['writing_type'])
                             obj.writing_type = wt
                         if 'completeness' in old_data:
-                            ct = CompletenessType.objects.filter(name=old_data['completeness']).first() if old_data['completeness'] else None
+                            ct = tables.by_label(CompletenessType, old_data['completeness'])
                             obj.completeness = ct
                         if 'milieu' in old_data:
-                            m = Milieu.objects.filter(name=old_data['milieu']).first() if old_data['milieu'] else None
+                            m = tables.by_label(Milieu, old_data['milieu'])
                             obj.milieu = m
                         obj.uncertain = old_data.get('uncertain', obj.uncertain)
                         obj.variant_forms = old_data.get('variant_forms', obj.variant_forms)
@@ -530,10 +556,10 @@ def api_revert_change(request, pk):
                         obj.spelling = old_data.get('spelling', obj.spelling)
                         obj.title_epithet = old_data.get('title_epithet', obj.title_epithet)
                         if 'writing_type' in old_data:
-                            wt = WritingType.objects.filter(name=old_data['writing_type']).first() if old_data['writing_type'] else None
+                            wt = tables.by_label(WritingType, old_data['writing_type'])
                             obj.writing_type = wt
                         if 'determinative' in old_data:
-                            det = Determinative.objects.filter(name=old_data['determinative']).first() if old_data['determinative'] else None
+                            det = tables.by_label(Determinative, old_data['determinative'])
                             obj.determinative = det
                             
                     obj.save()
@@ -558,180 +584,336 @@ def api_revert_change(request, pk):
 # Network API
 # =============================================================================
 
-from django.db.models import Count
-from collections import defaultdict
-import networkx as nx
-try:
-    import community as community_louvain
-    HAS_LOUVAIN = True
-except ImportError:
-    HAS_LOUVAIN = False
+# Request parameters that select the nodes and edges of a network
+NETWORK_FILTERS = (
+    'name_type', 'series', 'min_connections', 'max_connections', 'min_attestations',
+    'ego_name', 'ego_degree', 'ego_max_nodes', 'ego_hop_limit', 'edge_weight', 'backbone', 'top_k', 'period',
+)
+# Edge weightings of the network API
+EDGE_WEIGHTS = ('count', 'jaccard', 'pmi')
 
-@require_http_methods(["GET"])
-def api_network_data(request):
+
+class LargeNetwork(Exception):
+    """A network too large to compute within a web request"""
+
+    def __init__(self, version):
+        super().__init__(version)
+        self.version = version
+
+
+def network_limit(params, param, configured):
+    """A size limit from the request, never above the configured one (0 means none)"""
+    try:
+        requested = int(params.get(param, 0))
+    except ValueError:
+        requested = 0
+    limits = [limit for limit in (requested, configured) if limit > 0]
+    return min(limits) if limits else None
+
+
+def int_param(params, param, default):
+    """An integer request parameter; raises ValueError naming it if invalid"""
+    try:
+        return int(params.get(param, default))
+    except ValueError:
+        raise ValueError(f'{param} must be an integer')
+
+
+def id_params(params, param):
+    """A repeated id parameter as integers; raises ValueError naming it if invalid"""
+    try:
+        return [int(value) for value in params.getlist(param)]
+    except ValueError:
+        raise ValueError(f'{param} must be integer ids')
+
+
+def network_filter_key(params):
+    """The filters of a network request, as a cache key"""
+    return tuple(
+        (param, tuple(sorted(params.getlist(param))))
+        for param in NETWORK_FILTERS if param in params
+    )
+
+
+NetworkSelection = namedtuple(
+    'NetworkSelection', 'graph selected connections pa pb weights scores edge_count truncated ego'
+)
+
+
+def pruning_options(params):
+    """(edge weight, backbone significance, top k) of a network request; raises ValueError if invalid"""
+    edge_weight = params.get('edge_weight', 'count')
+    if edge_weight not in EDGE_WEIGHTS:
+        raise ValueError(f'Unknown edge weight: {edge_weight}')
+    try:
+        backbone = float(params.get('backbone', 0))
+    except ValueError:
+        raise ValueError('backbone must be a number')
+    return edge_weight, backbone, int_param(params, 'top_k', 0)
+
+
+def select_network(params):
     """
-    Get network data for co-occurrence visualization.
-    Returns nodes (names) and edges (co-occurrences on same fragments).
-    Supports ego network mode for exploring connections of specific names.
-    Supports community detection using Louvain algorithm.
+    The names and edges a network request's filters select, on this
+    worker's graph for its series filter: the names as a mask over the
+    graph's names, their connection counts, the edges as endpoint
+    positions with their weights (and scores, when rescored), the edge
+    count before pruning, whether an ego limit applied and the ego names.
+    Raises ValueError for invalid parameters.
     """
-    # Get filter parameters
-    name_types = request.GET.getlist('name_type')  # List of name type IDs
-    series_ids = request.GET.getlist('series')  # List of series IDs
-    min_connections = int(request.GET.get('min_connections', 1))
-    max_connections = int(request.GET.get('max_connections', 1000))
-    min_attestations = int(request.GET.get('min_attestations', 1))
+    edge_weight, backbone, top_k = pruning_options(params)
     
-    # Community detection parameter
-    detect_communities = request.GET.get('communities', 'false').lower() == 'true'
+    # Get filter parameters
+    name_types = id_params(params, 'name_type')  # List of name type IDs
+    series_ids = id_params(params, 'series')  # List of series IDs
+    min_connections = int_param(params, 'min_connections', 1)
+    max_connections = int_param(params, 'max_connections', 1000)
+    min_attestations = int_param(params, 'min_attestations', 1)
     
     # Ego network parameters - now supports multiple names
-    ego_name_ids = request.GET.getlist('ego_name')  # List of selected name IDs
-    ego_degree = int(request.GET.get('ego_degree', 1))  # Degree of separation
-    
-    # Build base fragment filter (by series)
-    fragment_filter = {}
-    if series_ids:
-        fragment_filter['fragment__series_id__in'] = series_ids
-    
-    # Build queryset for names
-    names_qs = Name.objects.all()
-    
-    if name_types:
-        names_qs = names_qs.filter(name_type_id__in=name_types)
-    
-    # Filter by minimum attestations
-    names_qs = names_qs.annotate(
-        attestation_count=Count('instances')
-    ).filter(attestation_count__gte=min_attestations)
-    
-    # Get all valid name IDs
-    valid_name_ids = set(names_qs.values_list('id', flat=True))
-    
-    # Build co-occurrence map: for each fragment, which names appear
-    fragment_names = defaultdict(set)
-    
-    instance_qs = Instance.objects.filter(name_id__in=valid_name_ids)
-    if fragment_filter:
-        instance_qs = instance_qs.filter(**fragment_filter)
-    
-    instances = instance_qs.values('fragment_id', 'name_id')
-    
-    for inst in instances:
-        if inst['fragment_id']:
-            fragment_names[inst['fragment_id']].add(inst['name_id'])
-    
-    # Count co-occurrences between names
-    cooccurrence = defaultdict(int)
-    for fragment_id, name_ids in fragment_names.items():
-        name_list = list(name_ids)
-        for i in range(len(name_list)):
-            for j in range(i + 1, len(name_list)):
-                # Create sorted tuple for consistent key
-                pair = tuple(sorted([name_list[i], name_list[j]]))
-                cooccurrence[pair] += 1
-    
-    # Build adjacency list for ego network expansion
-    adjacency = defaultdict(set)
-    for (name1, name2) in cooccurrence.keys():
-        adjacency[name1].add(name2)
-        adjacency[name2].add(name1)
-    
-    # Count connections per name
-    connection_count = defaultdict(int)
-    for (name1, name2), count in cooccurrence.items():
-        connection_count[name1] += 1
-        connection_count[name2] += 1
+    ego_name_ids = id_params(params, 'ego_name')  # List of selected name IDs
+    ego_degree = int_param(params, 'ego_degree', 1)  # Degree of separation
+    
+    # This worker's graph for the series filter; filters are boolean masks over its names
+    graph = network.store.graph(series_ids)
+    ids, attestations = graph.ids, graph.attestations
+    truncated = False
     
     # Determine which names to include
     if ego_name_ids:
         # Ego network mode: expand from selected names by degree
-        ego_name_ids_set = set(int(id) for id in ego_name_ids)
-        
-        # For ego mode, we need to build adjacency from ALL names (not just filtered)
-        # First get all instances for the ego names to find co-occurring names
-        all_fragment_names = defaultdict(set)
-        all_instance_qs = Instance.objects.all()
-        if series_ids:
-            all_instance_qs = all_instance_qs.filter(fragment__series_id__in=series_ids)
-        
-        for inst in all_instance_qs.values('fragment_id', 'name_id'):
-            if inst['fragment_id'] and inst['name_id']:
-                all_fragment_names[inst['fragment_id']].add(inst['name_id'])
-        
-        # Build full adjacency
-        full_adjacency = defaultdict(set)
-        for fragment_id, name_ids in all_fragment_names.items():
-            name_list = list(name_ids)
-            for i in range(len(name_list)):
-                for j in range(i + 1, len(name_list)):
-                    full_adjacency[name_list[i]].add(name_list[j])
-                    full_adjacency[name_list[j]].add(name_list[i])
-        
-        # Expand from all ego names by degree
-        ego_names = set(ego_name_ids_set)
-        current_frontier = set(ego_name_ids_set)
-        
-        for d in range(ego_degree):
-            next_frontier = set()
-            for name_id in current_frontier:
-                next_frontier.update(full_adjacency.get(name_id, set()))
-            ego_names.update(next_frontier)
-            current_frontier = next_frontier - ego_names
-        
-        filtered_name_ids = ego_names
-        
-        # Recalculate connection counts for ego network
-        connection_count = defaultdict(int)
-        for name_id in filtered_name_ids:
-            connection_count[name_id] = len(full_adjacency.get(name_id, set()) & filtered_name_ids)
-        
-        # Rebuild cooccurrence for edges within ego network
-        cooccurrence = defaultdict(int)
-        for fragment_id, name_ids in all_fragment_names.items():
-            relevant = name_ids & filtered_name_ids
-            relevant_list = list(relevant)
-            for i in range(len(relevant_list)):
-                for j in range(i + 1, len(relevant_list)):
-                    pair = tuple(sorted([relevant_list[i], relevant_list[j]]))
-                    cooccurrence[pair] += 1
+        ego_name_ids_set = set(ego_name_ids)
+        
+        # Breadth-first over the adjacency of ALL names (not just filtered)
+        selected, truncated = graph.ego_mask(
+            ego_name_ids_set, ego_degree,
+            max_nodes=network_limit(params, 'ego_max_nodes', settings.NETWORK_EGO_MAX_NODES),
+            hop_limit=network_limit(params, 'ego_hop_limit', settings.NETWORK_EGO_HOP_LIMIT),
+        )
+        
+        # Edges and connection counts within the ego network
+        keep = network.edge_mask(selected, graph.pa, graph.pb)
+        pa, pb, weights = graph.pa[keep], graph.pb[keep], graph.weights[keep]
+        connections = network.degrees(len(ids), pa, pb)
     else:
+        # Co-occurrence edges between names passing the type and attestation filters
+        valid = network.node_mask(attestations, graph.type_ids, name_types, min_attestations)
+        keep = network.edge_mask(valid, graph.pa, graph.pb)
+        pa, pb, weights = graph.pa[keep], graph.pb[keep], graph.weights[keep]
+        connections = network.degrees(len(ids), pa, pb)
+        
         # Standard mode: filter by connection count
-        filtered_name_ids = {
-            name_id for name_id, count in connection_count.items()
-            if min_connections <= count <= max_connections
-        }
+        selected = (connections > 0) & (connections >= min_connections) & (connections <= max_connections)
         
         # If no connections filter applied (min=0), include isolated nodes
         if min_connections == 0:
-            filtered_name_ids.update(valid_name_ids)
+            selected |= valid
+        
+        # Edges only between filtered names
+        keep = network.edge_mask(selected, pa, pb)
+        pa, pb, weights = pa[keep], pb[keep], weights[keep]
         
         # No ego names in global mode
         ego_name_ids_set = set()
     
-    # Community detection using Louvain algorithm
-    communities = {}
+    # Edge significance, then the disparity backbone and the best edges of each name
+    scores = None
+    edge_count = len(pa)
+    if edge_weight != 'count':
+        occurrences, fragment_count = network.store.occurrences(graph)
+        if edge_weight == 'jaccard':
+            scores = network.jaccard(pa, pb, weights, occurrences)
+        else:
+            scores = network.pmi(pa, pb, weights, occurrences, fragment_count)
+    if backbone > 0:
+        keep = network.disparity(len(ids), pa, pb, weights) < backbone
+        pa, pb, weights = pa[keep], pb[keep], weights[keep]
+        scores = None if scores is None else scores[keep]
+    if top_k > 0:
+        keep = network.top_edges(len(ids), pa, pb, weights if scores is None else scores, top_k)
+        pa, pb, weights = pa[keep], pb[keep], weights[keep]
+        scores = None if scores is None else scores[keep]
+    
+    return NetworkSelection(
+        graph, selected, connections, pa, pb, weights, scores, edge_count, truncated, ego_name_ids_set
+    )
+
+
+def network_size(params, graph):
+    """
+    Upper bound of the edges a network request selects, without selecting
+    it: the edges of the graph between names that can pass its filters
+    (those of the ego network in ego mode). The connection filter is
+    checked against the names' degrees in the whole graph, which only
+    exceed those within the network, and pruning only removes edges. For
+    date slices this bounds the edges of the whole graph between those
+    names, not their sum over the slices.
+    """
+    if params.getlist('ego_name'):
+        candidates, _ = graph.ego_mask(
+            set(id_params(params, 'ego_name')), int_param(params, 'ego_degree', 1),
+            max_nodes=network_limit(params, 'ego_max_nodes', settings.NETWORK_EGO_MAX_NODES),
+            hop_limit=network_limit(params, 'ego_hop_limit', settings.NETWORK_EGO_HOP_LIMIT),
+        )
+    else:
+        candidates = network.node_mask(
+            graph.attestations, graph.type_ids, id_params(params, 'name_type'), int_param(params, 'min_attestations', 1)
+        )
+        # Connections within the network never exceed those in the whole graph
+        degree = np.diff(graph.csr()[0])
+        candidates &= degree >= max(int_param(params, 'min_connections', 1), 1)
+    return int(np.count_nonzero(network.edge_mask(candidates, graph.pa, graph.pb)))
+
+
+def network_response(params, job_threshold=None):
+    """
+    Network data for co-occurrence visualization, as a response.
+    Returns nodes (names) and edges (co-occurrences on same fragments).
+    Supports ego network mode for exploring connections of specific names.
+    Supports community detection using Louvain algorithm: `community_level`
+    picks a level of the Louvain hierarchy (0 = finest, default the best
+    partition) and `supergraph=true` adds the graph of the communities.
+    `layout=true` adds precomputed x/y coordinates (fractions of the unit square).
+    Dense networks can be pruned: `edge_weight` (count, jaccard or pmi) scores
+    the edges, `backbone` keeps the disparity-filter backbone at that
+    significance level and `top_k` keeps the k best scored edges of each name.
+    `format=columnar` or `format=binary` returns compact encodings (see payload.py).
+    `period` (repeated) slices the network by fragment date instead (see
+    network_periods_response).
+    Raises LargeNetwork, before selecting anything, when the network may
+    have more than `job_threshold` edges (see network_size).
+    """
+    response_format = params.get('format', 'json')
+    if response_format not in payload.FORMATS:
+        return JsonResponse({'error': f'Unknown format: {response_format}'}, status=400)
+    
+    # Community detection parameters
+    detect_communities = params.get('communities', 'false').lower() == 'true'
+    try:
+        resolution = float(params.get('resolution', 1.0))
+    except ValueError:
+        resolution = 1.0
+    if not resolution > 0:
+        resolution = 1.0
+    try:
+        community_level = int(params['community_level']) if 'community_level' in params else None
+    except ValueError:
+        community_level = None
+    with_supergraph = params.get('supergraph', 'false').lower() == 'true'
+    
+    # Server-side layout parameter
+    with_layout = params.get('layout', 'false').lower() == 'true'
+    
+    # Date slices: one network per period, with the changes between them
+    periods = [[date for date in value.split(',') if date] for value in params.getlist('period')]
+    try:
+        if job_threshold:
+            graph = network.store.graph(id_params(params, 'series'))
+            if network_size(params, graph) > job_threshold:
+                raise LargeNetwork(graph.version)
+        if periods:
+            if response_format != 'json':
+                return JsonResponse({'error': 'Date slices are only available as JSON'}, status=400)
+            return network_periods_response(params, periods)
+        graph, selected, connections, pa, pb, weights, scores, edge_count, truncated, ego_name_ids_set = \
+            select_network(params)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    ids, attestations = graph.ids, graph.attestations
+    
+    filtered_name_ids = ids[selected].tolist()
+    edge_rows = None
+    if response_format == 'json' or detect_communities:
+        edge_rows = list(zip(ids[pa].tolist(), ids[pb].tolist(), weights.tolist()))
+    
+    # Community detection using Louvain algorithm: the dendrogram is cached per filter set,
+    # resolution and data version, and every level is read from it
+    community_of_name = {}
     num_communities = 0
-    if detect_communities and HAS_LOUVAIN and len(filtered_name_ids) > 1:
-        # Build networkx graph
-        G = nx.Graph()
-        G.add_nodes_from(filtered_name_ids)
-        for (name1, name2), weight in cooccurrence.items():
-            if name1 in filtered_name_ids and name2 in filtered_name_ids:
-                G.add_edge(name1, name2, weight=weight)
-        
-        # Run Louvain community detection
-        if G.number_of_edges() > 0:
-            partition = community_louvain.best_partition(G, weight='weight', resolution=1.0)
-            communities = partition
-            num_communities = len(set(partition.values()))
+    community_levels = 0
+    communities_pending = False
+    community_graph = None
+    if detect_communities and HAS_LOUVAIN and len(filtered_name_ids) > 1 and len(pa):
+        dendrogram = communities.cache.result(
+            (network_filter_key(params), resolution), graph.version, filtered_name_ids, edge_rows, resolution
+        )
+        if dendrogram is None:
+            communities_pending = True
+        else:
+            community_levels = len(dendrogram)
+            community_of_name = communities.partition(dendrogram, community_level)
+            num_communities = len(set(community_of_name.values()))
+    if with_supergraph and community_of_name:
+        community_of = np.full(len(ids), -1, dtype=np.int64)
+        community_of[network.positions(ids, list(community_of_name))] = list(community_of_name.values())
+        members, internal, (ca, cb, summed) = communities.supergraph(community_of, pa, pb, weights)
+        community_graph = {
+            'nodes': [
+                {'id': community, 'members': size, 'internal_weight': weight}
+                for community, (size, weight) in enumerate(zip(members.tolist(), internal.tolist()))
+            ],
+            'edges': [
+                {'source': source, 'target': target, 'weight': weight}
+                for source, target, weight in zip(ca.tolist(), cb.tolist(), summed.tolist())
+            ],
+        }
+    
+    # Layout coordinates by graph position, cached per filter set and data version
+    coordinates = None
+    layout_pending = False
+    if with_layout and filtered_name_ids:
+        index = np.cumsum(selected) - 1
+        layout = layouts.cache.result(
+            network_filter_key(params), graph.version, ids[selected], index[pa], index[pb], weights
+        )
+        if layout is None:
+            layout_pending = True
+        else:
+            coordinates = np.full((len(ids), 2), np.nan)
+            coordinates[network.positions(ids, layout[0])] = layout[1]
+    
+    if response_format != 'json':
+        labels = {
+            name_id: (label, name_type)
+            for name_id, label, name_type in Name.objects.filter(
+                id_filter(filtered_name_ids)
+            ).order_by().values_list('id', 'name', 'name_type__name')
+        }
+        columns = payload.network_columns(
+            ids, selected, attestations, connections, pa, pb, weights, labels,
+            community_of_name if detect_communities else None, coordinates, scores,
+        )
+        fields = {
+            'ego': sorted(name_id for name_id in ego_name_ids_set if name_id in labels),
+            'stats': {
+                'total_nodes': len(columns['names']),
+                'total_edges': len(columns['edges']['source']),
+                'num_communities': num_communities,
+                'community_levels': community_levels,
+                'truncated': truncated,
+                'communities_pending': communities_pending,
+                'layout_pending': layout_pending,
+                'pruned_edges': edge_count - len(pa),
+            },
+        }
+        if community_graph is not None:
+            fields['supergraph'] = community_graph
+        if response_format == 'columnar':
+            return JsonResponse(payload.columnar(columns, **fields))
+        return StreamingHttpResponse(
+            payload.binary_chunks(columns, **fields), content_type='application/octet-stream'
+        )
+    
+    # Attestation and connection counts by name id
+    positions = np.flatnonzero(selected)
+    attestation_count = dict(zip(filtered_name_ids, attestations[positions].tolist()))
+    connection_count = dict(zip(filtered_name_ids, connections[positions].tolist()))
+    position_of = dict(zip(filtered_name_ids, positions.tolist()))
     
     # Get name details for filtered names
     names_data = Name.objects.filter(
-        id__in=filtered_name_ids
-    ).select_related('name_type').annotate(
-        attestation_count=Count('instances')
-    )
+        id_filter(filtered_name_ids)
+    ).select_related('name_type')
     
     # Build nodes
     nodes = []
@@ -740,53 +922,397 @@ def api_network_data(request):
             'id': name.id,
             'name': name.name,
             'name_type': name.name_type.name if name.name_type else 'Unknown',
-            'attestations': name.attestation_count,
+            'attestations': attestation_count.get(name.id, 0),
             'connections': connection_count.get(name.id, 0),
         }
         # Mark the ego nodes (can be multiple now)
         if name.id in ego_name_ids_set:
             node['is_ego'] = True
         # Add community ID if available
-        if name.id in communities:
-            node['community'] = communities[name.id]
+        if name.id in community_of_name:
+            node['community'] = community_of_name[name.id]
+        if coordinates is not None:
+            x, y = coordinates[position_of[name.id]]
+            node['x'], node['y'] = round(float(x), payload.FLOAT_DIGITS), round(float(y), payload.FLOAT_DIGITS)
         nodes.append(node)
     
     # Build edges (only between filtered names)
-    edges = []
-    for (name1, name2), weight in cooccurrence.items():
-        if name1 in filtered_name_ids and name2 in filtered_name_ids:
-            edges.append({
-                'source': name1,
-                'target': name2,
-                'weight': weight,
-            })
+    edges = [
+        {'source': name1, 'target': name2, 'weight': weight}
+        for name1, name2, weight in edge_rows
+    ]
+    if scores is not None:
+        for edge, score in zip(edges, scores.round(payload.FLOAT_DIGITS).tolist()):
+            edge['score'] = score
     
-    return JsonResponse({
+    data = {
         'nodes': nodes,
         'edges': edges,
         'stats': {
             'total_nodes': len(nodes),
             'total_edges': len(edges),
             'num_communities': num_communities,
+            'community_levels': community_levels,
+            'truncated': truncated,
+            'communities_pending': communities_pending,
+            'layout_pending': layout_pending,
+            'pruned_edges': edge_count - len(pa),
         }
+    }
+    if community_graph is not None:
+        data['supergraph'] = community_graph
+    return JsonResponse(data)
+
+
+def key_rows(keys, weights=None):
+    """[source, target] (or [source, target, weight]) rows of some edge pair keys"""
+    columns = [(keys >> network.KEY_SHIFT).tolist(), (keys & network.KEY_MASK).tolist()]
+    if weights is not None:
+        columns.append(weights.tolist())
+    return [list(row) for row in zip(*columns)]
+
+
+def network_periods_response(params, periods):
+    """
+    Network data per date slice, as a response. Each `period` parameter is
+    one slice, given as comma-separated fragment dates (e.g. `mh,jh`), in
+    the order the slices are shown; a fragment counts in the first slice
+    listing its date. All slices come from one pass over the attestations.
+    The node and edge filters of network_response apply within each slice,
+    with attestations, connections and edge scores counted on its
+    fragments; an ego network is expanded on the whole graph, then sliced.
+    Names are listed once; each slice lists its nodes and edges and its
+    diff from the slice before (the first one from an empty network), so a
+    client can step through the slices without fetching them again.
+    """
+    edge_weight, backbone, top_k = pruning_options(params)
+    name_types = id_params(params, 'name_type')
+    min_connections = int_param(params, 'min_connections', 1)
+    max_connections = int_param(params, 'max_connections', 1000)
+    min_attestations = max(int_param(params, 'min_attestations', 1), 1)
+    ego_name_ids_set = set(id_params(params, 'ego_name'))
+    ego_degree = int_param(params, 'ego_degree', 1)
+    
+    graph = network.store.graph(id_params(params, 'series'))
+    ids = graph.ids
+    truncated = False
+    ego = None
+    if ego_name_ids_set:
+        ego, truncated = graph.ego_mask(
+            ego_name_ids_set, ego_degree,
+            max_nodes=network_limit(params, 'ego_max_nodes', settings.NETWORK_EGO_MAX_NODES),
+            hop_limit=network_limit(params, 'ego_hop_limit', settings.NETWORK_EGO_HOP_LIMIT),
+        )
+    
+    attestations, occurrences, fragment_counts, (edge_period, all_pa, all_pb, all_weights) = \
+        network.store.periods(graph, periods)
+    bounds = np.searchsorted(edge_period, np.arange(len(periods) + 1))
+    slices = []
+    for period in range(len(periods)):
+        edges = slice(bounds[period], bounds[period + 1])
+        pa, pb, weights = all_pa[edges], all_pb[edges], all_weights[edges]
+        
+        # The filters of network_response, on this period's counts
+        if ego is not None:
+            valid = ego & (attestations[period] > 0)
+        else:
+            valid = network.node_mask(attestations[period], graph.type_ids, name_types, min_attestations)
+        keep = network.edge_mask(valid, pa, pb)
+        pa, pb, weights = pa[keep], pb[keep], weights[keep]
+        connections = network.degrees(len(ids), pa, pb)
+        if ego is not None:
+            selected = valid
+        else:
+            selected = (connections > 0) & (connections >= min_connections) & (connections <= max_connections)
+            if min_connections == 0:
+                selected |= valid
+            keep = network.edge_mask(selected, pa, pb)
+            pa, pb, weights = pa[keep], pb[keep], weights[keep]
+        
+        scores = None
+        edge_count = len(pa)
+        if edge_weight == 'jaccard':
+            scores = network.jaccard(pa, pb, weights, occurrences[period])
+        elif edge_weight == 'pmi':
+            scores = network.pmi(pa, pb, weights, occurrences[period], fragment_counts[period])
+        if backbone > 0:
+            keep = network.disparity(len(ids), pa, pb, weights) < backbone
+            pa, pb, weights = pa[keep], pb[keep], weights[keep]
+            scores = None if scores is None else scores[keep]
+        if top_k > 0:
+            keep = network.top_edges(len(ids), pa, pb, weights if scores is None else scores, top_k)
+            pa, pb, weights = pa[keep], pb[keep], weights[keep]
+            scores = None if scores is None else scores[keep]
+        slices.append((selected, connections, pa, pb, weights, scores, edge_count))
+    
+    in_any = np.zeros(len(ids), dtype=bool)
+    for selected, *_ in slices:
+        in_any |= selected
+    labels = {
+        name_id: (label, name_type)
+        for name_id, label, name_type in Name.objects.filter(
+            id_filter(ids[in_any].tolist())
+        ).order_by('id').values_list('id', 'name', 'name_type__name')
+    }
+    
+    period_data = []
+    before = (np.zeros(0, dtype=np.int64),) * 3
+    for period, (selected, connections, pa, pb, weights, scores, edge_count) in enumerate(slices):
+        positions = np.flatnonzero(selected)
+        node_ids = ids[positions]
+        keys = (ids[pa] << network.KEY_SHIFT) | ids[pb]
+        added_nodes, removed_nodes, added, removed, reweighted = network.graph_diff(
+            before, (node_ids, keys, weights)
+        )
+        edges = [
+            {'source': source, 'target': target, 'weight': weight}
+            for source, target, weight in zip(ids[pa].tolist(), ids[pb].tolist(), weights.tolist())
+        ]
+        if scores is not None:
+            for edge, score in zip(edges, scores.round(payload.FLOAT_DIGITS).tolist()):
+                edge['score'] = score
+        period_data.append({
+            'dates': periods[period],
+            'nodes': [
+                {'id': name_id, 'attestations': count, 'connections': degree}
+                for name_id, count, degree in zip(
+                    node_ids.tolist(), attestations[period][positions].tolist(), connections[positions].tolist()
+                )
+            ],
+            'edges': edges,
+            'diff': {
+                'added_nodes': added_nodes.tolist(),
+                'removed_nodes': removed_nodes.tolist(),
+                'added_edges': key_rows(keys[added], weights[added]),
+                'removed_edges': key_rows(before[1][removed]),
+                'reweighted_edges': key_rows(keys[reweighted], weights[reweighted]),
+            },
+            'stats': {
+                'total_nodes': len(node_ids),
+                'total_edges': len(edges),
+                'pruned_edges': edge_count - len(pa),
+            },
+        })
+        before = (node_ids, keys, weights)
+    
+    return JsonResponse({
+        'names': [
+            dict({'id': name_id, 'name': label, 'name_type': name_type or 'Unknown'},
+                 **({'is_ego': True} if name_id in ego_name_ids_set else {}))
+            for name_id, (label, name_type) in labels.items()
+        ],
+        'periods': period_data,
+        'stats': {
+            'periods': len(periods),
+            'total_nodes': len(labels),
+            'truncated': truncated,
+        },
     })
 
 
 @require_http_methods(["GET"])
+def api_network_data(request):
+    """
+    Network data for co-occurrence visualization (see network_response).
+    Networks that may have more than NETWORK_JOB_MIN_EDGES edges are handed
+    to the background job runner before they are selected here: the
+    response is then 202 with the job to poll.
+    """
+    try:
+        return network_response(request.GET, job_threshold=settings.NETWORK_JOB_MIN_EDGES)
+    except LargeNetwork as large:
+        return JsonResponse(jobs.describe(jobs.submit(request.GET, large.version)), status=202)
+
+
+@require_http_methods(["GET"])
+def api_network_metrics(request):
+    """
+    Centrality of the names of a network selected with the filters of
+    api_network_data: degree, weighted degree, PageRank, eigenvector and
+    (sampled) betweenness centrality per name (see metrics.py), cached per
+    filter set and data version. `order_by` (a metric, default pagerank)
+    ranks the names, highest first, and `limit` keeps the first few.
+    """
+    params = request.GET
+    order_by = params.get('order_by', 'pagerank')
+    if order_by not in metrics.METRICS:
+        return JsonResponse({'error': f'Unknown metric: {order_by}'}, status=400)
+    try:
+        limit = int_param(params, 'limit', 0)
+        graph, selected, _, pa, pb, weights, _, _, truncated, _ = select_network(params)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    node_ids = graph.ids[selected]
+    stats = {
+        'total_nodes': len(node_ids),
+        'total_edges': len(pa),
+        'truncated': truncated,
+        'betweenness_samples': min(len(node_ids), metrics.BETWEENNESS_SAMPLES),
+        'metrics_pending': False,
+    }
+    result = None
+    if len(node_ids):
+        index = np.cumsum(selected) - 1
+        result = metrics.cache.result(
+            network_filter_key(params), graph.version, node_ids, index[pa], index[pb], weights
+        )
+        stats['metrics_pending'] = result is None
+    if result is None:
+        return JsonResponse({'names': [], 'stats': stats})
+    
+    node_ids, scores = result
+    order = np.lexsort((node_ids, -scores[order_by]))
+    if limit > 0:
+        order = order[:limit]
+    labels = {
+        name_id: (label, name_type)
+        for name_id, label, name_type in Name.objects.filter(
+            id_filter(node_ids[order].tolist())
+        ).order_by().values_list('id', 'name', 'name_type__name')
+    }
+    names = []
+    for position in order.tolist():
+        name_id = int(node_ids[position])
+        if name_id not in labels:
+            continue
+        label, name_type = labels[name_id]
+        row = {'id': name_id, 'name': label, 'name_type': name_type or 'Unknown'}
+        for metric in metrics.METRICS:
+            value = scores[metric][position]
+            row[metric] = int(value) if scores[metric].dtype.kind == 'i' else float(f'{value:.6g}')
+        names.append(row)
+    return JsonResponse({'names': names, 'stats': stats})
+
+
+@require_http_methods(["GET"])
+def api_network_job(request, pk):
+    """Status of a network job"""
+    job = NetworkJob.objects.filter(pk=pk).first()
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    return JsonResponse(jobs.describe(job))
+
+
+@require_http_methods(["GET"])
+def api_network_job_result(request, pk):
+    """Stored result of a finished network job"""
+    job = NetworkJob.objects.filter(pk=pk).first()
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    if job.status != 'done':
+        return JsonResponse(jobs.describe(job), status=409)
+    try:
+        return FileResponse(open(jobs.result_path(job), 'rb'), content_type=job.content_type)
+    except FileNotFoundError:
+        return JsonResponse({'error': 'Job result expired'}, status=410)
+
+
+@require_http_methods(["GET"])
+def api_network_stats(request):
+    """Size, memory footprint and build/refresh timings of this worker's graph store"""
+    return JsonResponse(network.store.stats())
+
+
+def name_search_etag(request):
+    """Typeahead responses only change with names, attestations or name types"""
+    return f'"typeahead-{current_version("name", "instance", "lookup")}"'
+
+
+@require_http_methods(["GET"])
+@condition(etag_func=name_search_etag)
 def api_name_search(request):
-    """Search names for autocomplete in network page"""
+    """Ranked typeahead for names: exact, then prefix, then substring matches"""
     q = request.GET.get('q', '').strip()
     if len(q) < 2:
         return JsonResponse({'results': []})
+    try:
+        limit = int(request.GET.get('limit', 20))
+    except ValueError:
+        limit = 20
     
-    names = Name.objects.filter(
-        Q(name__icontains=q) | Q(query__icontains=q)
-    ).select_related('name_type')[:20]
-    
+    tables = lookups()
     results = [{
-        'id': n.id,
-        'name': n.name,
-        'name_type': n.name_type.name if n.name_type else 'Unknown',
-    } for n in names]
+        'id': name_id,
+        'name': name,
+        'name_type': lookup_label(tables, NameType, name_type_id) or 'Unknown',
+        'attestations': count,
+        'match': match,
+    } for name_id, name, name_type_id, count, match in name_typeahead(q, limit)]
     
-    return JsonResponse({'results': results})
+    response = JsonResponse({'results': results})
+    patch_cache_control(response, public=True, max_age=settings.TYPEAHEAD_CACHE_MAX_AGE)
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def api_name_match(request):
+    """
+    Reconcile a batch of raw name strings against the database. Takes a JSON
+    object {"names": [...], "fuzzy": true, "candidates": 5} or plain text
+    with one name per line; streams one JSON result per line (NDJSON) in
+    input order, each with its match type: exact, variant, fuzzy or none.
+    Read-only, so it is open to scripts without a CSRF token.
+    """
+    fuzzy = True
+    candidates = 5
+    try:
+        # Read from the stream: large batches exceed DATA_UPLOAD_MAX_MEMORY_SIZE
+        if request.content_type == 'text/plain':
+            raw_names = request.read().decode('utf-8').splitlines()
+        else:
+            data = json.load(request)
+            raw_names = data.get('names')
+            fuzzy = data.get('fuzzy', True)
+            candidates = max(1, min(int(data.get('candidates', 5)), 20))
+    except (ValueError, TypeError, AttributeError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Expected a JSON object with a "names" list'}, status=400)
+    if isinstance(fuzzy, str):
+        fuzzy = BOOLEAN_STRINGS.get(fuzzy.strip().lower(), fuzzy)
+    if not isinstance(fuzzy, bool):
+        return JsonResponse({'error': '"fuzzy" must be true or false'}, status=400)
+    
+    if not isinstance(raw_names, list):
+        return JsonResponse({'error': 'Expected a JSON object with a "names" list'}, status=400)
+    if len(raw_names) > settings.NAME_MATCH_MAX_BATCH:
+        return JsonResponse(
+            {'error': f'At most {settings.NAME_MATCH_MAX_BATCH} names per request'}, status=400
+        )
+    
+    lines = (
+        json.dumps(result, ensure_ascii=False) + '\n'
+        for result in match_names(raw_names, fuzzy=fuzzy, candidates=candidates)
+    )
+    return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+
+@require_http_methods(["GET"])
+def api_search_facets(request):
+    """
+    Facet counts for a name search, taking the same parameters as the
+    search page (q, regex, name_type, writing_type, completeness, milieu,
+    date). Each facet lists the hits every value would leave with the other
+    filters applied.
+    """
+    query = request.GET.get('q', '').strip()
+    use_regex = request.GET.get('regex', '') == '1'
+    filters = {facet: request.GET.get(facet, '') for facet in FACETS}
+    try:
+        counts = facet_counts(filters, Name.objects.filter(search_filter(query, use_regex)) if query else None)
+    except RegexTooExpensive:
+        return JsonResponse(
+            {'error': 'This regex pattern is too expensive to run. Please make it more specific.'}, status=400
+        )
+    
+    tables = lookups()
+    models = {'name_type': NameType, 'writing_type': WritingType, 'completeness': CompletenessType, 'milieu': Milieu}
+    facets = {
+        facet: [
+            {'id': obj.pk, 'name': obj.name, 'count': counts[facet].get(obj.pk, 0)}
+            for obj in tables.all(models[facet])
+        ]
+        for facet in FK_FACETS
+    }
+    facets['date'] = [{'name': date, 'count': counts['date'].get(date, 0)} for date in date_choices()]
+    return JsonResponse({'total': counts['total'], 'facets': facets})
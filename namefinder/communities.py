@@ -0,0 +1,129 @@
+"""
+Louvain community detection for the network view.
+
+Louvain merges names into communities, then those communities into larger
+ones, level by level. Each run keeps the whole hierarchy (the dendrogram):
+level 0 is the finest partition, the last level the best one (what
+best_partition returns). Any level, and the supergraph of a level's
+communities, is read from the stored dendrogram without running Louvain
+again.
+
+Dendrograms are cached per worker by (filter set, resolution) together
+with the data version they were computed at (see pool.py), so reloading
+the same network from the same worker reuses them. Every run uses the same
+random seed, so a cold start on the same graph always gives the same
+dendrogram. After a data change the best partition of the previous
+dendrogram of the same filters seeds the new run (names it did not cover
+start alone) as long as most of the graph's names are still there, which
+converges in far fewer passes than a cold start.
+
+Louvain numbers communities in the order it happens to visit them, which
+depends on the starting partition. Every level is therefore renumbered
+canonically, by the smallest name id in each community. Two runs that find
+the same communities, cold or warm-started and on any worker, return the
+same numbers.
+"""
+import numpy as np
+from .pool import ResultCache
+try:
+    import networkx as nx
+    import community as community_louvain
+    HAS_LOUVAIN = True
+except ImportError:
+    HAS_LOUVAIN = False
+
+
+# Seed of every Louvain run
+SEED = 42
+# Share of a graph's names the previous partition must cover to seed the next run
+WARM_START_OVERLAP = 0.9
+
+
+def louvain(nodes, edges, resolution, initial=None):
+    """
+    Louvain dendrogram (a list of {node or community: community} levels) of
+    a graph given as node ids and (a, b, weight) edges. `initial` maps
+    (some) nodes to the communities to start from. Runs in the pool
+    processes.
+    """
+    graph = nx.Graph()
+    graph.add_nodes_from(nodes)
+    graph.add_weighted_edges_from(edges)
+    if not graph.number_of_edges():
+        return []
+    partition = None
+    if initial:
+        next_community = max(initial.values(), default=-1) + 1
+        partition = {}
+        for node in nodes:
+            if node in initial:
+                partition[node] = initial[node]
+            else:
+                partition[node] = next_community
+                next_community += 1
+    return canonical(community_louvain.generate_dendrogram(
+        graph, part_init=partition, weight='weight', resolution=resolution, random_state=SEED
+    ))
+
+
+def canonical(dendrogram):
+    """
+    A dendrogram with the communities of every level numbered 0, 1, ... in
+    the order of their smallest name id
+    """
+    levels = []
+    renamed = {}
+    for level in dendrogram:
+        if levels:
+            # Members are the previous level's communities, already renumbered
+            level = {renamed[member]: community for member, community in level.items()}
+        smallest = {}
+        for member, community in level.items():
+            if community not in smallest or member < smallest[community]:
+                smallest[community] = member
+        renamed = {community: number for number, community in enumerate(sorted(smallest, key=smallest.get))}
+        levels.append({member: renamed[community] for member, community in level.items()})
+    return levels
+
+
+def partition(dendrogram, level=None):
+    """
+    Community of each node ({node: community}) at a level of a dendrogram:
+    the last (best) level by default, levels beyond either end clamped
+    """
+    if not dendrogram:
+        return {}
+    last = len(dendrogram) - 1
+    level = last if level is None else min(max(level, 0), last)
+    return community_louvain.partition_at_level(dendrogram, level)
+
+
+def supergraph(community_of, sources, targets, weights):
+    """
+    The graph of communities: (members and internal weight of each
+    community, and (a, b, weight) edges between communities with the summed
+    weight of the edges joining their names). `community_of` holds the
+    community of each name position (-1 for none); edges join positions.
+    """
+    count = int(community_of.max(initial=-1)) + 1
+    members = np.bincount(community_of[community_of >= 0], minlength=count)
+    ca, cb = community_of[sources], community_of[targets]
+    known = (ca >= 0) & (cb >= 0)
+    ca, cb, weights = ca[known], cb[known], weights[known]
+    inside = ca == cb
+    internal = np.bincount(ca[inside], weights[inside], count).astype(np.int64)
+    low, high = np.minimum(ca[~inside], cb[~inside]), np.maximum(ca[~inside], cb[~inside])
+    keys, inverse = np.unique(low * max(count, 1) + high, return_inverse=True)
+    summed = np.bincount(inverse, weights[~inside], len(keys)).astype(np.int64)
+    return members, internal, (keys // max(count, 1), keys % max(count, 1), summed)
+
+
+def warm_start(previous, nodes, edges, resolution):
+    """The best partition of the previous dendrogram, if it covers most of the new graph's names"""
+    previous = partition(previous)
+    if nodes and sum(1 for node in nodes if node in previous) >= WARM_START_OVERLAP * len(nodes):
+        return previous
+    return None
+
+
+cache = ResultCache(louvain, warm_start)
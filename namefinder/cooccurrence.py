@@ -0,0 +1,145 @@
+"""
+Name co-occurrence, stored as NamePair rows.
+
+Two names co-occur when both are attested on the same fragment; a pair's
+`shared_fragments` counts those fragments. Rows are kept up to date from
+the Instance signal handlers: a saved attestation that links a name to a
+fragment it was not yet on adds one shared fragment with every other name
+there, and moving its last attestation away removes one. Deletes may come
+in batches (cascades, queryset deletes), so they recompute the pairs of the
+affected names instead. Imports rebuild the whole table with a single
+grouped self-join. The in-memory graph store (see network.py) loads its
+edges from this table on a full build and then patches them from the same
+writes, and pages read co-occurrences from the store.
+"""
+from collections import Counter, defaultdict
+from django.db import connection
+from django.db.models import F, Q
+from .models import Name, Instance, NamePair
+from .search import id_filter
+from . import network
+
+
+REBUILD_SQL = """
+    INSERT INTO {pairs} (name_a_id, name_b_id, shared_fragments)
+    SELECT a.name_id, b.name_id, COUNT(*)
+    FROM (SELECT DISTINCT name_id, fragment_id FROM {instances}
+          WHERE name_id IS NOT NULL AND fragment_id IS NOT NULL) a
+    JOIN (SELECT DISTINCT name_id, fragment_id FROM {instances}
+          WHERE name_id IS NOT NULL AND fragment_id IS NOT NULL) b
+      ON a.fragment_id = b.fragment_id AND a.name_id < b.name_id
+    GROUP BY a.name_id, b.name_id
+"""
+
+
+def pair_key(name_id, other_id):
+    """(name_a, name_b) of a pair"""
+    return (name_id, other_id) if name_id < other_id else (other_id, name_id)
+
+
+def _pair_filter(name_id, other_ids):
+    """Pairs of `name_id` with any of `other_ids`"""
+    lower = [other_id for other_id in other_ids if other_id < name_id]
+    higher = [other_id for other_id in other_ids if other_id > name_id]
+    return Q(name_a_id=name_id, name_b_id__in=higher) | Q(name_a_id__in=lower, name_b_id=name_id)
+
+
+def _other_names(name_id, fragment_id, exclude_pk=None):
+    """
+    Other names attested on the fragment, or None when `name_id` already
+    has another attestation there (so its pairs do not change)
+    """
+    rows = Instance.objects.filter(fragment_id=fragment_id, name__isnull=False)
+    if exclude_pk is not None:
+        rows = rows.exclude(pk=exclude_pk)
+    name_ids = set(rows.order_by().values_list('name_id', flat=True).distinct())
+    if name_id in name_ids:
+        return None
+    return name_ids
+
+
+def link(name_id, fragment_id, instance_pk=None):
+    """Count a new attestation of a name on a fragment"""
+    if not name_id or not fragment_id:
+        return
+    others = _other_names(name_id, fragment_id, exclude_pk=instance_pk)
+    if not others:
+        return
+    existing = NamePair.objects.filter(_pair_filter(name_id, others))
+    found = set(existing.values_list('name_a_id', 'name_b_id'))
+    existing.update(shared_fragments=F('shared_fragments') + 1)
+    NamePair.objects.bulk_create([
+        NamePair(name_a_id=a, name_b_id=b, shared_fragments=1)
+        for a, b in (pair_key(name_id, other_id) for other_id in others)
+        if (a, b) not in found
+    ])
+
+
+def unlink(name_id, fragment_id):
+    """Count an attestation moved away from a fragment (already saved)"""
+    if not name_id or not fragment_id:
+        return
+    others = _other_names(name_id, fragment_id)
+    if not others:
+        return
+    pairs = NamePair.objects.filter(_pair_filter(name_id, others))
+    pairs.filter(shared_fragments__lte=1).delete()
+    pairs.update(shared_fragments=F('shared_fragments') - 1)
+
+
+def refresh_name_pairs(name_ids):
+    """Recompute every pair of some names from their attestations"""
+    name_ids = {name_id for name_id in name_ids if name_id}
+    if not name_ids:
+        return
+    fragments = Instance.objects.filter(name_id__in=name_ids, fragment__isnull=False).values('fragment_id')
+    by_fragment = defaultdict(set)
+    for fragment_id, name_id in Instance.objects.filter(
+        fragment_id__in=fragments, name__isnull=False
+    ).order_by().values_list('fragment_id', 'name_id').distinct():
+        by_fragment[fragment_id].add(name_id)
+
+    counts = Counter()
+    for names in by_fragment.values():
+        for name_id in names & name_ids:
+            for other_id in names:
+                # Pairs of two refreshed names are seen from both sides
+                if other_id != name_id and (other_id not in name_ids or name_id < other_id):
+                    counts[pair_key(name_id, other_id)] += 1
+
+    NamePair.objects.filter(Q(name_a_id__in=name_ids) | Q(name_b_id__in=name_ids)).delete()
+    NamePair.objects.bulk_create(
+        [NamePair(name_a_id=a, name_b_id=b, shared_fragments=shared) for (a, b), shared in counts.items()],
+        batch_size=5000
+    )
+
+
+def rebuild_name_pairs():
+    """Rebuild the whole NamePair table from the attestations"""
+    NamePair.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(REBUILD_SQL.format(
+            pairs=NamePair._meta.db_table, instances=Instance._meta.db_table
+        ))
+
+
+def co_occurring_names(name, limit=50):
+    """
+    Names sharing fragments with `name`, most shared fragments first (then
+    by name), each with a `co_occurrence_count` attribute. Read from this
+    worker's graph store.
+    """
+    other_ids, shared = network.store.graph().neighbors(name.pk)
+    counts = dict(zip(other_ids.tolist(), shared.tolist()))
+    if not counts:
+        return []
+
+    # Only names tied with the last one kept need their labels to break ties
+    threshold = sorted(counts.values(), reverse=True)[min(limit, len(counts)) - 1]
+    names = list(Name.objects.filter(
+        id_filter(other_id for other_id, shared in counts.items() if shared >= threshold)
+    ).select_related('name_type'))
+    for other in names:
+        other.co_occurrence_count = counts[other.pk]
+    names.sort(key=lambda other: (-other.co_occurrence_count, other.name))
+    return names[:limit]
@@ -0,0 +1,277 @@
+"""
+Facet counts for the name search.
+
+For every facet (name type, writing type, completeness, milieu, date) the
+search page shows how many hits each value would leave: the current query
+and all *other* selected filters applied, grouped by that facet's value.
+
+Each worker keeps a columnar snapshot of the facet values of all names in
+NumPy arrays (one code column per foreign key, one sorted position array
+per date). When names, attestations or fragments change, a copy of the
+snapshot is patched with the rows of the names the DataChange journal
+points to, like the network GraphStore; bulk changes (or a journal gap)
+rebuild it. A request turns the hits of its search into a boolean row
+mask and answers every facet with one bincount weighted by the mask (or
+one masked count per date), so the cost does not depend on the number of
+facet values and no COUNT query is issued.
+"""
+import threading
+import numpy as np
+from .models import Name, NameDate, Instance, DataChange
+from .versioning import current_version, AttestedNames, JOURNAL_KEEP
+
+
+# Name foreign keys offered as facets, in display order
+FK_FACETS = ['name_type', 'writing_type', 'completeness', 'milieu']
+DATE_FACET = 'date'
+FACETS = FK_FACETS + [DATE_FACET]
+# Names changed since the last refresh above which a full rebuild is cheaper
+INCREMENTAL_LIMIT = 5000
+
+
+def selected_value(facet, value):
+    """Filter value as stored in the index (None when not filtering)"""
+    if not value:
+        return None
+    if facet == DATE_FACET:
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        # Like the view's filter, an invalid id matches nothing
+        return -1
+
+
+def _table(rows):
+    """(id, name_type_id, writing_type_id, completeness_id, milieu_id) rows as an array, 0 for null"""
+    return np.array(
+        [[value or 0 for value in row] for row in rows], dtype=np.int64
+    ).reshape(-1, len(FK_FACETS) + 1)
+
+
+class FacetIndex:
+    """Facet values of every name at one data version"""
+
+    def __init__(self, version=None):
+        self.version = version
+        self.ids = np.zeros(0, dtype=np.int64)
+        # Rows of deleted names stay in place until the next rebuild
+        self.alive = np.zeros(0, dtype=bool)
+        self.slots = np.zeros(0, dtype=np.int32)
+        self.columns = {facet: np.zeros(0, dtype=np.intp) for facet in FK_FACETS}
+        self.dates = {}
+
+    def build(self, version):
+        """Load every name from the database"""
+        self.load(
+            Name.objects.order_by('id').values_list('id', *(f'{facet}_id' for facet in FK_FACETS)),
+            NameDate.objects.order_by().values_list('name_id', 'date')
+        )
+        self.version = version
+
+    def load(self, rows, date_pairs):
+        """Load (id, name_type_id, writing_type_id, completeness_id, milieu_id) rows and (name id, date) pairs"""
+        table = _table(rows)
+        self.ids = table[:, 0].copy()
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        # Name id -> row position (-1 for unknown ids)
+        self.slots = np.full(int(self.ids.max()) + 1 if len(self.ids) else 0, -1, dtype=np.int32)
+        self.slots[self.ids] = np.arange(len(self.ids), dtype=np.int32)
+        # Native ints: bincount would convert anything else on every call
+        self.columns = {facet: table[:, i + 1].astype(np.intp) for i, facet in enumerate(FK_FACETS)}
+        self.dates = {}
+        self.add_dates(date_pairs)
+
+    def add_dates(self, date_pairs):
+        by_date = {}
+        for name_id, date in date_pairs:
+            by_date.setdefault(date, []).append(name_id)
+        for date, name_ids in by_date.items():
+            positions = self.positions(np.array(name_ids, dtype=np.int64))
+            if date in self.dates:
+                positions = np.concatenate([self.dates[date], positions])
+            # Sorted and distinct
+            self.dates[date] = np.unique(positions)
+
+    def copy(self):
+        index = FacetIndex(self.version)
+        index.ids, index.alive, index.slots = self.ids.copy(), self.alive.copy(), self.slots.copy()
+        index.columns = {facet: column.copy() for facet, column in self.columns.items()}
+        # Date arrays are replaced, never changed in place
+        index.dates = dict(self.dates)
+        return index
+
+    def update(self, name_ids, rows, date_pairs):
+        """
+        Replace the facet values of some names by their current rows and
+        (name id, date) pairs; names without a row were deleted
+        """
+        name_ids = np.array(sorted(name_ids), dtype=np.int64)
+        changed = self.positions(name_ids)
+        self.alive[changed] = False
+        for column in self.columns.values():
+            column[changed] = 0
+
+        table = _table(rows)
+        ids = table[:, 0]
+        if len(ids) and int(ids.max()) >= len(self.slots):
+            self.slots = np.concatenate([self.slots, np.full(int(ids.max()) + 1 - len(self.slots), -1, dtype=np.int32)])
+        added = ids[self.slots[ids] < 0]
+        if len(added):
+            start = len(self.ids)
+            self.ids = np.concatenate([self.ids, added])
+            self.alive = np.concatenate([self.alive, np.zeros(len(added), dtype=bool)])
+            self.columns = {
+                facet: np.concatenate([column, np.zeros(len(added), dtype=np.intp)])
+                for facet, column in self.columns.items()
+            }
+            self.slots[added] = np.arange(start, len(self.ids), dtype=np.int32)
+        positions = self.slots[ids]
+        self.alive[positions] = True
+        for i, facet in enumerate(FK_FACETS):
+            self.columns[facet][positions] = table[:, i + 1]
+        deleted = np.setdiff1d(name_ids, ids)
+        self.slots[deleted[deleted < len(self.slots)]] = -1
+
+        for date, date_positions in list(self.dates.items()):
+            remaining = date_positions[~np.isin(date_positions, changed)]
+            if len(remaining):
+                self.dates[date] = remaining
+            else:
+                del self.dates[date]
+        self.add_dates(date_pairs)
+
+    def positions(self, name_ids):
+        """Row positions of some name ids (ids unknown to the snapshot are dropped)"""
+        positions = self.slots[name_ids[(name_ids >= 0) & (name_ids < len(self.slots))]]
+        return positions[positions >= 0]
+
+    def mask(self, name_ids=None):
+        """Row mask of some name ids, or of every name"""
+        if name_ids is None:
+            return self.alive.copy()
+        mask = np.zeros(len(self.ids), dtype=bool)
+        mask[self.positions(np.asarray(name_ids, dtype=np.int64))] = True
+        return mask
+
+    def filter_mask(self, facet, value):
+        if facet == DATE_FACET:
+            mask = np.zeros(len(self.ids), dtype=bool)
+            positions = self.dates.get(value)
+            if positions is not None:
+                mask[positions] = True
+            return mask
+        return self.columns[facet] == value
+
+    def counts(self, hits, selected):
+        """
+        Facet counts for a row mask of query hits and a dict of selected
+        filter values by facet: {'total': n, facet: {value: count}}.
+        """
+        filters = {
+            facet: self.filter_mask(facet, value)
+            for facet, value in selected.items() if value is not None
+        }
+        result = {}
+        for facet in FACETS:
+            mask = hits
+            for other, other_mask in filters.items():
+                if other != facet:
+                    mask = mask & other_mask
+            if facet == DATE_FACET:
+                result[facet] = {
+                    date: count for date, positions in self.dates.items()
+                    if (count := int(np.count_nonzero(mask[positions])))
+                }
+            else:
+                # Weighting by the mask beats indexing with it (no branching per row)
+                counts = np.bincount(self.columns[facet], weights=mask)
+                result[facet] = {int(value): int(counts[value]) for value in np.flatnonzero(counts) if value}
+
+        total = hits
+        for other_mask in filters.values():
+            total = total & other_mask
+        result['total'] = int(np.count_nonzero(total))
+        return result
+
+
+class FacetRegistry:
+    """Holds the current FacetIndex of this process"""
+
+    def __init__(self):
+        self.index = None
+        self.attested = AttestedNames()
+        self.lock = threading.Lock()
+        self.last_refresh = None
+
+    def current(self):
+        version = current_version('name', 'instance', 'fragment')
+        index = self.index
+        if index is None or index.version != version:
+            with self.lock:
+                if self.index is None or self.index.version != version:
+                    self.index = self.refreshed(version)
+                index = self.index
+        return index
+
+    def refreshed(self, version):
+        """
+        The index at `version`: a patched copy of the current one (requests
+        may still be reading it), or a new one when only a rebuild will do
+        """
+        index = self.index
+        if index is not None and 0 < version - index.version < JOURNAL_KEEP:
+            name_ids = self.changed_names(index.version, version)
+            if name_ids is not None and len(name_ids) <= INCREMENTAL_LIMIT:
+                index = index.copy()
+                index.update(
+                    name_ids,
+                    Name.objects.filter(id__in=name_ids).values_list('id', *(f'{facet}_id' for facet in FK_FACETS)),
+                    NameDate.objects.filter(name_id__in=name_ids).values_list('name_id', 'date'),
+                )
+                index.version = version
+                self.last_refresh = {'kind': 'incremental', 'names': len(name_ids)}
+                return index
+        index = FacetIndex()
+        index.build(version)
+        self.attested.load()
+        self.last_refresh = {'kind': 'full', 'names': None}
+        return index
+
+    def changed_names(self, since, version):
+        """Ids of the names whose facet values may have changed, or None after a bulk change"""
+        changes = DataChange.objects.filter(
+            id__gt=since, id__lte=version, model_type__in=['name', 'instance', 'fragment']
+        ).values_list('model_type', 'action', 'object_id')
+        changed = {'name': set(), 'instance': set(), 'fragment': set()}
+        for model_type, action, object_id in changes:
+            if action == 'bulk' or object_id is None:
+                return None
+            changed[model_type].add(object_id)
+        # Attestations move their old and new names; a fragment's date all of its names
+        name_ids = changed['name'] | self.attested.update(changed['instance'])
+        if changed['fragment']:
+            name_ids.update(
+                Instance.objects.filter(fragment_id__in=changed['fragment'], name__isnull=False)
+                .values_list('name_id', flat=True)
+            )
+        return name_ids
+
+    def clear(self):
+        self.index = None
+
+
+registry = FacetRegistry()
+
+
+def facet_counts(filters, hits=None):
+    """
+    Facet counts for a search: `filters` maps facet names to the raw GET
+    values and `hits` is the Name queryset the search box matched (None
+    without a query). Only the ids of the hits are read.
+    """
+    index = registry.current()
+    if hits is not None:
+        hits = np.fromiter(hits.order_by().values_list('id', flat=True), dtype=np.int64)
+    selected = {facet: selected_value(facet, filters.get(facet)) for facet in FACETS}
+    return index.counts(index.mask(hits), selected)
@@ -1,6 +1,20 @@
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm
 from .models import Name, Instance, Fragment, NameType, WritingType, CompletenessType, Milieu, Series, PublicationType, Determinative
+from .lookups import lookups
+
+
+class LookupChoicesMixin:
+    """Build lookup-table choices from the in-memory registry instead of querying"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        tables = lookups()
+        for field in self.fields.values():
+            if isinstance(field, forms.ModelChoiceField) and field.queryset.model in tables:
+                choices = [(obj.pk, field.label_from_instance(obj)) for obj in tables.all(field.queryset.model)]
+                if field.empty_label is not None:
+                    choices.insert(0, ('', field.empty_label))
+                field.choices = choices
 
 
 class LoginForm(AuthenticationForm):
@@ -20,7 +34,7 @@ class LoginForm(AuthenticationForm):
     )
 
 
-class NameForm(forms.ModelForm):
+class NameForm(LookupChoicesMixin, forms.ModelForm):
     """Form for creating/editing names"""
     class Meta:
         model = Name
@@ -58,7 +72,7 @@ class NameForm(forms.ModelForm):
         return instance
 
 
-class FragmentForm(forms.ModelForm):
+class FragmentForm(LookupChoicesMixin, forms.ModelForm):
     """Form for creating/editing fragments"""
     class Meta:
         model = Fragment
@@ -70,7 +84,7 @@ class FragmentForm(forms.ModelForm):
         }
 
 
-class InstanceForm(forms.ModelForm):
+class InstanceForm(LookupChoicesMixin, forms.ModelForm):
     """Form for creating/editing instances (attestations)"""
     class Meta:
         model = Instance
@@ -91,7 +105,7 @@ class InstanceForm(forms.ModelForm):
         }
 
 
-class InstanceInlineForm(forms.ModelForm):
+class InstanceInlineForm(LookupChoicesMixin, forms.ModelForm):
     """Simplified form for adding instances from name detail page"""
     class Meta:
         model = Instance
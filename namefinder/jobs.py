@@ -0,0 +1,119 @@
+"""
+Background jobs for network requests too large to answer inline.
+
+api_network_data hands a request whose network has more than
+NETWORK_JOB_MIN_EDGES edges to a NetworkJob row instead of computing it in
+the web worker, and answers 202 with the job's id. Identical requests at
+the same data version share one job (one row per query and version; a
+failed job is queued again by the next identical request). The
+run_network_jobs command, a separate long-running process, claims queued
+jobs and runs them in its own process pool, writing each response body to
+NETWORK_JOB_DIR. Clients poll the job's status and then fetch the stored
+result. Finished jobs and their files are removed after
+NETWORK_JOB_KEEP_HOURS.
+"""
+import os
+from datetime import timedelta
+from urllib.parse import urlencode
+from django.conf import settings
+from django.db import IntegrityError
+from django.http import QueryDict
+from django.urls import reverse
+from django.utils import timezone
+from .models import NetworkJob
+
+
+def canonical_query(params):
+    """A request's query string with the parameters (and their values) sorted"""
+    return urlencode(sorted((key, value) for key, values in params.lists() for value in values))
+
+
+def submit(params, version):
+    """The job computing a network request at a data version (reused if one exists)"""
+    query = canonical_query(params)
+    try:
+        job, _ = NetworkJob.objects.get_or_create(query=query, version=version)
+    except IntegrityError:
+        # A concurrent request created it; get_or_create retries the lookup
+        # itself, this covers the row being cleaned up in between
+        job, _ = NetworkJob.objects.get_or_create(query=query, version=version)
+    if job.status == 'failed':
+        NetworkJob.objects.filter(pk=job.pk, status='failed').update(
+            status='queued', error='', started_at=None, finished_at=None
+        )
+        job.refresh_from_db()
+    return job
+
+
+def describe(job):
+    """JSON-ready status of a job"""
+    data = {
+        'job': str(job.pk),
+        'status': job.status,
+        'created_at': job.created_at.isoformat(),
+        'status_url': reverse('namefinder:api_network_job', args=[job.pk]),
+    }
+    if job.status == 'done':
+        data['result_url'] = reverse('namefinder:api_network_job_result', args=[job.pk])
+    if job.status == 'failed':
+        data['error'] = job.error
+    return data
+
+
+def result_path(job_or_pk):
+    pk = getattr(job_or_pk, 'pk', job_or_pk)
+    return os.path.join(settings.NETWORK_JOB_DIR, str(pk))
+
+
+def claim(limit):
+    """Mark up to `limit` queued jobs (oldest first) as running and return their ids"""
+    claimed = []
+    for pk in NetworkJob.objects.filter(status='queued').values_list('pk', flat=True)[:limit]:
+        # Another runner may have taken it in the meantime
+        if NetworkJob.objects.filter(pk=pk, status='queued').update(status='running', started_at=timezone.now()):
+            claimed.append(pk)
+    return claimed
+
+
+def run(pk):
+    """Compute a claimed job and store its result (runs in the runner's processes)"""
+    from .api_views import network_response
+    job = NetworkJob.objects.get(pk=pk)
+    try:
+        response = network_response(QueryDict(job.query))
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        if response.status_code != 200:
+            raise ValueError(content.decode('utf-8', 'replace'))
+        os.makedirs(settings.NETWORK_JOB_DIR, exist_ok=True)
+        # Write aside, then rename: readers never see a partial file
+        partial = result_path(job) + '.partial'
+        with open(partial, 'wb') as output:
+            output.write(content)
+        os.replace(partial, result_path(job))
+    except Exception as e:
+        NetworkJob.objects.filter(pk=pk).update(status='failed', error=str(e), finished_at=timezone.now())
+        return 'failed'
+    NetworkJob.objects.filter(pk=pk).update(
+        status='done', content_type=response['Content-Type'], finished_at=timezone.now()
+    )
+    return 'done'
+
+
+def requeue_running():
+    """Put jobs left running by a stopped runner back in the queue"""
+    return NetworkJob.objects.filter(status='running').update(status='queued', started_at=None)
+
+
+def expire():
+    """Remove jobs (and their results) older than NETWORK_JOB_KEEP_HOURS"""
+    old = NetworkJob.objects.filter(
+        created_at__lt=timezone.now() - timedelta(hours=settings.NETWORK_JOB_KEEP_HOURS)
+    ).exclude(status='running')
+    pks = list(old.values_list('pk', flat=True))
+    for pk in pks:
+        try:
+            os.remove(result_path(pk))
+        except FileNotFoundError:
+            pass
+    NetworkJob.objects.filter(pk__in=pks).delete()
+    return len(pks)
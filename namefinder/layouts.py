@@ -0,0 +1,134 @@
+"""
+Server-side layouts for the network view.
+
+A force-directed (Fruchterman-Reingold) layout in NumPy. Edges pull their
+names together, more strongly for names that share many fragments, and all
+names push each other apart. Repulsion is computed exactly for small
+graphs. Above EXACT_LIMIT names, each name is pushed by the mass centres
+of the occupied cells of a GRID x GRID grid, so one iteration stays linear
+in the number of names. Coordinates are fractions of the unit square.
+
+Layouts are cached per filter set and data version (see pool.py). After a
+data change, the previous layout of the same filters seeds the new run, so
+names keep their places and only a short cooling run is needed.
+"""
+import numpy as np
+from . import network
+from .pool import ResultCache
+
+
+# Seed of the random start positions
+SEED = 42
+# Iterations of a cold start, and of a run seeded with the previous layout
+ITERATIONS = 60
+WARM_ITERATIONS = 15
+# Largest graph whose repulsion is computed between all pairs of names
+EXACT_LIMIT = 500
+# Cells per side of the repulsion grid of larger graphs
+GRID = 16
+# Names per block of the pairwise repulsion (bounds its memory)
+BLOCK = 1024
+# Pull of every name towards the centre, keeping separate components close
+GRAVITY = 0.05
+
+
+def _repulsion(positions, k):
+    """Displacement of each name away from all others"""
+    count = len(positions)
+    if count <= EXACT_LIMIT:
+        sources, masses = positions, np.ones(count)
+    else:
+        low = positions.min(axis=0)
+        span = (positions.max(axis=0) - low).max() or 1.0
+        cells = np.minimum(((positions - low) / span * GRID).astype(np.int64), GRID - 1)
+        cell = cells[:, 0] * GRID + cells[:, 1]
+        masses = np.bincount(cell, minlength=GRID * GRID).astype(float)
+        occupied = np.flatnonzero(masses)
+        masses = masses[occupied]
+        sources = np.stack([
+            np.bincount(cell, positions[:, 0], GRID * GRID)[occupied],
+            np.bincount(cell, positions[:, 1], GRID * GRID)[occupied],
+        ], axis=1) / masses[:, None]
+
+    # Sum of (p - s) f over sources s = p * sum(f) - f @ s, with squared distances from dot products
+    displacement = np.empty_like(positions)
+    source_norms = (sources ** 2).sum(axis=1)
+    for start in range(0, count, BLOCK):
+        block = positions[start:start + BLOCK]
+        distance2 = (block ** 2).sum(axis=1)[:, None] + source_norms[None, :] - 2 * block @ sources.T
+        # Closer than k the push grows linearly, so a name never shoots off its own cell's centre
+        force = masses * (k * k) / np.maximum(distance2, k * k)
+        displacement[start:start + BLOCK] = block * force.sum(axis=1)[:, None] - force @ sources
+    return displacement
+
+
+def force_layout(count, sources, targets, weights, positions=None, iterations=ITERATIONS):
+    """
+    (count, 2) coordinates of `count` names joined by edges between the
+    positions `sources` and `targets`, starting from `positions` if given
+    """
+    rng = np.random.default_rng(SEED)
+    if positions is None:
+        positions = rng.random((count, 2))
+    positions = positions.astype(float)
+    if count < 2:
+        return np.full((count, 2), 0.5)
+
+    k = 1.0 / np.sqrt(count)
+    strength = np.log1p(np.asarray(weights, dtype=float))
+    temperature = 0.1 if iterations >= ITERATIONS else 0.02
+    for step in range(iterations):
+        displacement = _repulsion(positions, k)
+        delta = positions[sources] - positions[targets]
+        pull = delta * (np.sqrt((delta ** 2).sum(axis=1)) * strength / k)[:, None]
+        for axis in (0, 1):
+            displacement[:, axis] -= np.bincount(sources, pull[:, axis], minlength=count)
+            displacement[:, axis] += np.bincount(targets, pull[:, axis], minlength=count)
+        displacement -= GRAVITY * (positions - positions.mean(axis=0)) / k
+        length = np.maximum(np.sqrt((displacement ** 2).sum(axis=1)), 1e-12)
+        positions += displacement * (np.minimum(length, temperature * (1 - step / iterations)) / length)[:, None]
+
+    # Fit into the unit square, keeping the aspect ratio
+    low, high = positions.min(axis=0), positions.max(axis=0)
+    span = (high - low).max() or 1.0
+    return (positions - (low + high) / 2) / span + 0.5
+
+
+def layout(node_ids, sources, targets, weights, initial=None):
+    """
+    (node_ids, coordinates) of a graph given as sorted node ids and edges
+    between positions in them. `initial` is a previous (node_ids,
+    coordinates) to start from: names it placed keep their coordinates,
+    new names start at the centre of their placed neighbours. Runs in the
+    pool processes.
+    """
+    count = len(node_ids)
+    if initial is None:
+        return node_ids, force_layout(count, sources, targets, weights)
+
+    previous_ids, previous = initial
+    at = network.positions(previous_ids, node_ids) if len(previous_ids) else np.full(count, -1)
+    placed = at >= 0
+    positions = np.random.default_rng(SEED).random((count, 2))
+    positions[placed] = previous[at[placed]]
+    # New names: the mean of their placed neighbours, where they have any
+    ends = np.concatenate([sources, targets])
+    others = np.concatenate([targets, sources])
+    useful = placed[others] & ~placed[ends]
+    neighbours = np.bincount(ends[useful], minlength=count)
+    for axis in (0, 1):
+        total = np.bincount(ends[useful], positions[others[useful], axis], minlength=count)
+        positions[:, axis] = np.where(neighbours > 0, total / np.maximum(neighbours, 1), positions[:, axis])
+    return node_ids, force_layout(count, sources, targets, weights, positions, WARM_ITERATIONS)
+
+
+def warm_start(previous, node_ids, sources, targets, weights):
+    """The previous layout, if it placed at least half of the new graph's names"""
+    previous_ids = previous[0]
+    if len(node_ids) and len(previous_ids):
+        if (network.positions(previous_ids, node_ids) >= 0).sum() * 2 >= len(node_ids):
+            return previous
+    return None
+
+
+cache = ResultCache(layout, warm_start)
@@ -0,0 +1,86 @@
+"""
+Process-wide registry of the lookup tables.
+
+NameType, WritingType, CompletenessType, Milieu, Determinative, Series and
+PublicationType are tiny and almost never change, yet nearly every page
+lists or resolves them. Each worker loads them once and keeps them until
+the 'lookup' data version changes (writes are journalled by signals.py), so
+a request costs a single version check instead of one query per table.
+
+Cached objects are shared between requests and must be treated as
+read-only.
+"""
+import threading
+from .models import NameType, WritingType, CompletenessType, Milieu, Determinative, Series, PublicationType
+from .versioning import current_version
+
+
+LOOKUP_MODELS = [NameType, WritingType, CompletenessType, Milieu, Determinative, Series, PublicationType]
+
+
+class LookupTables:
+    """Snapshot of every lookup table at one data version"""
+
+    def __init__(self, version):
+        self.version = version
+        self.rows = {}
+        self.by_id = {}
+        self.by_name = {}
+        for model in LOOKUP_MODELS:
+            rows = list(model.objects.all())
+            self.rows[model] = rows
+            self.by_id[model] = {obj.pk: obj for obj in rows}
+            self.by_name[model] = {obj.name: obj for obj in rows}
+
+    def __contains__(self, model):
+        return model in self.rows
+
+    def all(self, model):
+        """Rows of a lookup table in its default ordering"""
+        return self.rows[model]
+
+    def get(self, model, pk):
+        """Row by primary key (int or numeric string), or None"""
+        try:
+            return self.by_id[model].get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def by_label(self, model, name):
+        """Row by its name, or None for empty/unknown names"""
+        if not name:
+            return None
+        return self.by_name[model].get(name)
+
+    def id_for(self, model, name):
+        obj = self.by_label(model, name)
+        return obj.pk if obj else None
+
+
+class LookupRegistry:
+    """Holds the current LookupTables snapshot of this process"""
+
+    def __init__(self):
+        self.tables = None
+        self.lock = threading.Lock()
+
+    def current(self):
+        version = current_version('lookup')
+        tables = self.tables
+        if tables is None or tables.version != version:
+            with self.lock:
+                if self.tables is None or self.tables.version != version:
+                    self.tables = LookupTables(version)
+                tables = self.tables
+        return tables
+
+    def clear(self):
+        self.tables = None
+
+
+registry = LookupRegistry()
+
+
+def lookups():
+    """The lookup tables at the current data version"""
+    return registry.current()
@@ -0,0 +1,84 @@
+"""
+Django management command to benchmark the search facet counts.
+
+Loads synthetic names with random facet values and dates into a throwaway
+FacetIndex, then computes the facet counts for random hit sets (from a
+handful of names up to every name) with and without selected filters.
+Reports build time and per-request latency percentiles. The project
+database is never touched.
+"""
+import random
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from namefinder.facets import FacetIndex, FACETS, selected_value
+from namefinder.management.commands.benchmark_typeahead import percentile
+
+
+DATES = ['OS', 'OH', 'MH', 'MS', 'NH', 'NS', 'LNS', 'pre-NH', 'OH/MS', 'OH/NS', 'MH/MS', 'MH/NS']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark facet count latency on synthetic names'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=str,
+            default='10000,100000,1000000',
+            help='Comma-separated numbers of names (default: 10000,100000,1000000)'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Facet requests per size (default: 200)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic data'
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        for size in sizes:
+            rng = random.Random(options['seed'])
+            rows = [
+                (i + 1, rng.randint(1, 3), rng.randint(1, 4), rng.choice([None, 1, 2, 3]), rng.choice([None, *range(1, 9)]))
+                for i in range(size)
+            ]
+            date_pairs = [
+                (i + 1, date)
+                for i in range(size)
+                for date in rng.sample(DATES, rng.choice([0, 1, 1, 2, 3]))
+            ]
+
+            index = FacetIndex()
+            start = time.perf_counter()
+            index.load(rows, date_pairs)
+            build = time.perf_counter() - start
+
+            timings = []
+            for _ in range(options['requests']):
+                fraction = rng.choice([None, 0.5, 0.1, 0.01, 0.0001])
+                hits = None
+                if fraction is not None:
+                    hits = np.sort(np.array(rng.sample(range(1, size + 1), max(1, int(size * fraction))), dtype=np.int64))
+                filters = {
+                    'name_type': str(rng.randint(1, 3)) if rng.random() < 0.5 else '',
+                    'milieu': str(rng.randint(1, 8)) if rng.random() < 0.3 else '',
+                    'date': rng.choice(DATES) if rng.random() < 0.3 else '',
+                }
+                selected = {facet: selected_value(facet, filters.get(facet)) for facet in FACETS}
+                start = time.perf_counter()
+                index.counts(index.mask(hits), selected)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+
+            self.stdout.write(
+                f'{size:>9} names  build {build:6.1f} s  facets {len(timings)} requests  '
+                f'p50 {percentile(timings, 0.5):.2f} ms  p99 {percentile(timings, 0.99):.2f} ms  '
+                f'max {timings[-1]:.2f} ms'
+            )
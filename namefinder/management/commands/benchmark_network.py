@@ -0,0 +1,241 @@
+"""
+Django management command to benchmark the co-occurrence network engine.
+
+Generates synthetic attestations (name, fragment) with a skewed number of
+attestations per name, then computes the co-occurrence edges with the old
+per-fragment Python loop and with the sparse NumPy product, checks that both
+agree, and times the node and edge filter masks, 2- and 3-hop ego
+expansions from random names (with the configured size limits), the size
+and encoding time of the filtered network as per-item JSON, columnar JSON
+and the binary format, edge pruning (disparity backbone, top 5 edges per
+name by Jaccard similarity), the centrality metrics of the filtered
+network, the graph store's full load and incremental patches (8 moved
+attestations and 2 new ones), and the per-period graphs of four date
+slices. The project database is never touched.
+"""
+import json
+import time
+from collections import defaultdict
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from namefinder import network, payload, metrics
+from namefinder.management.commands.benchmark_typeahead import percentile
+
+
+# Fragment dates of the synthetic fragments, one period each
+DATES = ('ah', 'mh', 'jh', 'sjh')
+
+
+def pairwise_counts(name_ids, fragment_ids):
+    """The former implementation: sets per fragment, nested loop per pair"""
+    fragment_names = defaultdict(set)
+    for name_id, fragment_id in zip(name_ids, fragment_ids):
+        fragment_names[fragment_id].add(name_id)
+    cooccurrence = defaultdict(int)
+    for names in fragment_names.values():
+        name_list = sorted(names)
+        for i in range(len(name_list)):
+            for j in range(i + 1, len(name_list)):
+                cooccurrence[(name_list[i], name_list[j])] += 1
+    return cooccurrence
+
+
+class Command(BaseCommand):
+    help = 'Benchmark co-occurrence edge computation on synthetic attestations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=str,
+            default='100000,1000000,5000000',
+            help='Comma-separated numbers of attestations (default: 100000,1000000,5000000)'
+        )
+        parser.add_argument(
+            '--loop-limit',
+            type=int,
+            default=1000000,
+            help='Largest size also run through the Python loop (default: 1000000)'
+        )
+        parser.add_argument(
+            '--egos',
+            type=int,
+            default=100,
+            help='Ego expansions per size and degree (default: 100)'
+        )
+        parser.add_argument(
+            '--patches',
+            type=int,
+            default=20,
+            help='Incremental store patches per size (default: 20)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic data'
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        for size in sizes:
+            rng = np.random.default_rng(options['seed'])
+            name_count = max(2, size // 10)
+            fragment_count = max(1, size // 4)
+            # A few names are attested everywhere, most only a handful of times
+            name_ids = np.minimum(rng.zipf(1.3, size), name_count).astype(np.int64)
+            name_ids = rng.permutation(name_count)[name_ids - 1] + 1
+            fragment_ids = rng.integers(1, fragment_count + 1, size)
+
+            start = time.perf_counter()
+            a, b, weights = network.incidence_edges(name_ids, fragment_ids)
+            sparse = time.perf_counter() - start
+
+            loop = ''
+            if size <= options['loop_limit']:
+                start = time.perf_counter()
+                expected = pairwise_counts(name_ids.tolist(), fragment_ids.tolist())
+                elapsed = time.perf_counter() - start
+                agree = len(expected) == len(a) and all(
+                    expected[pair] == weight
+                    for pair, weight in zip(zip(a.tolist(), b.tolist()), weights.tolist())
+                )
+                loop = f'  python loop {elapsed:7.2f} s ({elapsed / sparse:5.1f}x){"" if agree else "  MISMATCH"}'
+
+            ids = np.arange(1, name_count + 1, dtype=np.int64)
+            counts = np.bincount(name_ids, minlength=name_count + 1)[1:]
+            type_ids = rng.integers(1, 4, name_count)
+            start = time.perf_counter()
+            pa, pb = network.positions(ids, a), network.positions(ids, b)
+            valid = network.node_mask(counts, type_ids, ['1', '2'], 2)
+            keep = network.edge_mask(valid, pa, pb)
+            connections = network.degrees(name_count, pa[keep], pb[keep])
+            selected = (connections > 0) & (connections <= 1000)
+            network.edge_mask(selected, pa[keep], pb[keep])
+            filters = time.perf_counter() - start
+
+            self.stdout.write(
+                f'{size:>9} attestations  {len(a):>10} edges  sparse {sparse:6.2f} s{loop}  '
+                f'filters {filters * 1000:7.1f} ms'
+            )
+
+            # Response payloads of the names kept by the filters
+            kept = network.edge_mask(selected, pa[keep], pb[keep])
+            pa, pb, edge_weights = pa[keep][kept], pb[keep][kept], weights[keep][kept]
+            labels = {name_id: (f'Name {name_id}', f'Type {type_ids[name_id - 1]}') for name_id in ids[selected].tolist()}
+            encodings = []
+            start = time.perf_counter()
+            body = json.dumps({
+                'nodes': [
+                    {'id': name_id, 'name': labels[name_id][0], 'name_type': labels[name_id][1],
+                     'attestations': count, 'connections': degree}
+                    for name_id, count, degree in zip(
+                        ids[selected].tolist(), counts[selected].tolist(), connections[selected].tolist()
+                    )
+                ],
+                'edges': [
+                    {'source': source, 'target': target, 'weight': weight}
+                    for source, target, weight in zip(ids[pa].tolist(), ids[pb].tolist(), edge_weights.tolist())
+                ],
+            })
+            encodings.append(('json', len(body), time.perf_counter() - start))
+            start = time.perf_counter()
+            columns = payload.network_columns(ids, selected, counts, connections, pa, pb, edge_weights, labels)
+            body = json.dumps(payload.columnar(columns))
+            encodings.append(('columnar', len(body), time.perf_counter() - start))
+            start = time.perf_counter()
+            columns = payload.network_columns(ids, selected, counts, connections, pa, pb, edge_weights, labels)
+            body = sum(len(chunk) for chunk in payload.binary_chunks(columns))
+            encodings.append(('binary', body, time.perf_counter() - start))
+            self.stdout.write(f'{"":>9} payload  ' + '  '.join(
+                f'{name} {length / 2 ** 20:6.1f} MiB {elapsed * 1000:7.1f} ms' for name, length, elapsed in encodings
+            ))
+
+            start = time.perf_counter()
+            backbone = (network.disparity(name_count, pa, pb, edge_weights) < 0.05).sum()
+            disparity = time.perf_counter() - start
+            base = fragment_count + 1
+            entries = np.unique(name_ids * base + fragment_ids) // base
+            occurrences = np.bincount(entries - 1, minlength=name_count)
+            start = time.perf_counter()
+            scores = network.jaccard(pa, pb, edge_weights, occurrences)
+            top = network.top_edges(name_count, pa, pb, scores, 5).sum()
+            pruning = time.perf_counter() - start
+            self.stdout.write(
+                f'{"":>9} pruning  {len(pa)} edges  backbone 0.05 keeps {backbone} in {disparity * 1000:.1f} ms  '
+                f'top 5 by jaccard keeps {top} in {pruning * 1000:.1f} ms'
+            )
+
+            # Centrality of the filtered network, between name positions
+            index = np.cumsum(selected) - 1
+            start = time.perf_counter()
+            metrics.centrality(ids[selected], index[pa], index[pb], edge_weights)
+            centrality = time.perf_counter() - start
+            self.stdout.write(
+                f'{"":>9} metrics  {int(selected.sum())} names  degrees, pagerank, eigenvector and '
+                f'betweenness from {min(int(selected.sum()), metrics.BETWEENNESS_SAMPLES)} names in {centrality:.2f} s'
+            )
+
+            graph = network.Graph()
+            start = time.perf_counter()
+            graph.load(ids, counts, type_ids, a, b, weights)
+            indptr, _, _ = graph.csr()
+            build = time.perf_counter() - start
+            connected = ids[np.diff(indptr) > 0]
+            for degree in (2, 3):
+                timings, sizes_found = [], []
+                for seed in rng.choice(connected, options['egos']):
+                    start = time.perf_counter()
+                    mask, _ = graph.ego_mask(
+                        [seed], degree,
+                        max_nodes=settings.NETWORK_EGO_MAX_NODES or None,
+                        hop_limit=settings.NETWORK_EGO_HOP_LIMIT or None,
+                    )
+                    timings.append((time.perf_counter() - start) * 1000)
+                    sizes_found.append(int(mask.sum()))
+                timings.sort()
+                self.stdout.write(
+                    f'{"":>9} ego degree {degree}  adjacency {build:5.2f} s  '
+                    f'median {int(np.median(sizes_found))} names  '
+                    f'p50 {percentile(timings, 0.5):.2f} ms  p99 {percentile(timings, 0.99):.2f} ms'
+                )
+
+            # The graph store: full load, then patches of a few changed attestations
+            store = network.GraphStore()
+            instance_rows = list(zip(range(1, size + 1), name_ids.tolist(), fragment_ids.tolist()))
+            start = time.perf_counter()
+            store.load(
+                instance_rows,
+                list(zip(ids.tolist(), type_ids.tolist())),
+                [(fragment_id, 1, DATES[fragment_id % len(DATES)]) for fragment_id in range(1, fragment_count + 1)],
+            )
+            load = time.perf_counter() - start
+            timings = []
+            for step in range(options['patches']):
+                pks = rng.choice(size, 10, replace=False) + 1
+                rows = [
+                    (int(pk), int(rng.integers(1, name_count + 1)), int(rng.integers(1, fragment_count + 1)))
+                    for pk in pks[:8]
+                ] + [(size + step * 2 + 1, 1, 1), (size + step * 2 + 2, 2, 1)]
+                start = time.perf_counter()
+                store.update_instances(sorted(pks.tolist() + [row[0] for row in rows[8:]]), rows)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{"":>9} store  full load {load:5.2f} s  '
+                f'{store.describe()["memory_bytes"] / 2 ** 20:.0f} MiB  patch of 10 attestations  '
+                f'p50 {percentile(timings, 0.5):.1f} ms  p99 {percentile(timings, 0.99):.1f} ms'
+            )
+
+            # Per-period graphs of the date slices, in one pass (store.graph() would read the database)
+            graph = network.Graph()
+            graph.load(
+                store.name_ids, store.attestations, store.type_ids,
+                store.edge_keys >> network.KEY_SHIFT, store.edge_keys & network.KEY_MASK, store.edge_weights,
+            )
+            start = time.perf_counter()
+            _, _, _, (period, _, _, _) = store.periods(graph, [[date] for date in DATES])
+            periods = time.perf_counter() - start
+            self.stdout.write(
+                f'{"":>9} periods  {len(DATES)} date slices  {len(period)} edges in {periods * 1000:.0f} ms'
+            )
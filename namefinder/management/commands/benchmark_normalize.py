@@ -0,0 +1,124 @@
+"""
+Django management command to micro-benchmark search normalization.
+
+Compares Name.normalize_for_search and Name.normalize_many against the
+original step-by-step implementation (kept here as the reference) on a
+synthetic corpus of Hittite-style names, and checks they agree.
+"""
+import random
+import re
+import time
+import unicodedata
+from django.core.management.base import BaseCommand
+from namefinder.models import Name
+
+
+SYLLABLES = [
+    'ta', 'ḫa', 'ar', 'ku', 'pi', 'ya', 'mu', 'wa', 'at', 'ti', 'li', 'na',
+    'šu', 'zi', 'ḫu', 'ri', 'an', 'tar', 'ḫun', 'šar', 'ma', 'pa', 'du', 'ki',
+    'ša', 'ga', 'al', 'la', 'ip', 'ni', 'tu', 'kat', 'ḫi', 'aš', 'iš', 'me',
+    'bi', 'ṣa', 'ṭu', 'ḥe', 'ú', 'ù', 'é', 'ì', 'gi₅', 'nu', 'ḫé', 'ša₂',
+]
+
+DETERMINATIVES = ['<sup>d</sup>', '<sup>m</sup>', '<sup>f</sup>', '<sup>URU</sup>', '<sup>ḪUR.SAG</sup>', '°D°']
+
+DECORATIONS = [' ', '-', '.', ',', '_', '(', ')', '[', ']', '?', '!', '/', ' x ', '...', 'ʾ', 'ʿ', "'", '‘', '’', '<i>', '</i>']
+
+
+def reference_normalize_for_search(text):
+    """The original multi-pass Name.normalize_for_search, kept for equivalence checks"""
+    if not text:
+        return ""
+    text = re.sub(r'<[^>]+>', '', text)
+    text = text.lower()
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+    replacements = {
+        'ḫ': 'h', 'ḥ': 'h',
+        'š': 's', 'ṣ': 's',
+        'ṭ': 't', 'ț': 't',
+        'ž': 'z',
+        'ʾ': '', 'ʿ': '',
+        ": '', ": '',
+        '-': '', '_': '',
+        '.': '', ',': '',
+    }
+    for old, new in replacements.items():
+        text = text.replace(old, new)
+    sound_map = {
+        'g': 'k',
+        'b': 'p',
+        'd': 't',
+    }
+    for old, new in sound_map.items():
+        text = text.replace(old, new)
+    text = re.sub(r'[^a-z0-9]', '', text)
+    text = re.sub(r'(.)\1+', r'\1', text)
+    return text
+
+
+def hittite_corpus(size, seed=42):
+    """Synthetic names with determinatives, markup, damage marks and stray Unicode"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        parts = []
+        if rng.random() < 0.3:
+            parts.append(rng.choice(DETERMINATIVES))
+        for _ in range(rng.randint(1, 6)):
+            syllable = rng.choice(SYLLABLES)
+            if rng.random() < 0.15:
+                syllable = syllable.upper()
+            parts.append(syllable)
+            if rng.random() < 0.4:
+                parts.append(rng.choice(DECORATIONS))
+        if rng.random() < 0.05:
+            parts.append(chr(rng.randint(0x80, 0x3000)))
+        corpus.append(''.join(parts))
+    return corpus
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark Name.normalize_for_search against the original implementation'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=100000,
+            help='Number of synthetic names (default: 100000)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic corpus'
+        )
+
+    def handle(self, *args, **options):
+        corpus = hittite_corpus(options['size'], options['seed'])
+        self.stdout.write(f'Normalizing {len(corpus)} synthetic names...')
+
+        timings = {}
+        start = time.perf_counter()
+        expected = [reference_normalize_for_search(text) for text in corpus]
+        timings['reference'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        single = [Name.normalize_for_search(text) for text in corpus]
+        timings['normalize_for_search'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = Name.normalize_many(corpus)
+        timings['normalize_many'] = time.perf_counter() - start
+
+        for label, seconds in timings.items():
+            per_name = seconds / len(corpus) * 1e6 if corpus else 0
+            speedup = timings['reference'] / seconds if seconds else float('inf')
+            self.stdout.write(f'  {label:<22} {seconds * 1000:9.1f} ms  {per_name:6.2f} µs/name  {speedup:5.1f}x')
+
+        mismatches = sum(1 for a, b, c in zip(expected, single, batch) if not a == b == c)
+        if mismatches:
+            self.stderr.write(self.style.ERROR(f'{mismatches} names normalized differently'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All outputs identical to the reference'))
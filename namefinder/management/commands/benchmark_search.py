@@ -0,0 +1,146 @@
+"""
+Django management command to benchmark the name search.
+
+Builds throwaway SQLite databases filled with synthetic Hittite-like names
+and compares the old leading-wildcard LIKE filter with the FTS5 trigram
+index used by the search page. The project database is never touched.
+"""
+import random
+import sqlite3
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from namefinder import search
+from namefinder.models import Name
+
+
+SYLLABLES = [
+    'ta', 'ḫa', 'ar', 'ku', 'pi', 'ya', 'mu', 'wa', 'at', 'ti', 'li', 'na',
+    'šu', 'zi', 'ḫu', 'ri', 'an', 'tar', 'ḫun', 'šar', 'ma', 'pa', 'du', 'ki',
+    'ša', 'ga', 'al', 'la', 'ip', 'ni', 'tu', 'kat', 'ḫi', 'aš', 'iš', 'me',
+]
+
+DEFAULT_QUERIES = ['tarhun', 'Kattaḫḫa', 'zitiya', 'šarruma', 'pa']
+
+LIKE_SQL = (
+    "SELECT id FROM namefinder_name WHERE query LIKE ? ESCAPE '\\' "
+    "OR name LIKE ? ESCAPE '\\' OR variant_forms LIKE ? ESCAPE '\\' "
+    "OR correspondence LIKE ? ESCAPE '\\'"
+)
+
+FTS_SQL = (
+    f"SELECT id FROM namefinder_name WHERE id IN "
+    f"(SELECT rowid FROM {search.FTS_TABLE} WHERE {search.FTS_TABLE} MATCH ?)"
+)
+
+
+def synthetic_name(rng):
+    """A random hyphenated name built from common syllables"""
+    syllables = [rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5))]
+    name = ''.join(syllables).capitalize()
+    if rng.random() < 0.2:
+        name = '-'.join(syllables).capitalize()
+    return name
+
+
+def like_pattern(text):
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark LIKE scans against the trigram search index on synthetic names'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=str,
+            default='10000,100000,1000000',
+            help='Comma-separated table sizes to test (default: 10000,100000,1000000)'
+        )
+        parser.add_argument(
+            '--queries',
+            type=str,
+            default=','.join(DEFAULT_QUERIES),
+            help='Comma-separated search strings'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Runs per query; the median is reported (default: 5)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic data'
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+        queries = [q.strip() for q in options['queries'].split(',') if q.strip()]
+
+        for size in sizes:
+            self.stdout.write(f'\nBuilding {size} synthetic names...')
+            db = self.build_database(size, options['seed'])
+
+            self.stdout.write(f'{"query":<12} {"hits":>8} {"LIKE ms":>10} {"FTS ms":>10} {"speedup":>8}')
+            for query in queries:
+                like_ms, like_hits = self.time_query(db, LIKE_SQL, self.like_params(query), options['repeat'])
+                fts_params = self.fts_params(query)
+                if fts_params is None:
+                    self.stdout.write(f'{query:<12} {like_hits:>8} {like_ms:>10.2f} {"(LIKE)":>10}')
+                    continue
+                fts_ms, fts_hits = self.time_query(db, FTS_SQL, fts_params, options['repeat'])
+                speedup = like_ms / fts_ms if fts_ms else float('inf')
+                self.stdout.write(f'{query:<12} {fts_hits:>8} {like_ms:>10.2f} {fts_ms:>10.2f} {speedup:>7.1f}x')
+            db.close()
+
+    def build_database(self, size, seed):
+        """Create an in-memory copy of the name table with the search index"""
+        rng = random.Random(seed)
+        db = sqlite3.connect(':memory:')
+        db.execute(
+            'CREATE TABLE namefinder_name (id INTEGER PRIMARY KEY, name TEXT, '
+            'query TEXT, variant_forms TEXT, correspondence TEXT)'
+        )
+        db.execute('CREATE INDEX namefinder_name_query ON namefinder_name (query)')
+        for statement in search.FTS_SCHEMA:
+            db.execute(statement)
+
+        batch = []
+        for i in range(1, size + 1):
+            name = synthetic_name(rng)
+            variant = synthetic_name(rng) if rng.random() < 0.3 else None
+            combined = ' '.join(part for part in (name, variant) if part)
+            batch.append((i, name, Name.normalize_for_search(combined), variant, None))
+            if len(batch) == 10000:
+                db.executemany('INSERT INTO namefinder_name VALUES (?, ?, ?, ?, ?)', batch)
+                batch = []
+        if batch:
+            db.executemany('INSERT INTO namefinder_name VALUES (?, ?, ?, ?, ?)', batch)
+        db.commit()
+        return db
+
+    def like_params(self, query):
+        terms = search.text_search_terms(query)
+        # A column without a term (no normalized key) matches nothing: LIKE NULL
+        return [
+            like_pattern(terms[column]) if column in terms else None
+            for column in ('query', 'name', 'variant_forms', 'correspondence')
+        ]
+
+    def fts_params(self, query):
+        """Same MATCH as the search page, or None if it would fall back to LIKE"""
+        expression = search.match_expression(search.text_search_terms(query))
+        return None if expression is None else [expression]
+
+    def time_query(self, db, sql, params, repeat):
+        timings = []
+        hits = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            hits = len(db.execute(sql, params).fetchall())
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), hits
@@ -0,0 +1,109 @@
+"""
+Django management command to benchmark the name typeahead and fuzzy search.
+
+Loads synthetic Hittite-style names into a throwaway TypeaheadIndex and
+replays keystroke sequences (every prefix of random names, plus infixes),
+then looks up damaged copies of random names (one or two edits) with the
+fuzzy search. Reports build time and per-query latency percentiles. The
+result cache is disabled so every query is computed. The project database
+is never touched.
+"""
+import random
+import time
+from django.core.management.base import BaseCommand
+from namefinder.typeahead import TypeaheadIndex
+from namefinder.management.commands.benchmark_normalize import hittite_corpus
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def damage(rng, text):
+    """Apply one or two random character edits (substitute, drop or insert)"""
+    for _ in range(rng.randint(1, 2)):
+        i = rng.randrange(len(text))
+        edit = rng.choice(['substitute', 'drop', 'insert'])
+        if edit == 'substitute':
+            text = text[:i] + rng.choice('aeiuktpsrnlm') + text[i + 1:]
+        elif edit == 'drop' and len(text) > 3:
+            text = text[:i] + text[i + 1:]
+        else:
+            text = text[:i] + rng.choice('aeiuktpsrnlm') + text[i:]
+    return text
+
+
+def timed(function, queries):
+    timings = []
+    for q in queries:
+        start = time.perf_counter()
+        function(q)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings
+
+
+class Command(BaseCommand):
+    help = 'Benchmark typeahead and fuzzy search latency on synthetic names'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=str,
+            default='10000,100000,1000000',
+            help='Comma-separated numbers of names (default: 10000,100000,1000000)'
+        )
+        parser.add_argument(
+            '--typed',
+            type=int,
+            default=300,
+            help='Names whose keystrokes are replayed per size (default: 300)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic data'
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        for size in sizes:
+            rng = random.Random(options['seed'])
+            corpus = hittite_corpus(size, options['seed'])
+            rows = [(i + 1, name, None) for i, name in enumerate(corpus)]
+            counts = {i + 1: int(rng.paretovariate(1.2)) for i in range(size)}
+
+            index = TypeaheadIndex(result_cache_size=0)
+            start = time.perf_counter()
+            index.load(rows, counts)
+            build = time.perf_counter() - start
+
+            queries = []
+            for name in rng.sample(corpus, min(options['typed'], size)):
+                key = name.lower()
+                queries.extend(key[:length] for length in range(2, min(len(key), 10) + 1))
+                if len(key) > 5:
+                    start_at = rng.randint(1, len(key) - 4)
+                    queries.append(key[start_at:start_at + 4])
+
+            sources = rng.sample(range(size), min(options['typed'], size))
+            damaged = [damage(rng, corpus[i].lower()) for i in sources]
+
+            self.stdout.write(f'{size:>9} names  build {build:6.1f} s')
+            for label, function, batch in [
+                ('typeahead', lambda q: index.query(q, 20), queries),
+                ('fuzzy', lambda q: index.closest(q, 10), damaged),
+            ]:
+                timings = timed(function, batch)
+                self.stdout.write(
+                    f'  {label:<10} {len(batch):5} queries  p50 {percentile(timings, 0.5):.3f} ms  '
+                    f'p99 {percentile(timings, 0.99):.3f} ms  max {timings[-1]:.3f} ms'
+                )
+
+            # How often the undamaged name is among the suggestions
+            found = sum(
+                1 for i, q in zip(sources, damaged)
+                if i + 1 in {name_id for name_id, *_ in index.closest(q, 10)}
+            )
+            self.stdout.write(f'  fuzzy recall@10 {found / len(damaged):.1%}')
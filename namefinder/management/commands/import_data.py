@@ -5,11 +5,15 @@ Imports fragments, names, and instances from the Data Structure folder.
 import os
 from django.core.management.base import BaseCommand
 from django.db import transaction
+from django.db.models import Q
 import pandas as pd
 from namefinder.models import (
     NameType, WritingType, CompletenessType, PublicationType,
     Milieu, Series, Determinative, Fragment, Name, Instance
 )
+from namefinder import search
+from namefinder.signals import deferred_index_updates
+from namefinder.versioning import record_change
 
 
 def safe_get(row, column, default=None):
@@ -54,29 +58,34 @@ class Command(BaseCommand):
                 self.stderr.write(self.style.ERROR(f'File not found: {f}'))
                 return
         
-        if clear:
-            self.stdout.write('Clearing existing data...')
-            self.clear_data()
+        # Per-row index maintenance is skipped; the NameDate table is rebuilt once at the end
+        with deferred_index_updates():
+            if clear:
+                self.stdout.write('Clearing existing data...')
+                self.clear_data()
         
-        # Import in order (lookup tables first, then main tables)
-        with transaction.atomic():
-            self.stdout.write('Step 1/6: Creating lookup tables...')
-            self.create_lookup_tables()
+            # Import in order (lookup tables first, then main tables)
+            with transaction.atomic():
+                self.stdout.write('Step 1/6: Creating lookup tables...')
+                self.create_lookup_tables()
             
-            self.stdout.write('Step 2/6: Importing fragments...')
-            fragment_map = self.import_fragments(fragment_file)
+                self.stdout.write('Step 2/6: Importing fragments...')
+                fragment_map = self.import_fragments(fragment_file)
             
-            self.stdout.write('Step 3/6: Importing names...')
-            name_map = self.import_names(name_file)
+                self.stdout.write('Step 3/6: Importing names...')
+                name_map = self.import_names(name_file)
             
-            self.stdout.write('Step 4/6: Importing instances...')
-            self.import_instances(instance_file, name_map, fragment_map)
+                self.stdout.write('Step 4/6: Importing instances...')
+                self.import_instances(instance_file, name_map, fragment_map)
             
-            self.stdout.write('Step 5/6: Processing name determinatives...')
-            self.process_name_determinatives(name_file)
+                self.stdout.write('Step 5/6: Processing name determinatives...')
+                self.process_name_determinatives(name_file)
             
-            self.stdout.write('Step 6/6: Generating query fields...')
-            self.generate_query_fields()
+                self.stdout.write('Step 6/6: Generating query fields...')
+                self.generate_query_fields()
+        
+        # Triggers keep the search index in sync row by row; compact it once
+        search.optimize_index()
         
         self.stdout.write(self.style.SUCCESS('Import completed successfully!'))
         self.print_stats()
@@ -389,16 +398,18 @@ class Command(BaseCommand):
 
     def generate_query_fields(self):
         """Generate query fields for names that don't have them"""
-        names_without_query = Name.objects.filter(query__isnull=True) | Name.objects.filter(query='')
-        count = 0
+        names_without_query = [
+            name_obj for name_obj in Name.objects.filter(Q(query__isnull=True) | Q(query=''))
+            if name_obj.name
+        ]
         
-        for name_obj in names_without_query:
-            if name_obj.name:
-                name_obj.query = Name.normalize_for_search(name_obj.name)
-                name_obj.save(update_fields=['query'])
-                count += 1
+        queries = Name.normalize_many(name_obj.search_text() for name_obj in names_without_query)
+        for name_obj, query in zip(names_without_query, queries):
+            name_obj.query = query
+        Name.objects.bulk_update(names_without_query, ['query'], batch_size=1000)
+        record_change('name', 'bulk')
         
-        self.stdout.write(f'  Generated query fields for {count} names')
+        self.stdout.write(f'  Generated query fields for {len(names_without_query)} names')
 
     def print_stats(self):
         """Print final statistics"""
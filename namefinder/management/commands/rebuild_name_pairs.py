@@ -0,0 +1,26 @@
+"""
+Django management command to rebuild the name co-occurrence pair table.
+
+NamePair rows are normally kept in sync by the Instance signal handlers;
+this command recomputes the whole table from the attestations with one
+grouped query (e.g. after raw SQL edits or restoring a database copy).
+"""
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from namefinder.cooccurrence import rebuild_name_pairs
+from namefinder.models import NamePair
+from namefinder.versioning import record_change
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the name co-occurrence pair table from the attestations'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with transaction.atomic():
+            rebuild_name_pairs()
+            record_change('instance', 'bulk')
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {NamePair.objects.count()} name pairs in {time.perf_counter() - start:.1f} s'
+        ))
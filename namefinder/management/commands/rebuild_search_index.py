@@ -0,0 +1,31 @@
+"""
+Django management command to rebuild the search indexes.
+
+The FTS5 indexes are normally kept in sync by database triggers and the
+denormalized NameDate/NameVariant tables and Instance.sign_key by signal
+handlers and model saves; this command rebuilds them from scratch (e.g.
+after restoring a database copy made without the triggers or raw SQL edits)
+and compacts the FTS indexes afterwards.
+"""
+from django.core.management.base import BaseCommand
+from namefinder import search
+from namefinder.models import Name
+from namefinder.signals import rebuild_indexes
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text, variant, spelling and date search indexes'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding name dates and variants...')
+        rebuild_indexes()
+        self.stdout.write(f'Updated the sign keys of {search.rebuild_sign_keys()} attestations')
+
+        if not search.fts_available():
+            self.stdout.write(self.style.WARNING('Search index requires SQLite - nothing to do'))
+            return
+
+        self.stdout.write(f'Indexing {Name.objects.count()} names...')
+        search.rebuild_index()
+        search.optimize_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -8,6 +8,7 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from collections import defaultdict
 from namefinder.models import Instance
+from namefinder.signals import deferred_index_updates
 
 
 class Command(BaseCommand):
@@ -83,7 +84,8 @@ class Command(BaseCommand):
         
         # Delete duplicates
         if not dry_run:
-            with transaction.atomic():
+            # Rebuild the derived tables once rather than per deleted row
+            with transaction.atomic(), deferred_index_updates():
                 deleted_count, _ = Instance.objects.filter(pk__in=ids_to_delete).delete()
                 self.stdout.write(self.style.SUCCESS(f'\nDeleted {deleted_count} duplicate instances'))
         else:
@@ -11,6 +11,7 @@ from namefinder.models import (
     Instance, Name, Fragment, NameType, WritingType, 
     CompletenessType, Determinative
 )
+from namefinder.signals import deferred_index_updates
 
 
 class Command(BaseCommand):
@@ -92,7 +93,8 @@ class Command(BaseCommand):
         restored = 0
         errors = 0
         
-        with transaction.atomic():
+        # Rebuild the derived tables once rather than per restored row
+        with transaction.atomic(), deferred_index_updates():
             for _, row in rows_to_restore.iterrows():
                 try:
                     original_id = int(row['Instance_ID'])
@@ -0,0 +1,79 @@
+"""
+Django management command running the background network jobs.
+
+Runs as its own long-lived process next to the web server (see
+deploy/laman-network-jobs.service): it claims queued NetworkJob rows and
+computes them in a pool of --workers processes, which keep their graph
+store and caches between jobs. Jobs left running by a previous runner are
+queued again on start, and expired jobs are removed as it goes.
+--once processes the current queue in this process and exits.
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from namefinder import jobs, pool
+
+
+class Command(BaseCommand):
+    help = 'Run queued network jobs in a process pool outside the web workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.NETWORK_JOB_WORKERS,
+            help=f'Job processes (default: {settings.NETWORK_JOB_WORKERS})'
+        )
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=1.0,
+            help='Seconds between checks of the queue (default: 1)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the queued jobs in this process, then exit'
+        )
+
+    def handle(self, *args, **options):
+        requeued = jobs.requeue_running()
+        if requeued:
+            self.stdout.write(f'Queued {requeued} interrupted jobs again')
+
+        if options['once']:
+            with pool.inline():
+                for pk in jobs.claim(limit=None):
+                    self.report(pk, jobs.run(pk))
+            jobs.expire()
+            return
+
+        # Fresh processes: no inherited database connections or threads
+        executor = ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=pool.start_job_process,
+        )
+        running = {}
+        self.stdout.write(f'Running network jobs with {options["workers"]} workers')
+        try:
+            while True:
+                for pk in jobs.claim(options['workers'] - len(running)):
+                    running[executor.submit(jobs.run, pk)] = pk
+                if running:
+                    done, _ = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.report(running.pop(future), future.result())
+                else:
+                    jobs.expire()
+                    time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def report(self, pk, status):
+        style = self.style.SUCCESS if status == 'done' else self.style.ERROR
+        self.stdout.write(style(f'{pk} {status}'))
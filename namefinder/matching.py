@@ -0,0 +1,95 @@
+"""
+Batch reconciliation of raw name strings against LAMAN.
+
+Each input is normalized with Name.normalize_for_search and looked up in
+hash indexes on Name.query and NameVariant.key; inputs matching neither get
+fuzzy candidates from the typeahead index. The hash indexes are built once
+per process and rebuilt when the 'name' data version changes (variant rows
+only change with their name).
+"""
+import threading
+from .models import Name, NameVariant
+from .typeahead import nearest_names
+from .versioning import current_version
+
+
+# Match types, best first
+EXACT = 'exact'
+VARIANT = 'variant'
+FUZZY = 'fuzzy'
+NO_MATCH = 'none'
+
+
+class MatchIndex:
+    """Normalized name and variant keys to name ids, at one data version"""
+
+    def __init__(self, version):
+        self.version = version
+        self.labels = {}
+        self.by_query = {}
+        for name_id, name, query in Name.objects.order_by().values_list('id', 'name', 'query').iterator(chunk_size=5000):
+            self.labels[name_id] = name
+            if query:
+                self.by_query.setdefault(query, []).append(name_id)
+        self.by_variant = {}
+        for name_id, key in NameVariant.objects.order_by().values_list('name_id', 'key').iterator(chunk_size=5000):
+            ids = self.by_variant.setdefault(key, [])
+            if name_id not in ids:
+                ids.append(name_id)
+
+    def lookup(self, key):
+        """(match type, name ids) for a normalized key, without fuzzy matching"""
+        if key in self.by_query:
+            return EXACT, self.by_query[key]
+        if key in self.by_variant:
+            return VARIANT, self.by_variant[key]
+        return NO_MATCH, []
+
+
+class MatchIndexRegistry:
+    """Holds the current MatchIndex of this process"""
+
+    def __init__(self):
+        self.index = None
+        self.lock = threading.Lock()
+
+    def current(self):
+        version = current_version('name')
+        index = self.index
+        if index is None or index.version != version:
+            with self.lock:
+                if self.index is None or self.index.version != version:
+                    self.index = MatchIndex(version)
+                index = self.index
+        return index
+
+    def clear(self):
+        self.index = None
+
+
+registry = MatchIndexRegistry()
+
+
+def match_names(raw_names, fuzzy=True, candidates=5):
+    """
+    Yield one result dict per input string, in input order: the input, its
+    normalized key, the match type and the matching names. Repeated inputs
+    are answered from a per-batch memo.
+    """
+    index = registry.current()
+    memo = {}
+    for raw in raw_names:
+        key = Name.normalize_for_search(raw) if isinstance(raw, str) else ''
+        if key not in memo:
+            match, ids = index.lookup(key) if key else (NO_MATCH, [])
+            matches = [{'id': name_id, 'name': index.labels.get(name_id, '')} for name_id in ids]
+            if match == NO_MATCH and fuzzy and key:
+                matches = [
+                    {'id': name_id, 'name': name, 'distance': distance}
+                    for name_id, name, _, _, distance in nearest_names(key, candidates)
+                ]
+                if matches:
+                    match = FUZZY
+            memo[key] = (match, matches)
+        match, matches = memo[key]
+        yield {'input': raw, 'normalized': key, 'match': match, 'names': matches}
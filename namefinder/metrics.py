@@ -0,0 +1,150 @@
+"""
+Centrality of the names of a network, to rank key persons and deities.
+
+Computed in NumPy on the edge arrays of the filtered network, like the
+rest of the network engine: degree and weighted degree (shared fragments)
+are bincounts, PageRank and eigenvector centrality are power iterations
+whose sparse matrix-vector products are bincounts over the edges, and
+betweenness runs Brandes' algorithm over hop distances, one breadth-first
+level at a time, from a sample of BETWEENNESS_SAMPLES names (every name of
+smaller networks), scaled up to all names. Scores match networkx's
+pagerank, eigenvector_centrality (weighted by shared fragments) and
+normalized betweenness_centrality.
+
+Results are cached per filter set and data version (see pool.py). After a
+data change, the previous scores of the same filters seed the power
+iterations, which then converge in a few steps.
+"""
+import numpy as np
+from . import network
+from .pool import ResultCache
+
+
+METRICS = ('degree', 'weighted_degree', 'pagerank', 'eigenvector', 'betweenness')
+# Damping factor of PageRank
+DAMPING = 0.85
+# Power iterations at most, and the mean change per name at which they stop
+MAX_ITERATIONS = 200
+TOLERANCE = 1e-10
+# Source names of the betweenness estimate, and the seed of their sample
+BETWEENNESS_SAMPLES = 200
+SEED = 42
+
+
+def _product(count, sources, targets, weights, values):
+    """A @ values for the symmetric weighted adjacency matrix A of some edges"""
+    return (np.bincount(sources, weights * values[targets], count)
+            + np.bincount(targets, weights * values[sources], count))
+
+
+def pagerank(count, sources, targets, weights, initial=None):
+    """PageRank of `count` names joined by weighted edges between positions"""
+    strength = np.bincount(sources, weights, count) + np.bincount(targets, weights, count)
+    dangling = strength == 0
+    rank = np.full(count, 1.0 / count) if initial is None else initial / initial.sum()
+    for _ in range(MAX_ITERATIONS):
+        share = np.where(dangling, 0.0, rank) / np.where(dangling, 1.0, strength)
+        previous, rank = rank, (
+            DAMPING * (_product(count, sources, targets, weights, share) + rank[dangling].sum() / count)
+            + (1 - DAMPING) / count
+        )
+        if np.abs(rank - previous).sum() < count * TOLERANCE:
+            break
+    return rank
+
+
+def eigenvector(count, sources, targets, weights, initial=None):
+    """Eigenvector centrality (unit length) by power iteration on A + I"""
+    values = np.ones(count) if initial is None else initial.copy()
+    values /= np.linalg.norm(values)
+    for _ in range(MAX_ITERATIONS):
+        previous, values = values, values + _product(count, sources, targets, weights, values)
+        values /= np.linalg.norm(values) or 1.0
+        if np.abs(values - previous).sum() < count * TOLERANCE:
+            break
+    return values
+
+
+def betweenness(count, sources, targets, samples=BETWEENNESS_SAMPLES):
+    """
+    Normalized betweenness over shortest paths in hops, counted from
+    `samples` random names when there are more
+    """
+    if count < 3:
+        return np.zeros(count)
+    ends = np.concatenate([sources, targets])
+    order = np.argsort(ends, kind='stable')
+    neighbors = np.concatenate([targets, sources])[order]
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ends, minlength=count), out=indptr[1:])
+
+    chosen = np.arange(count)
+    if count > samples:
+        chosen = np.sort(np.random.default_rng(SEED).choice(count, samples, replace=False))
+    centrality = np.zeros(count)
+    for source in chosen.tolist():
+        distance = np.full(count, -1, dtype=np.int64)
+        distance[source] = 0
+        paths = np.zeros(count)
+        paths[source] = 1.0
+        frontier, levels, depth = np.array([source]), [], 0
+        while len(frontier):
+            # Every edge from this level, then those leading one level deeper
+            sizes = indptr[frontier + 1] - indptr[frontier]
+            starts = np.repeat(frontier, sizes)
+            entries = np.repeat(indptr[frontier] - (np.cumsum(sizes) - sizes), sizes) + np.arange(int(sizes.sum()))
+            reached = neighbors[entries]
+            distance[reached[distance[reached] < 0]] = depth + 1
+            onward = distance[reached] == depth + 1
+            starts, reached = starts[onward], reached[onward]
+            paths += np.bincount(reached, paths[starts], count)
+            levels.append((starts, reached))
+            frontier = np.unique(reached)
+            depth += 1
+        # Dependencies, from the deepest level back to the source
+        dependency = np.zeros(count)
+        for starts, reached in reversed(levels):
+            dependency += np.bincount(starts, paths[starts] / paths[reached] * (1 + dependency[reached]), count)
+        dependency[source] = 0.0
+        centrality += dependency
+    return centrality * count / len(chosen) / ((count - 1) * (count - 2))
+
+
+def centrality(node_ids, sources, targets, weights, initial=None):
+    """
+    (node_ids, {metric: scores}) of a graph given as sorted node ids and
+    edges between positions in them. `initial` is a previous result whose
+    PageRank and eigenvector scores seed the power iterations. Runs in the
+    pool processes.
+    """
+    count = len(node_ids)
+    weights = np.asarray(weights, dtype=float)
+    starts = {'pagerank': None, 'eigenvector': None}
+    if initial is not None:
+        previous_ids, previous = initial
+        at = network.positions(previous_ids, node_ids)
+        for metric in starts:
+            # Names new to the graph start from the mean score
+            known = previous[metric][at[at >= 0]]
+            start = np.full(count, known.mean() if len(known) else 1.0)
+            start[at >= 0] = known
+            starts[metric] = np.maximum(start, 1e-12)
+    return node_ids, {
+        'degree': network.degrees(count, sources, targets),
+        'weighted_degree': (np.bincount(sources, weights, count) + np.bincount(targets, weights, count)).astype(np.int64),
+        'pagerank': pagerank(count, sources, targets, weights, starts['pagerank']),
+        'eigenvector': eigenvector(count, sources, targets, weights, starts['eigenvector']),
+        'betweenness': betweenness(count, sources, targets),
+    }
+
+
+def warm_start(previous, node_ids, sources, targets, weights):
+    """The previous scores, if they cover at least half of the new graph's names"""
+    previous_ids = previous[0]
+    if len(node_ids) and len(previous_ids):
+        if (network.positions(previous_ids, node_ids) >= 0).sum() * 2 >= len(node_ids):
+            return previous
+    return None
+
+
+cache = ResultCache(centrality, warm_start)
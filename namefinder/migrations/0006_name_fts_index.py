@@ -0,0 +1,70 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import migrations
+
+
+FTS_TABLE = 'namefinder_name_fts'
+COLUMNS = 'name, query, variant_forms, correspondence'
+NEW_VALUES = 'new.name, new.query, new.variant_forms, new.correspondence'
+OLD_VALUES = 'old.name, old.query, old.variant_forms, old.correspondence'
+
+CREATE_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        {COLUMNS},
+        content='namefinder_name', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON namefinder_name BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {COLUMNS}) VALUES (new.id, {NEW_VALUES});
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON namefinder_name BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS}) VALUES ('delete', old.id, {OLD_VALUES});
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF {COLUMNS} ON namefinder_name BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS}) VALUES ('delete', old.id, {OLD_VALUES});
+        INSERT INTO {FTS_TABLE}(rowid, {COLUMNS}) VALUES (new.id, {NEW_VALUES});
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+DROP_STATEMENTS = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def check_trigram_support(connection):
+    """FTS5's trigram tokenizer needs SQLite 3.34 or later, compiled with FTS5"""
+    version = connection.Database.sqlite_version
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE VIRTUAL TABLE temp.namefinder_trigram_check USING fts5(text, tokenize='trigram')")
+            cursor.execute('DROP TABLE temp.namefinder_trigram_check')
+    except Exception as error:
+        raise ImproperlyConfigured(
+            f'The name search index needs SQLite 3.34 or later with FTS5 and its trigram tokenizer; '
+            f'this Python uses SQLite {version} ({error}). Upgrade SQLite and migrate again.'
+        ) from error
+
+
+def run_statements(statements, check=False):
+    """The trigram index is SQLite-only; other backends keep using LIKE scans"""
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        if check:
+            check_trigram_support(schema_editor.connection)
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('namefinder', '0005_add_fragment_cth_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_statements(CREATE_STATEMENTS, check=True), run_statements(DROP_STATEMENTS)),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.10 on 2026-10-16 23:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('namefinder', '0006_name_fts_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_type', models.CharField(choices=[('name', 'Name'), ('fragment', 'Fragment'), ('instance', 'Attestation'), ('lookup', 'Lookup table')], max_length=20)),
+                ('action', models.CharField(choices=[('save', 'Saved'), ('delete', 'Deleted'), ('bulk', 'Bulk change')], max_length=10)),
+                ('object_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Data Change',
+                'verbose_name_plural': 'Data Changes',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['model_type', 'id'], name='namefinder__model_t_884b2d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.10 on 2026-10-16 23:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('namefinder', '0007_datachange'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='name',
+            index=models.Index(fields=['query', 'name', 'id'], name='name_search_order_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.10 on 2026-10-16 23:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_name_dates(apps, schema_editor):
+    Instance = apps.get_model('namefinder', 'Instance')
+    NameDate = apps.get_model('namefinder', 'NameDate')
+    pairs = Instance.objects.filter(
+        name__isnull=False, fragment__date__isnull=False
+    ).exclude(fragment__date='').order_by().values_list('name_id', 'fragment__date').distinct()
+    NameDate.objects.bulk_create(
+        [NameDate(name_id=name_id, date=date) for name_id, date in pairs],
+        batch_size=5000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('namefinder', '0008_name_search_order_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NameDate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.CharField(max_length=100)),
+                ('name', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dates', to='namefinder.name')),
+            ],
+            options={
+                'verbose_name': 'Name Date',
+                'verbose_name_plural': 'Name Dates',
+                'ordering': ['date'],
+                'unique_together': {('date', 'name')},
+            },
+        ),
+        migrations.RunPython(populate_name_dates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,150 @@
+import re
+import unicodedata
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+FTS_TABLE = 'namefinder_namevariant_fts'
+
+CREATE_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        key,
+        content='namefinder_namevariant', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON namefinder_namevariant BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, key) VALUES (new.id, new.key);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON namefinder_namevariant BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, key) VALUES ('delete', old.id, old.key);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF key ON namefinder_namevariant BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, key) VALUES ('delete', old.id, old.key);
+        INSERT INTO {FTS_TABLE}(rowid, key) VALUES (new.id, new.key);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+DROP_STATEMENTS = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def run_statements(statements):
+    """The trigram index is SQLite-only; other backends keep using LIKE scans"""
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+# Frozen copies of Name.normalize_for_search and split_variants as of this
+# migration: later changes to models.py must not change what it writes
+
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+REPEATED_CHAR_RE = re.compile(r'(.)\1+')
+SEARCH_REPLACEMENTS = {
+    'ḫ': 'h', 'ḥ': 'h',
+    'š': 's', 'ṣ': 's',
+    'ṭ': 't', 'ț': 't',
+    'ž': 'z',
+}
+SEARCH_SOUND_MAP = {'g': 'k', 'b': 'p', 'd': 't'}
+SEARCH_KEEP = set('abcdefghijklmnopqrstuvwxyz0123456789')
+VARIANT_SEPARATOR_RE = re.compile(r'\s*(?:[;,\n]|<br\s*/?>)\s*', re.IGNORECASE)
+
+
+class SearchCharTable(dict):
+    """str.translate table: lowercase, strip diacritics, map sounds, drop punctuation"""
+
+    def __missing__(self, codepoint):
+        result = []
+        for c in unicodedata.normalize('NFD', chr(codepoint).lower()):
+            if unicodedata.category(c) == 'Mn':
+                continue
+            c = SEARCH_REPLACEMENTS.get(c, c)
+            c = SEARCH_SOUND_MAP.get(c, c)
+            if c in SEARCH_KEEP:
+                result.append(c)
+        value = self[codepoint] = ''.join(result)
+        return value
+
+
+SEARCH_CHAR_TABLE = SearchCharTable()
+
+
+def normalize_for_search(text):
+    if not text:
+        return ''
+    text = HTML_TAG_RE.sub('', text).translate(SEARCH_CHAR_TABLE)
+    return REPEATED_CHAR_RE.sub(r'\1', text)
+
+
+def split_variants(text):
+    if not text:
+        return []
+    return list(dict.fromkeys(part for part in VARIANT_SEPARATOR_RE.split(text.strip()) if part))
+
+
+def populate_variants(apps, schema_editor):
+    Name = apps.get_model('namefinder', 'Name')
+    NameVariant = apps.get_model('namefinder', 'NameVariant')
+    rows = []
+    names = []
+    for name in Name.objects.only('id', 'name', 'query', 'variant_forms', 'correspondence').iterator(chunk_size=2000):
+        # `query` now holds only the normalized name
+        if name.name:
+            name.query = normalize_for_search(name.name)
+            names.append(name)
+        for kind, field in (('variant', name.variant_forms), ('correspondence', name.correspondence)):
+            # Positions count only the entries with a key, like search._variant_rows
+            entries = [(text, normalize_for_search(text)) for text in split_variants(field)]
+            for position, (text, key) in enumerate(entry for entry in entries if entry[1]):
+                rows.append(NameVariant(name_id=name.id, kind=kind, position=position,
+                                        text=text[:500], key=key[:500]))
+    NameVariant.objects.bulk_create(rows, batch_size=5000)
+    Name.objects.bulk_update(names, ['query'], batch_size=2000)
+
+
+def restore_combined_query(apps, schema_editor):
+    """Before 0010, `query` held the name, variants and correspondence together"""
+    Name = apps.get_model('namefinder', 'Name')
+    names = []
+    for name in Name.objects.only('id', 'name', 'query', 'variant_forms', 'correspondence').iterator(chunk_size=2000):
+        combined = ' '.join(part for part in (name.name, name.variant_forms, name.correspondence) if part)
+        if combined:
+            name.query = normalize_for_search(combined)
+            names.append(name)
+    Name.objects.bulk_update(names, ['query'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('namefinder', '0009_namedate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NameVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('variant', 'Variant form'), ('correspondence', 'Correspondence')], max_length=20)),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('text', models.CharField(max_length=500)),
+                ('key', models.CharField(db_index=True, help_text='Normalized text (Name.normalize_for_search)', max_length=500)),
+                ('name', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='namefinder.name')),
+            ],
+            options={
+                'verbose_name': 'Name Variant',
+                'verbose_name_plural': 'Name Variants',
+                'ordering': ['name', 'kind', 'position'],
+            },
+        ),
+        migrations.RunPython(run_statements(CREATE_STATEMENTS), run_statements(DROP_STATEMENTS)),
+        migrations.RunPython(populate_variants, restore_combined_query),
+    ]
@@ -0,0 +1,123 @@
+import re
+import unicodedata
+from django.db import migrations, models
+
+
+FTS_TABLE = 'namefinder_instance_signs_fts'
+
+CREATE_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        sign_key,
+        content='namefinder_instance', content_rowid='id', tokenize="unicode61 tokenchars '{{}}'"
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON namefinder_instance BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, sign_key) VALUES (new.id, new.sign_key);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON namefinder_instance BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, sign_key) VALUES ('delete', old.id, old.sign_key);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF sign_key ON namefinder_instance BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, sign_key) VALUES ('delete', old.id, old.sign_key);
+        INSERT INTO {FTS_TABLE}(rowid, sign_key) VALUES (new.id, new.sign_key);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+DROP_STATEMENTS = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def run_statements(statements):
+    """The sign index is SQLite-only; other backends keep using LIKE scans"""
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+# Frozen copy of models.spelling_signs as of this migration: later changes
+# to models.py must not change what it writes
+
+SPELLING_DETERMINATIVE_RE = re.compile(r'<sup>(.*?)</sup>|\{(.*?)\}|°(.*?)°', re.IGNORECASE | re.DOTALL)
+SPELLING_TAG_RE = re.compile(r'</?(?:i|b|u|em|strong|span|sub|small|br)\b[^>]*>', re.IGNORECASE)
+SPELLING_MARKS_RE = re.compile(r'[\[\]⸢⸣⌈⌉˹˺()<>?!#*"“”…]')
+SPELLING_SEPARATOR_RE = re.compile(r'[\s\-‐–=+.:/]+')
+SPELLING_DETERMINATIVE_SPLIT_RE = re.compile(r'(\{[^{}]*\})')
+DETERMINATIVE_ALIASES = {'1': 'm', 'i': 'm'}
+
+
+def fold_sign(text, keep_digits=False):
+    text = unicodedata.normalize('NFKD', text).lower()
+    return ''.join(ch for ch in text if 'a' <= ch <= 'z' or (keep_digits and '0' <= ch <= '9'))
+
+
+def spelling_signs(text):
+    if not text:
+        return []
+    text = SPELLING_DETERMINATIVE_RE.sub(
+        lambda m: ' {' + next(group for group in m.groups() if group is not None) + '} ', text
+    )
+    text = SPELLING_TAG_RE.sub('', text)
+
+    # Runs of superscript letters are determinatives too
+    chars = []
+    in_superscript = False
+    for ch in text:
+        decomposition = unicodedata.decomposition(ch)
+        if decomposition.startswith('<super>'):
+            if not in_superscript:
+                chars.append(' {')
+                in_superscript = True
+            chars.append(chr(int(decomposition.split()[1], 16)))
+            continue
+        if in_superscript:
+            chars.append('} ')
+            in_superscript = False
+        chars.append(ch)
+    if in_superscript:
+        chars.append('} ')
+
+    tokens = []
+    for part in SPELLING_DETERMINATIVE_SPLIT_RE.split(''.join(chars)):
+        if part.startswith('{') and part.endswith('}'):
+            determinative = fold_sign(part[1:-1], keep_digits=True)
+            if determinative:
+                tokens.append('{' + DETERMINATIVE_ALIASES.get(determinative, determinative) + '}')
+            continue
+        for sign in SPELLING_SEPARATOR_RE.split(SPELLING_MARKS_RE.sub('', part)):
+            sign = fold_sign(sign)
+            if sign:
+                tokens.append(sign)
+    return tokens
+
+
+def populate_sign_keys(apps, schema_editor):
+    Instance = apps.get_model('namefinder', 'Instance')
+    instances = []
+    for instance in Instance.objects.exclude(spelling__isnull=True).exclude(spelling='').only('id', 'spelling').iterator(chunk_size=2000):
+        instance.sign_key = ' '.join(spelling_signs(instance.spelling))
+        instances.append(instance)
+    Instance.objects.bulk_update(instances, ['sign_key'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('namefinder', '0010_namevariant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instance',
+            name='sign_key',
+            field=models.TextField(blank=True, default='', help_text='Sign tokens of the spelling, space-separated (for sign-level search)'),
+        ),
+        migrations.RunPython(populate_sign_keys, migrations.RunPython.noop),
+        migrations.RunPython(run_statements(CREATE_STATEMENTS), run_statements(DROP_STATEMENTS)),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.10 on 2026-10-17 00:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+POPULATE_SQL = """
+    INSERT INTO namefinder_namepair (name_a_id, name_b_id, shared_fragments)
+    SELECT a.name_id, b.name_id, COUNT(*)
+    FROM (SELECT DISTINCT name_id, fragment_id FROM namefinder_instance
+          WHERE name_id IS NOT NULL AND fragment_id IS NOT NULL) a
+    JOIN (SELECT DISTINCT name_id, fragment_id FROM namefinder_instance
+          WHERE name_id IS NOT NULL AND fragment_id IS NOT NULL) b
+      ON a.fragment_id = b.fragment_id AND a.name_id < b.name_id
+    GROUP BY a.name_id, b.name_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('namefinder', '0011_instance_sign_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NamePair',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shared_fragments', models.PositiveIntegerField(default=0, help_text='Number of fragments on which both names are attested')),
+                ('name_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pairs_as_a', to='namefinder.name')),
+                ('name_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pairs_as_b', to='namefinder.name')),
+            ],
+            options={
+                'verbose_name': 'Name Pair',
+                'verbose_name_plural': 'Name Pairs',
+                'ordering': ['name_a', 'name_b'],
+                'unique_together': {('name_a', 'name_b')},
+            },
+        ),
+        migrations.RunSQL(POPULATE_SQL, migrations.RunSQL.noop),
+    ]
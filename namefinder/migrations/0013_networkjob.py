@@ -0,0 +1,33 @@
+# Generated by Django 5.2.10 on 2026-10-17 01:00
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('namefinder', '0012_namepair'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NetworkJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('query', models.TextField(help_text='Query string of the network request, parameters sorted')),
+                ('version', models.PositiveBigIntegerField(help_text='Data version the request was made at')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='queued', max_length=10)),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Network Job',
+                'verbose_name_plural': 'Network Jobs',
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-17 01:44
+
+from django.db import migrations
+
+
+def drop_duplicate_jobs(apps, schema_editor):
+    """Keep one job per (query, version): one that did not fail, then the newest"""
+    NetworkJob = apps.get_model('namefinder', 'NetworkJob')
+    jobs = NetworkJob.objects.order_by('-created_at').values_list('pk', 'query', 'version', 'status')
+    seen = set()
+    duplicates = []
+    for pk, query, version, status in sorted(jobs, key=lambda job: job[3] == 'failed'):
+        if (query, version) in seen:
+            duplicates.append(pk)
+        seen.add((query, version))
+    NetworkJob.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('namefinder', '0013_networkjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='networkjob',
+            unique_together={('query', 'version')},
+        ),
+    ]
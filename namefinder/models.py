@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 import re
 import unicodedata
 import json
+import uuid
 
 
 # =============================================================================
@@ -100,6 +101,147 @@ class Determinative(models.Model):
         return self.name
 
 
+# =============================================================================
+# Search Normalization
+# =============================================================================
+
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+REPEATED_CHAR_RE = re.compile(r'(.)\1+')
+
+
+def collapse_repeated(text):
+    """Collapse runs of the same character (searching first is cheaper than always substituting)"""
+    if REPEATED_CHAR_RE.search(text) is None:
+        return text
+    return REPEATED_CHAR_RE.sub(lambda match: match.group(1), text)
+
+# Letters mapped explicitly in case they are not decomposed by NFD
+SEARCH_REPLACEMENTS = {
+    'ḫ': 'h', 'ḥ': 'h',
+    'š': 's', 'ṣ': 's',
+    'ṭ': 't', 'ț': 't',
+    'ž': 'z',
+}
+
+# Similar sounds searched as one
+SEARCH_SOUND_MAP = {
+    'g': 'k',
+    'b': 'p',
+    'd': 't',
+}
+
+SEARCH_KEEP = set('abcdefghijklmnopqrstuvwxyz0123456789')
+
+
+def normalize_search_char(char):
+    """Lowercase, strip diacritics, map sounds and drop punctuation for one character"""
+    decomposed = unicodedata.normalize('NFD', char.lower())
+    result = []
+    for c in decomposed:
+        if unicodedata.category(c) == 'Mn':
+            continue
+        c = SEARCH_REPLACEMENTS.get(c, c)
+        c = SEARCH_SOUND_MAP.get(c, c)
+        if c in SEARCH_KEEP:
+            result.append(c)
+    return ''.join(result)
+
+
+class SearchCharTable(dict):
+    """
+    str.translate table for Name.normalize_for_search.
+    Latin ranges are precomputed; other code points are filled in on first use.
+    """
+    
+    def __missing__(self, codepoint):
+        value = self[codepoint] = normalize_search_char(chr(codepoint))
+        return value
+
+
+SEARCH_CHAR_TABLE = SearchCharTable(
+    (codepoint, normalize_search_char(chr(codepoint)))
+    for codepoint in [*range(0x250), *range(0x1E00, 0x1F00), 0x2BE, 0x2BF, 0x2018, 0x2019]
+)
+
+# Separators between the entries of variant_forms / correspondence
+VARIANT_SEPARATOR_RE = re.compile(r'\s*(?:[;,\n]|<br\s*/?>)\s*', re.IGNORECASE)
+
+
+def split_variants(text):
+    """Distinct entries of a variant_forms or correspondence text, in order"""
+    if not text:
+        return []
+    return list(dict.fromkeys(part for part in VARIANT_SEPARATOR_RE.split(text.strip()) if part))
+
+
+# Determinatives written as <sup>d</sup>, {d} or °d°
+SPELLING_DETERMINATIVE_RE = re.compile(r'<sup>(.*?)</sup>|\{(.*?)\}|°(.*?)°', re.IGNORECASE | re.DOTALL)
+# Formatting tags; other <...> are editorial (omitted signs) and keep their content
+SPELLING_TAG_RE = re.compile(r'</?(?:i|b|u|em|strong|span|sub|small|br)\b[^>]*>', re.IGNORECASE)
+# Editorial brackets and marks, dropped before splitting
+SPELLING_MARKS_RE = re.compile(r'[\[\]⸢⸣⌈⌉˹˺()<>?!#*"“”…]')
+SPELLING_SEPARATOR_RE = re.compile(r'[\s\-‐–=+.:/]+')
+SPELLING_DETERMINATIVE_SPLIT_RE = re.compile(r'(\{[^{}]*\})')
+# Spellings of the same determinative
+DETERMINATIVE_ALIASES = {'1': 'm', 'i': 'm'}
+
+
+def fold_sign(text, keep_digits=False):
+    """Plain lowercase ASCII letters of a sign (ḫ -> h, š -> s, á -> a); digits (sign indices) are dropped"""
+    text = unicodedata.normalize('NFKD', text).lower()
+    return ''.join(
+        ch for ch in text
+        if 'a' <= ch <= 'z' or (keep_digits and '0' <= ch <= '9')
+    )
+
+
+def spelling_signs(text):
+    """
+    Sign tokens of an attestation spelling, for sign-level search:
+    'ᵐta-ḫa-aš₂' -> ['{m}', 'ta', 'ha', 'as']. Determinatives (superscripts,
+    <sup>, braces, degree signs) become '{...}' tokens, signs are split on
+    hyphens, dots, spaces and clitic marks and folded without sign indices,
+    and editorial brackets are dropped.
+    """
+    if not text:
+        return []
+    text = SPELLING_DETERMINATIVE_RE.sub(
+        lambda m: ' {' + next(group for group in m.groups() if group is not None) + '} ', text
+    )
+    text = SPELLING_TAG_RE.sub('', text)
+    
+    # Runs of superscript letters (ᵐ, ᵈ, ᵁᴿᵁ) are determinatives too
+    chars = []
+    in_superscript = False
+    for ch in text:
+        decomposition = unicodedata.decomposition(ch)
+        if decomposition.startswith('<super>'):
+            if not in_superscript:
+                chars.append(' {')
+                in_superscript = True
+            chars.append(chr(int(decomposition.split()[1], 16)))
+            continue
+        if in_superscript:
+            chars.append('} ')
+            in_superscript = False
+        chars.append(ch)
+    if in_superscript:
+        chars.append('} ')
+    
+    tokens = []
+    for part in SPELLING_DETERMINATIVE_SPLIT_RE.split(''.join(chars)):
+        if part.startswith('{') and part.endswith('}'):
+            determinative = fold_sign(part[1:-1], keep_digits=True)
+            if determinative:
+                tokens.append('{' + DETERMINATIVE_ALIASES.get(determinative, determinative) + '}')
+            continue
+        for sign in SPELLING_SEPARATOR_RE.split(SPELLING_MARKS_RE.sub('', part)):
+            sign = fold_sign(sign)
+            if sign:
+                tokens.append(sign)
+    return tokens
+
+
 # =============================================================================
 # Main Tables
 # =============================================================================
@@ -294,25 +436,37 @@ class Name(models.Model):
         verbose_name = "Name"
         verbose_name_plural = "Names"
         ordering = ['query', 'name']
+        indexes = [
+            # Keyset pagination of search results seeks on this key
+            models.Index(fields=['query', 'name', 'id'], name='name_search_order_idx'),
+        ]
     
     def __str__(self):
         return self.name
     
     def save(self, *args, **kwargs):
-        # Auto-generate query field for searching (combines name, variants, correspondence)
-        parts = []
-        if self.name:
-            parts.append(self.name)
-        if self.variant_forms:
-            parts.append(self.variant_forms)
-        if self.correspondence:
-            parts.append(self.correspondence)
-        
-        if parts:
-            combined = ' '.join(parts)
+        # Auto-generate query field for searching
+        combined = self.search_text()
+        if combined:
             self.query = self.normalize_for_search(combined)
         super().save(*args, **kwargs)
     
+    def search_text(self):
+        """
+        The text behind `query`: the name itself. Variants and correspondences
+        are indexed one by one in NameVariant, so substring hits no longer run
+        across the boundary between two entries.
+        """
+        return self.name or ''
+    
+    def variant_entries(self):
+        """(kind, text) pairs parsed from variant_forms and correspondence"""
+        return [
+            (kind, text)
+            for kind, field in (('variant', self.variant_forms), ('correspondence', self.correspondence))
+            for text in split_variants(field)
+        ]
+    
     @staticmethod
     def normalize_for_search(text):
         """
@@ -323,52 +477,34 @@ class Name(models.Model):
         4. Normalize similar sounds (g=k, b=p, d=t)
         5. Remove punctuation
         6. Collapse repeated letters
+        
+        Steps 2-5 are a single str.translate through SEARCH_CHAR_TABLE.
         """
         if not text:
             return ""
         
-        # Remove HTML tags (like <sup>, <i>, <sub>, etc.)
-        text = re.sub(r'<[^>]+>', '', text)
-        
-        # Lowercase
-        text = text.lower()
-        
-        # Unicode normalization - decompose accented characters
-        text = unicodedata.normalize('NFD', text)
-        
-        # Remove combining diacritical marks
-        text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
-        
-        # Special character replacements
-        replacements = {
-            'ḫ': 'h', 'ḥ': 'h',
-            'š': 's', 'ṣ': 's',
-            'ṭ': 't', 'ț': 't',
-            'ž': 'z',
-            'ʾ': '', 'ʿ': '',
-            ''': '', ''': '',
-            '-': '', '_': '',
-            '.': '', ',': '',
-        }
-        for old, new in replacements.items():
-            text = text.replace(old, new)
-        
-        # Normalize similar sounds
-        sound_map = {
-            'g': 'k',
-            'b': 'p',
-            'd': 't',
-        }
-        for old, new in sound_map.items():
-            text = text.replace(old, new)
+        if '<' in text:
+            text = HTML_TAG_RE.sub('', text)
         
-        # Remove non-alphanumeric characters
-        text = re.sub(r'[^a-z0-9]', '', text)
-        
-        # Collapse repeated letters
-        text = re.sub(r'(.)\1+', r'\1', text)
+        return collapse_repeated(text.translate(SEARCH_CHAR_TABLE))
+    
+    @staticmethod
+    def normalize_many(texts):
+        """Normalize an iterable of texts for searching (batch form for imports)"""
+        translate = str.translate
+        strip_tags = HTML_TAG_RE.sub
+        collapse = collapse_repeated
+        table = SEARCH_CHAR_TABLE
         
-        return text
+        result = []
+        for text in texts:
+            if not text:
+                result.append("")
+                continue
+            if '<' in text:
+                text = strip_tags('', text)
+            result.append(collapse(translate(text, table)))
+        return result
 
 
 class Instance(models.Model):
@@ -446,6 +582,11 @@ class Instance(models.Model):
         null=True,
         help_text="Additional notes"
     )
+    sign_key = models.TextField(
+        blank=True,
+        default='',
+        help_text="Sign tokens of the spelling, space-separated (for sign-level search)"
+    )
     
     class Meta:
         verbose_name = "Instance"
@@ -456,6 +597,138 @@ class Instance(models.Model):
         name_str = self.name.name if self.name else "Unknown"
         fragment_str = self.fragment.series_fragment if self.fragment else "Unknown Fragment"
         return f"{name_str} in {fragment_str}"
+    
+    def save(self, *args, **kwargs):
+        # Auto-generate the sign tokens for spelling search
+        self.sign_key = ' '.join(spelling_signs(self.spelling))
+        super().save(*args, **kwargs)
+
+
+# =============================================================================
+# Denormalized Search Tables
+# =============================================================================
+
+class NameDate(models.Model):
+    """
+    Dates (Fragment.date) of the fragments each name is attested on.
+    Maintained from Instance/Fragment writes (see signals.py) so the date
+    filter is an indexed lookup instead of a join with DISTINCT.
+    """
+    name = models.ForeignKey(
+        Name,
+        on_delete=models.CASCADE,
+        related_name='dates'
+    )
+    date = models.CharField(max_length=100)
+    
+    class Meta:
+        verbose_name = "Name Date"
+        verbose_name_plural = "Name Dates"
+        ordering = ['date']
+        unique_together = [('date', 'name')]
+    
+    def __str__(self):
+        return f"{self.name_id}: {self.date}"
+
+
+class NameVariant(models.Model):
+    """
+    One entry of Name.variant_forms or Name.correspondence, with its
+    normalized key. Maintained from Name saves (see signals.py); the key
+    index answers exact and prefix lookups on variant spellings.
+    """
+    KIND_CHOICES = [
+        ('variant', 'Variant form'),
+        ('correspondence', 'Correspondence'),
+    ]
+    
+    name = models.ForeignKey(
+        Name,
+        on_delete=models.CASCADE,
+        related_name='variants'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    position = models.PositiveSmallIntegerField(default=0)
+    text = models.CharField(max_length=500)
+    key = models.CharField(
+        max_length=500,
+        db_index=True,
+        help_text="Normalized text (Name.normalize_for_search)"
+    )
+    
+    class Meta:
+        verbose_name = "Name Variant"
+        verbose_name_plural = "Name Variants"
+        ordering = ['name', 'kind', 'position']
+    
+    def __str__(self):
+        return self.text
+
+
+class NamePair(models.Model):
+    """
+    Two names attested on the same fragments, stored once with
+    name_a < name_b. Maintained incrementally from attestation writes (see
+    signals.py and cooccurrence.py); the graph store loads its edges from
+    it on a full build (see network.py).
+    """
+    name_a = models.ForeignKey(
+        Name,
+        on_delete=models.CASCADE,
+        related_name='pairs_as_a'
+    )
+    name_b = models.ForeignKey(
+        Name,
+        on_delete=models.CASCADE,
+        related_name='pairs_as_b'
+    )
+    shared_fragments = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of fragments on which both names are attested"
+    )
+    
+    class Meta:
+        verbose_name = "Name Pair"
+        verbose_name_plural = "Name Pairs"
+        unique_together = ['name_a', 'name_b']
+        ordering = ['name_a', 'name_b']
+    
+    def __str__(self):
+        return f"{self.name_a_id} & {self.name_b_id}: {self.shared_fragments}"
+
+
+class NetworkJob(models.Model):
+    """
+    A network request handed to the background job runner
+    (run_network_jobs) because it is too large to answer inline. The result
+    is stored as a file named after the id in NETWORK_JOB_DIR.
+    """
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    query = models.TextField(help_text="Query string of the network request, parameters sorted")
+    version = models.PositiveBigIntegerField(help_text="Data version the request was made at")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Network Job"
+        verbose_name_plural = "Network Jobs"
+        ordering = ['created_at']
+        unique_together = [('query', 'version')]
+    
+    def __str__(self):
+        return f"{self.id} {self.status}"
 
 
 # =============================================================================
@@ -551,3 +824,44 @@ class ChangeLog(models.Model):
                     changes.append(f"{key}: '{old_display}' → '{new_display}'")
             return "; ".join(changes) if changes else "No changes detected"
         return ""
+
+
+# =============================================================================
+# Data Versioning
+# =============================================================================
+
+class DataChange(models.Model):
+    """
+    Append-only journal of writes to the tables behind the search indexes.
+    The highest id is the current data version: in-process caches remember
+    the version they were built at and refresh when it moves.
+    """
+    
+    ACTION_CHOICES = [
+        ('save', 'Saved'),
+        ('delete', 'Deleted'),
+        ('bulk', 'Bulk change'),
+    ]
+    
+    MODEL_CHOICES = [
+        ('name', 'Name'),
+        ('fragment', 'Fragment'),
+        ('instance', 'Attestation'),
+        ('lookup', 'Lookup table'),
+    ]
+    
+    model_type = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    object_id = models.PositiveIntegerField(null=True, blank=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Data Change"
+        verbose_name_plural = "Data Changes"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['model_type', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"#{self.id} {self.action} {self.model_type} {self.object_id or ''}".strip()
@@ -0,0 +1,671 @@
+"""
+Co-occurrence network engine for the network view and name co-occurrences.
+
+Each worker keeps one GraphStore: a columnar snapshot of every attestation
+(id, name, fragment), of the names (id, type) and of the fragments (id,
+series), plus the co-occurrence edges of all names as sorted pair keys and
+weights (shared fragments). The store is built once, taking the edges from
+the NamePair table, and then kept in sync from the DataChange journal like
+the typeahead index: changed attestations are re-read and their edges
+patched in memory, changed names or fragments reload those small tables.
+Bulk changes (or a journal gap) trigger a full rebuild.
+
+Edges are computed from the name x fragment incidence matrix B as the
+off-diagonal of B^T B: the (name, fragment) pairs are grouped by fragment,
+every fragment contributes the upper triangle of its names' outer product,
+and equal (a, b) entries are summed. This is the sparse product done with
+sort-and-reduce, so no Python loop runs per fragment or per pair. A patch
+recomputes the product over the fragments the changed attestations touch,
+before and after the change, and adds the difference.
+
+Requests read Graph objects from the store (one per series filter, cached
+until the next change). Node filters (name type, attestation count,
+connection count) are boolean masks over the sorted name ids; edges refer
+to names by their position in that array, so masking an edge list is two
+lookups and degrees are one bincount.
+
+Dense fragments (administrative lists, cult inventories) tie many names
+with weak edges, so edges can be rescored (Jaccard, PMI over the names'
+fragment counts) and pruned to the disparity-filter backbone or to the
+strongest few edges of every name, all as array operations.
+
+Fragments carry their date (jh, mh, sjh, ...) as a code into the store's
+date labels. A request for date slices tags every attestation with the
+period of its fragment's date and runs the incidence product once over
+(period, name) pairs, which yields the edges of all periods together.
+"""
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from .models import Name, Fragment, Instance, NamePair, DataChange
+from .versioning import current_version, JOURNAL_KEEP
+
+
+# Series filters whose graphs a worker keeps
+GRAPH_CACHE_SIZE = 8
+# Attestations changed since the last refresh above which a full rebuild is cheaper
+INCREMENTAL_LIMIT = 5000
+# Pair keys: a << KEY_SHIFT | b (ids stay well below 2**31)
+KEY_SHIFT = 32
+KEY_MASK = (1 << KEY_SHIFT) - 1
+# Fragment id marking a deleted attestation row until the store is compacted
+EMPTY_ROW = -1
+
+
+def _runs(keys):
+    """Distinct values of a sorted array and how often each occurs"""
+    if not len(keys):
+        return keys, np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.diff(np.r_[starts, len(keys)])
+
+
+def _columns(rows, count):
+    """Rows of ids (None as 0) as one int64 array per column"""
+    table = np.fromiter(
+        (value or 0 for row in rows for value in row), dtype=np.int64
+    ).reshape(-1, count)
+    return [table[:, i].copy() for i in range(count)]
+
+
+def incidence_edges(name_ids, fragment_ids):
+    """
+    Co-occurrence edges of an incidence list (one entry per attestation,
+    duplicates allowed): the strictly upper triangle of B^T B, as
+    (a, b, weight) arrays sorted by (a, b).
+    """
+    name_ids = np.asarray(name_ids, dtype=np.int64)
+    fragment_ids = np.asarray(fragment_ids, dtype=np.int64)
+    empty = np.zeros(0, dtype=np.int64)
+    if not len(name_ids):
+        return empty, empty, empty
+
+    # Distinct (fragment, name) entries, sorted by fragment then name. Sort
+    # and run-length encode integer keys: np.unique is several times slower
+    base = int(name_ids.max()) + 1
+    entries, _ = _runs(np.sort(fragment_ids * base + name_ids))
+    fragments, names = entries // base, entries % base
+
+    # Every entry pairs with the entries after it in its fragment
+    _, sizes = _runs(fragments)
+    starts = np.cumsum(sizes) - sizes
+    position = np.arange(len(fragments)) - np.repeat(starts, sizes)
+    partners = np.repeat(sizes, sizes) - position - 1
+    total = int(partners.sum())
+    if not total:
+        return empty, empty, empty
+    left = np.repeat(np.arange(len(fragments)), partners)
+    # Offsets 1..partners for each left entry
+    first = np.repeat(np.cumsum(partners) - partners, partners)
+    right = left + np.arange(total) - first + 1
+
+    # Sum equal (a, b) entries: encode each pair as one integer
+    keys, weights = _runs(np.sort(names[left] * base + names[right]))
+    return keys // base, keys % base, weights
+
+
+def period_edges(periods, name_ids, fragment_ids):
+    """
+    Co-occurrence edges of an incidence list whose fragments each lie in one
+    period, for all periods in one pass: names are tagged with the period
+    of their entry, so no pair crosses periods. Returns (period, a, b,
+    weight) arrays sorted by period, then (a, b).
+    """
+    base = int(np.max(name_ids, initial=0)) + 1
+    a, b, weights = incidence_edges(np.asarray(periods) * base + name_ids, fragment_ids)
+    return a // base, a % base, b % base, weights
+
+
+def pair_keys(name_ids, fragment_ids):
+    """Co-occurrence edges of an incidence list as (sorted pair keys, weights)"""
+    a, b, weights = incidence_edges(name_ids, fragment_ids)
+    return (a << KEY_SHIFT) | b, weights
+
+
+def merge_edges(keys, weights, delta_keys, delta_weights):
+    """Add signed weight changes to sorted pair keys, dropping pairs that reach zero"""
+    delta_keys, inverse = np.unique(delta_keys, return_inverse=True)
+    delta_weights = np.bincount(inverse, weights=delta_weights, minlength=len(delta_keys)).astype(np.int64)
+    changed = delta_weights != 0
+    delta_keys, delta_weights = delta_keys[changed], delta_weights[changed]
+
+    at = np.searchsorted(keys, delta_keys)
+    found = at < len(keys)
+    found[found] = keys[at[found]] == delta_keys[found]
+    weights = weights.copy()
+    weights[at[found]] += delta_weights[found]
+    keys = np.insert(keys, at[~found], delta_keys[~found])
+    weights = np.insert(weights, at[~found], delta_weights[~found])
+    kept = weights > 0
+    return keys[kept], weights[kept]
+
+
+def node_mask(counts, type_ids, name_types=None, min_attestations=1):
+    """Names passing the name type and attestation filters"""
+    mask = counts >= min_attestations
+    if name_types:
+        mask &= np.isin(type_ids, np.array([int(t) for t in name_types], dtype=np.int64))
+    return mask
+
+
+def positions(ids, wanted):
+    """Positions of some ids in the sorted `ids` (-1 for unknown ids)"""
+    wanted = np.asarray(wanted, dtype=np.int64)
+    if not len(ids):
+        return np.full(len(wanted), -1, dtype=np.int64)
+    if len(wanted) < len(ids) // 64:
+        at = np.searchsorted(ids, wanted).clip(max=len(ids) - 1)
+        return np.where(ids[at] == wanted, at, -1)
+    # Many lookups: an id -> position table beats binary searches
+    slots = np.full(int(ids[-1]) + 2, -1, dtype=np.int64)
+    slots[ids] = np.arange(len(ids))
+    return slots[wanted.clip(0, len(slots) - 1)]
+
+
+def edge_mask(mask, pa, pb):
+    """Edges (as endpoint positions) whose two names are both in `mask`"""
+    return (pa >= 0) & (pb >= 0) & mask[pa] & mask[pb]
+
+
+def degrees(count, pa, pb):
+    """Number of edges (as endpoint positions) of each of `count` names"""
+    return np.bincount(pa, minlength=count) + np.bincount(pb, minlength=count)
+
+
+def _slices(indptr, rows):
+    """Concatenated positions indptr[r]:indptr[r + 1] of some CSR rows"""
+    starts, ends = indptr[rows], indptr[rows + 1]
+    lengths = ends - starts
+    total = int(lengths.sum())
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(total)
+
+
+def _strongest(found, ties, limit):
+    """The `limit` names of `found` with the highest ties (lowest positions first among equals)"""
+    values = ties[found]
+    threshold = np.partition(values, len(values) - limit)[len(values) - limit]
+    above = found[values > threshold]
+    level = found[values == threshold][:limit - len(above)]
+    return np.sort(np.concatenate([above, level]))
+
+
+def jaccard(pa, pb, weights, occurrences):
+    """Shared fragments over the fragments of either name, per edge"""
+    return weights / (occurrences[pa] + occurrences[pb] - weights)
+
+
+def pmi(pa, pb, weights, occurrences, total):
+    """Pointwise mutual information of the two names' fragments, per edge"""
+    return np.log(weights * float(total) / (occurrences[pa].astype(float) * occurrences[pb]))
+
+
+def disparity(count, pa, pb, weights):
+    """
+    Disparity-filter significance of each edge (Serrano et al. 2009): the
+    lower, over both endpoints, of the chance that a name with that many
+    edges would give it this large a share of its weight at random
+    """
+    strength = np.bincount(pa, weights, count) + np.bincount(pb, weights, count)
+    degree = degrees(count, pa, pb)
+    alphas = [(1 - weights / strength[end]) ** (degree[end] - 1) for end in (pa, pb)]
+    return np.minimum(*alphas)
+
+
+def top_edges(count, pa, pb, scores, limit):
+    """Edges among the `limit` highest scored edges of either endpoint"""
+    ends = np.concatenate([pa, pb])
+    edges = np.concatenate([np.arange(len(pa))] * 2)
+    # By endpoint, highest score first, then by edge order
+    order = np.lexsort((edges, -np.concatenate([scores, scores]), ends))
+    ends, edges = ends[order], edges[order]
+    sizes = np.bincount(ends, minlength=count)
+    rank = np.arange(len(ends)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    keep = np.zeros(len(pa), dtype=bool)
+    keep[edges[rank < limit]] = True
+    return keep
+
+
+def graph_diff(before, after):
+    """
+    Changes between two graphs given as (node ids, edge keys, edge weights),
+    each sorted: (added node ids, removed node ids, added edges as a mask
+    over the later edges, removed edges as a mask over the earlier ones,
+    reweighted edges as a mask over the later edges)
+    """
+    nodes_before, keys_before, weights_before = before
+    nodes, keys, weights = after
+    _, at_before, at_after = np.intersect1d(keys_before, keys, assume_unique=True, return_indices=True)
+    added, removed, reweighted = (np.ones(len(keys), dtype=bool), np.ones(len(keys_before), dtype=bool),
+                                  np.zeros(len(keys), dtype=bool))
+    added[at_after] = False
+    removed[at_before] = False
+    reweighted[at_after] = weights_before[at_before] != weights[at_after]
+    return (
+        np.setdiff1d(nodes, nodes_before, assume_unique=True),
+        np.setdiff1d(nodes_before, nodes, assume_unique=True),
+        added, removed, reweighted,
+    )
+
+
+class Graph:
+    """Names and co-occurrence edges of one series filter at one data version"""
+
+    def __init__(self, version=None, series_ids=()):
+        self.version = version
+        self.series_ids = series_ids
+        self.adjacency = None
+        self.occurrences = None
+
+    def load(self, ids, attestations, type_ids, a, b, weights):
+        self.ids = ids
+        self.attestations = attestations
+        self.type_ids = type_ids
+        pa, pb = positions(ids, a), positions(ids, b)
+        known = (pa >= 0) & (pb >= 0)
+        self.pa, self.pb, self.weights = pa[known], pb[known], weights[known]
+        self.adjacency = None
+
+    def csr(self):
+        """(indptr, indices, neighbor weights): both directions of every edge, by source position"""
+        if self.adjacency is None:
+            sources = np.concatenate([self.pa, self.pb])
+            order = np.argsort(sources, kind='stable')
+            indptr = np.zeros(len(self.ids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(sources, minlength=len(self.ids)), out=indptr[1:])
+            self.adjacency = (
+                indptr,
+                np.concatenate([self.pb, self.pa])[order],
+                np.concatenate([self.weights, self.weights])[order],
+            )
+        return self.adjacency
+
+    def neighbors(self, name_id):
+        """(name ids, shared fragments) of the names co-occurring with one name"""
+        position = positions(self.ids, [name_id])[0]
+        if position < 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        indptr, indices, weights = self.csr()
+        entries = slice(indptr[position], indptr[position + 1])
+        return self.ids[indices[entries]], weights[entries]
+
+    def ego_mask(self, name_ids, degree, max_nodes=None, hop_limit=None):
+        """
+        Names within `degree` hops of some names (breadth-first), as a mask
+        over the ids, and whether a limit cut the expansion short. Each hop
+        adds at most `hop_limit` names and the whole network at most
+        `max_nodes`; when a limit applies, the names with the strongest
+        ties to the previous hop (shared fragments) are kept.
+        """
+        indptr, indices, neighbor_weights = self.csr()
+        visited = np.zeros(len(self.ids), dtype=bool)
+        seeds = positions(self.ids, list(name_ids))
+        frontier = np.unique(seeds[seeds >= 0])
+        if max_nodes is not None:
+            frontier = frontier[:max_nodes]
+        visited[frontier] = True
+        remaining = None if max_nodes is None else max_nodes - len(frontier)
+        truncated = False
+
+        for _ in range(degree):
+            entries = _slices(indptr, frontier)
+            neighbors = indices[entries]
+            fresh = ~visited[neighbors]
+            if not fresh.any():
+                break
+            # Shared fragments of each new name with the previous hop
+            ties = np.bincount(
+                neighbors[fresh], weights=neighbor_weights[entries[fresh]], minlength=len(self.ids)
+            )
+            found = np.flatnonzero(ties)
+
+            limits = [limit for limit in (hop_limit, remaining) if limit is not None]
+            if limits and len(found) > min(limits):
+                truncated = True
+                if not min(limits):
+                    break
+                found = _strongest(found, ties, min(limits))
+            visited[found] = True
+            frontier = found
+            if remaining is not None:
+                remaining -= len(found)
+        return visited, truncated
+
+    def nbytes(self):
+        arrays = (self.pa, self.pb, self.weights, *(self.adjacency or ()), *(self.occurrences or ())[:1])
+        return sum(array.nbytes for array in arrays)
+
+
+class GraphStore:
+    """Per-process snapshot of the attestations and their co-occurrence edges"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.graphs = OrderedDict()
+        self.reset()
+
+    def reset(self):
+        self.version = None
+        self.build_seconds = None
+        self.last_refresh = None
+        self.load([], [], [])
+
+    def clear(self):
+        with self.lock:
+            self.reset()
+
+    # Attestation columns are views of buffers with spare room for new rows
+    @property
+    def instance_ids(self):
+        return self._ids[:self.size]
+
+    @property
+    def instance_names(self):
+        return self._names[:self.size]
+
+    @property
+    def instance_fragments(self):
+        return self._fragments[:self.size]
+
+    # -------------------------------------------------------------------------
+    # Reading
+    # -------------------------------------------------------------------------
+
+    def graph(self, series_ids=()):
+        """The graph of all attestations, or of those on fragments of some series"""
+        key = tuple(sorted({int(series_id) for series_id in series_ids}))
+        with self.lock:
+            self.refresh()
+            graph = self.graphs.get(key)
+            if graph is None:
+                graph = Graph(self.version, key)
+                if key:
+                    a, b, weights = incidence_edges(*self.incidence(key))
+                else:
+                    a, b, weights = self.edge_keys >> KEY_SHIFT, self.edge_keys & KEY_MASK, self.edge_weights
+                graph.load(self.name_ids, self.attestations, self.type_ids, a, b, weights)
+                self.graphs[key] = graph
+                while len(self.graphs) > GRAPH_CACHE_SIZE:
+                    self.graphs.popitem(last=False)
+            else:
+                self.graphs.move_to_end(key)
+        return graph
+
+    def incidence(self, series_ids=()):
+        """(name ids, fragment ids) of the linked attestations, on fragments of some series if given"""
+        names, fragments = self.linked()
+        if series_ids:
+            at = positions(self.fragment_ids, fragments)
+            series = np.where(at >= 0, self.fragment_series[at], 0)
+            on_series = np.isin(series, series_ids)
+            names, fragments = names[on_series], fragments[on_series]
+        return names, fragments
+
+    def occurrences(self, graph):
+        """
+        (fragments each of a graph's names is on, fragments with any name),
+        counted on first use
+        """
+        with self.lock:
+            if graph.occurrences is None:
+                names, fragments = self.incidence(graph.series_ids)
+                base = int(fragments.max(initial=0)) + 1
+                entries, _ = _runs(np.sort(names * base + fragments))
+                named = positions(graph.ids, entries // base)
+                graph.occurrences = (
+                    np.bincount(named[named >= 0], minlength=len(graph.ids)),
+                    len(_runs(np.sort(fragments))[0]),
+                )
+        return graph.occurrences
+
+    def periods(self, graph, periods):
+        """
+        Attestations and co-occurrence edges of a graph's names per period,
+        where a period is a list of fragment dates and a fragment belongs to
+        the first period listing its date. Returns (attestations,
+        occurrences, fragment counts, (period, pa, pb, weights)): per-period
+        counts as (periods, names) arrays and one fragment count per period,
+        and the edges of all periods between graph positions, by period.
+        """
+        with self.lock:
+            names, fragments = self.incidence(graph.series_ids)
+            period_of_date = np.full(len(self.date_labels), -1, dtype=np.int64)
+            for period, dates in reversed(list(enumerate(periods))):
+                codes = [self.date_codes[date] for date in dates if date in self.date_codes]
+                period_of_date[codes] = period
+            at = positions(self.fragment_ids, fragments)
+            period = np.where(at >= 0, period_of_date[self.fragment_dates[at]], -1)
+
+        named = positions(graph.ids, names)
+        dated = (period >= 0) & (named >= 0)
+        period, named, fragments = period[dated], named[dated], fragments[dated]
+        count, size = len(periods), len(graph.ids)
+        attestations = np.bincount(period * size + named, minlength=count * size).reshape(count, size)
+        # Distinct fragments of each name, and fragments with any name, per period
+        base = int(fragments.max(initial=0)) + 1
+        entries, _ = _runs(np.sort((period * size + named) * base + fragments))
+        occurrences = np.bincount(entries // base, minlength=count * size).reshape(count, size)
+        dated_fragments, _ = _runs(np.sort(period * base + fragments))
+        fragment_counts = np.bincount(dated_fragments // base, minlength=count)
+        return attestations, occurrences, fragment_counts, period_edges(period, named, fragments)
+
+    def linked(self, rows=None):
+        """(name ids, fragment ids) of the attestations (or of some rows) linking both"""
+        names, fragments = self.instance_names, self.instance_fragments
+        if rows is not None:
+            names, fragments = names[rows], fragments[rows]
+        linked = (names > 0) & (fragments > 0)
+        return names[linked], fragments[linked]
+
+    def rows_on(self, fragment_ids):
+        """Positions of the attestations on some fragments"""
+        # A lookup table over fragment ids beats np.isin on long arrays
+        fragments = self.instance_fragments.clip(0)
+        wanted = np.zeros(int(max(fragments.max(initial=0), fragment_ids.max(initial=0))) + 1, dtype=bool)
+        wanted[fragment_ids] = True
+        return np.flatnonzero(wanted[fragments])
+
+    def stats(self):
+        """Size, memory footprint and build/refresh timings of this worker's store"""
+        with self.lock:
+            self.refresh()
+            return self.describe()
+
+    def describe(self):
+        """stats() without refreshing first"""
+        store_bytes = sum(array.nbytes for array in (
+            self._ids, self._names, self._fragments,
+            self.name_ids, self.type_ids, self.attestations,
+            self.fragment_ids, self.fragment_series, self.fragment_dates, self.edge_keys, self.edge_weights,
+        ))
+        graph_bytes = sum(graph.nbytes() for graph in self.graphs.values())
+        return {
+            'version': self.version,
+            'attestations': self.size - self.empty_rows,
+            'names': len(self.name_ids),
+            'fragments': len(self.fragment_ids),
+            'edges': len(self.edge_keys),
+            'cached_graphs': len(self.graphs),
+            'memory_bytes': store_bytes + graph_bytes,
+            'store_bytes': store_bytes,
+            'graph_bytes': graph_bytes,
+            'build_seconds': self.build_seconds,
+            'last_refresh': self.last_refresh,
+        }
+
+    # -------------------------------------------------------------------------
+    # Building and incremental refresh
+    # -------------------------------------------------------------------------
+
+    def refresh(self):
+        """Bring the store up to the current data version (called with the lock held)"""
+        version = current_version('name', 'instance', 'fragment')
+        if version == self.version:
+            return
+        if self.version is None or not 0 < version - self.version < JOURNAL_KEEP:
+            self.build(version)
+            return
+
+        start = time.perf_counter()
+        changes = DataChange.objects.filter(
+            id__gt=self.version, id__lte=version, model_type__in=['name', 'instance', 'fragment']
+        ).values_list('model_type', 'action', 'object_id')
+        changed = {'name': set(), 'instance': set(), 'fragment': set()}
+        for model_type, action, object_id in changes:
+            if action == 'bulk' or object_id is None:
+                self.build(version)
+                return
+            changed[model_type].add(object_id)
+        if len(changed['instance']) > INCREMENTAL_LIMIT:
+            self.build(version)
+            return
+
+        if changed['name']:
+            self.update_names(changed['name'])
+        if changed['fragment']:
+            self.load_fragments(Fragment.objects.order_by('id').values_list('id', 'series_id', 'date'))
+        if changed['instance']:
+            pks = sorted(changed['instance'])
+            self.update_instances(pks, Instance.objects.filter(pk__in=pks).values_list('id', 'name_id', 'fragment_id'))
+        self.graphs.clear()
+        self.version = version
+        self.last_refresh = {
+            'kind': 'incremental',
+            'changes': sum(len(object_ids) for object_ids in changed.values()),
+            'seconds': time.perf_counter() - start,
+        }
+
+    def build(self, version):
+        """Load everything from the database"""
+        start = time.perf_counter()
+        self.load(
+            Instance.objects.order_by('id').values_list('id', 'name_id', 'fragment_id'),
+            Name.objects.order_by('id').values_list('id', 'name_type_id'),
+            Fragment.objects.order_by('id').values_list('id', 'series_id', 'date'),
+            NamePair.objects.order_by('name_a_id', 'name_b_id').values_list('name_a_id', 'name_b_id', 'shared_fragments'),
+        )
+        self.version = version
+        self.build_seconds = time.perf_counter() - start
+        self.last_refresh = {'kind': 'full', 'changes': None, 'seconds': self.build_seconds}
+
+    def load(self, instance_rows, name_rows, fragment_rows, pair_rows=None):
+        """
+        Load (id, name_id, fragment_id) attestation rows, (id, name_type_id)
+        name rows and (id, series_id, date) fragment rows, each sorted by id,
+        and (name_a, name_b, shared_fragments) pair rows sorted by pair; the
+        edges are counted from the attestations when no pairs are given
+        """
+        self._ids, self._names, self._fragments = _columns(instance_rows, 3)
+        self.size = len(self._ids)
+        self.empty_rows = 0
+        self.unsorted = False
+        self.name_ids, self.type_ids = _columns(name_rows, 2)
+        self.load_fragments(fragment_rows)
+        if pair_rows is None:
+            self.edge_keys, self.edge_weights = pair_keys(*self.linked())
+        else:
+            a, b, self.edge_weights = _columns(pair_rows, 3)
+            self.edge_keys = (a << KEY_SHIFT) | b
+        self.count_attestations()
+        self.graphs.clear()
+
+    def load_fragments(self, rows):
+        rows = list(rows)
+        self.fragment_ids, self.fragment_series = _columns((row[:2] for row in rows), 2)
+        # Dates as codes into date_labels, 0 for undated fragments
+        self.date_labels = [''] + sorted({row[2] for row in rows if row[2]})
+        self.date_codes = {label: code for code, label in enumerate(self.date_labels) if label}
+        self.fragment_dates = np.array([self.date_codes.get(row[2], 0) for row in rows], dtype=np.int64)
+
+    def count_attestations(self):
+        named = positions(self.name_ids, self.instance_names[self.instance_names > 0])
+        self.attestations = np.bincount(named[named >= 0], minlength=len(self.name_ids))
+
+    def add_attestations(self, name_ids, sign):
+        """Count some attestations in (sign 1) or out (sign -1) by name id"""
+        named = positions(self.name_ids, name_ids[name_ids > 0])
+        np.add.at(self.attestations, named[named >= 0], sign)
+
+    def update_names(self, name_ids):
+        """Take over changed name types; added or deleted names reload the name table"""
+        name_ids = sorted(name_ids)
+        rows = dict(Name.objects.filter(id__in=name_ids).values_list('id', 'name_type_id'))
+        at = positions(self.name_ids, name_ids)
+        if len(rows) == len(name_ids) and (at >= 0).all():
+            # Graphs handed out earlier share the arrays: patch a copy
+            self.type_ids = self.type_ids.copy()
+            self.type_ids[at] = [rows[name_id] or 0 for name_id in name_ids]
+        else:
+            self.name_ids, self.type_ids = _columns(Name.objects.order_by('id').values_list('id', 'name_type_id'), 2)
+            self.count_attestations()
+
+    def update_instances(self, pks, rows):
+        """
+        Replace the snapshot rows of some attestation ids with their current
+        (id, name_id, fragment_id) rows (missing ones were deleted) and patch
+        the edges on the fragments involved
+        """
+        new_ids, new_names, new_fragments = _columns(rows, 3)
+        old = positions(self.instance_ids, pks)
+        old = old[old >= 0]
+        old = old[self.instance_fragments[old] != EMPTY_ROW]
+
+        # Only pairs on fragments the attestations leave or join can change
+        touched = np.union1d(self.instance_fragments[old], new_fragments)
+        on_touched = self.rows_on(touched[touched > 0])
+        before_keys, before_weights = pair_keys(*self.linked(on_touched))
+        self.attestations = self.attestations.copy()
+        self.add_attestations(self.instance_names[old], -1)
+        self.add_attestations(new_names, 1)
+
+        # Saved rows change in place, deleted rows are emptied, new rows appended
+        current = positions(self.instance_ids, new_ids)
+        saved = current >= 0
+        self.empty_rows -= np.count_nonzero(self.instance_fragments[current[saved]] == EMPTY_ROW)
+        self.instance_names[current[saved]] = new_names[saved]
+        self.instance_fragments[current[saved]] = new_fragments[saved]
+        deleted = np.setdiff1d(old, current[saved])
+        self.instance_names[deleted] = 0
+        self.instance_fragments[deleted] = EMPTY_ROW
+        self.empty_rows += len(deleted)
+        added = self.append_instances(new_ids[~saved], new_names[~saved], new_fragments[~saved])
+
+        after_keys, after_weights = pair_keys(*self.linked(np.concatenate([on_touched, current[saved], added])))
+        self.edge_keys, self.edge_weights = merge_edges(
+            self.edge_keys, self.edge_weights,
+            np.concatenate([after_keys, before_keys]), np.concatenate([after_weights, -before_weights]),
+        )
+        if self.unsorted or self.empty_rows > self.size // 8:
+            self.compact()
+
+    def append_instances(self, ids, names, fragments):
+        """Append attestation rows, growing the buffers; returns their positions"""
+        start, self.size = self.size, self.size + len(ids)
+        if self.size > len(self._ids):
+            capacity = max(self.size, len(self._ids) * 3 // 2)
+            for attr in ('_ids', '_names', '_fragments'):
+                buffer = np.zeros(capacity, dtype=np.int64)
+                buffer[:start] = getattr(self, attr)[:start]
+                setattr(self, attr, buffer)
+        self._ids[start:self.size] = ids
+        self._names[start:self.size] = names
+        self._fragments[start:self.size] = fragments
+        # New ids normally come after every existing one
+        if len(ids) and (start and ids.min() < self._ids[start - 1] or (np.diff(ids) < 0).any()):
+            self.unsorted = True
+        return np.arange(start, self.size)
+
+    def compact(self):
+        """Drop emptied rows and sort the attestations by id"""
+        kept = self.instance_fragments != EMPTY_ROW
+        order = np.argsort(self.instance_ids[kept], kind='stable')
+        self._ids = self.instance_ids[kept][order]
+        self._names = self.instance_names[kept][order]
+        self._fragments = self.instance_fragments[kept][order]
+        self.size = len(self._ids)
+        self.empty_rows = 0
+        self.unsorted = False
+
+
+store = GraphStore()
@@ -0,0 +1,221 @@
+"""
+Keyset (seek) pagination for search results.
+
+Instead of OFFSET, each page continues from the sort key of the last row of
+the previous page, so deep pages cost the same as the first one. Cursors are
+opaque url-safe strings carrying the direction, the page number (for
+display) and the sort key. Total counts are cached per filter set and data
+version, so paging through results does not re-run COUNT(*).
+
+SQLite sorts NULLs first in ascending and last in descending order; the
+seek conditions below follow the same rule.
+"""
+import base64
+import hashlib
+import json
+from math import ceil
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from .versioning import current_version
+
+
+# Seconds a cached count lives even without data changes
+COUNT_CACHE_TIMEOUT = 60 * 60
+
+
+def encode_cursor(direction, number, values):
+    data = json.dumps([direction, number, values], separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (direction, number, values), or None for a missing/invalid cursor"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, number, values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if direction not in ('next', 'prev', 'last') or not isinstance(number, int):
+            return None
+        return direction, number, values
+    except (ValueError, TypeError):
+        return None
+
+
+def _later(field, descending, value):
+    """Rows sorting strictly after `value` on one field"""
+    if not descending:
+        if value is None:
+            return Q(**{f'{field}__isnull': False})
+        return Q(**{f'{field}__gt': value})
+    if value is None:
+        return Q(pk__in=[])
+    return Q(**{f'{field}__lt': value}) | Q(**{f'{field}__isnull': True})
+
+
+def _equal(field, value):
+    if value is None:
+        return Q(**{f'{field}__isnull': True})
+    return Q(**{field: value})
+
+
+def seek_filter(ordering, values):
+    """Rows sorting strictly after the key `values` in `ordering`"""
+    condition = Q(pk__in=[])
+    prefix = Q()
+    for field, value in zip(ordering, values):
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        condition |= prefix & _later(name, descending, value)
+        prefix &= _equal(name, value)
+
+    # A plain lower bound on the first field lets SQLite seek its index
+    first = ordering[0]
+    if not first.startswith('-') and values[0] is not None:
+        condition &= Q(**{f'{first}__gte': values[0]})
+    return condition
+
+
+def reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+class KeysetPage:
+    """One page of results, usable like django.core.paginator.Page in templates"""
+
+    def __init__(self, paginator, object_list, number, has_previous, has_next):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.number = number
+        self._has_previous = has_previous and bool(object_list)
+        self._has_next = has_next and bool(object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return encode_cursor('next', self.number + 1, self.paginator.key(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return encode_cursor('prev', self.number - 1, self.paginator.key(self.object_list[0]))
+
+    @property
+    def last_cursor(self):
+        return encode_cursor('last', self.paginator.num_pages, None)
+
+
+class KeysetPaginator:
+    """
+    Paginate `queryset` in `ordering` (field names, '-' for descending; the
+    last field must be unique, e.g. 'id'). `count_key` identifies the filter
+    set for count caching; without it the count is not cached.
+    """
+
+    def __init__(self, queryset, ordering, per_page, count_key=None):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+        self.count_key = count_key
+        self._count = None
+
+    def key(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def clean_key(self, values):
+        """
+        A cursor's sort key as values of the ordering fields (or
+        annotations), or None when one does not fit its field
+        """
+        annotations = self.queryset.query.annotations
+        cleaned = []
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            if value is not None:
+                if name in annotations:
+                    model_field = annotations[name].output_field
+                else:
+                    model_field = self.queryset.model._meta.get_field(name)
+                try:
+                    value = model_field.to_python(value)
+                    model_field.run_validators(value)
+                except ValidationError:
+                    return None
+            cleaned.append(value)
+        return cleaned
+
+    @property
+    def count(self):
+        if self._count is None:
+            if self.count_key is None:
+                self._count = self.queryset.count()
+            else:
+                digest = hashlib.sha1(
+                    json.dumps(self.count_key, sort_keys=True, default=str).encode('utf-8')
+                ).hexdigest()
+                cache_key = f'namefinder:count:{current_version()}:{digest}'
+                self._count = cache.get(cache_key)
+                if self._count is None:
+                    self._count = self.queryset.count()
+                    cache.set(cache_key, self._count, COUNT_CACHE_TIMEOUT)
+        return self._count
+
+    @property
+    def num_pages(self):
+        return max(1, ceil(self.count / self.per_page))
+
+    def get_page(self, cursor=None):
+        decoded = decode_cursor(cursor)
+        if decoded is None:
+            rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+            return KeysetPage(self, rows[:self.per_page], 1, False, len(rows) > self.per_page)
+
+        direction, number, values = decoded
+        if direction == 'last':
+            number = self.num_pages
+            size = self.count - (number - 1) * self.per_page
+            rows = list(self.queryset.order_by(*reverse_ordering(self.ordering))[:max(size, 0)])
+            rows.reverse()
+            return KeysetPage(self, rows, number, number > 1, False)
+
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            return self.get_page(None)
+        # A tampered cursor may carry values of the wrong type
+        values = self.clean_key(values)
+        if values is None:
+            return self.get_page(None)
+
+        if direction == 'next':
+            rows = list(
+                self.queryset.filter(seek_filter(self.ordering, values))
+                .order_by(*self.ordering)[:self.per_page + 1]
+            )
+            return KeysetPage(self, rows[:self.per_page], number, True, len(rows) > self.per_page)
+
+        backwards = reverse_ordering(self.ordering)
+        rows = list(
+            self.queryset.filter(seek_filter(backwards, values))
+            .order_by(*backwards)[:self.per_page + 1]
+        )
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return KeysetPage(self, rows, max(number, 1), has_previous, True)
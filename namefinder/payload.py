@@ -0,0 +1,139 @@
+"""
+Compact encodings of the network API response.
+
+The default response lists every node and edge as an object, repeating its
+keys. `format=columnar` sends the same network as parallel arrays instead:
+node columns (id, name, name_type, attestations, connections and, when
+asked for, community, x and y), the name types once as a list with each
+node holding the index of its label, and edges as source/target positions
+into the node columns (plus score, when edges are rescored).
+`format=binary` sends the numeric columns as raw little-endian int32
+arrays (float32 for coordinates and scores) after a short JSON header,
+streamed in chunks, so a page reads them through typed-array views
+without parsing numbers.
+
+Binary layout: the header length as a little-endian uint32, the UTF-8 JSON
+header (space-padded so the arrays start on an 8-byte boundary), then the
+arrays listed in header['arrays'] as {'name', 'dtype', 'offset', 'length'},
+with offsets counted from the end of the header. `name` is
+'nodes.<column>' or 'edges.<column>'.
+"""
+import json
+import struct
+import numpy as np
+from . import network
+
+
+FORMATS = ('json', 'columnar', 'binary')
+# Bytes per chunk of a streamed binary response
+CHUNK_SIZE = 1 << 20
+# Decimals of float columns (coordinates, edge scores) in JSON responses
+FLOAT_DIGITS = 4
+# Binary array types by header name
+DTYPES = {'int32': '<i4', 'float32': '<f4'}
+
+
+def network_columns(ids, selected, attestations, connections, pa, pb, weights, labels, communities=None,
+                    coordinates=None, scores=None):
+    """
+    Columns of the names at the `selected` graph positions (in id order)
+    and of the edges between them (given as endpoint positions). `labels`
+    maps name ids to (name, name type label); names missing from it are
+    left out. `communities` maps name ids to community ids (-1 for none),
+    `coordinates` holds the (x, y) of each graph position, `scores` the
+    significance of each edge.
+    """
+    positions = np.flatnonzero(selected)
+    present = np.fromiter(
+        (name_id in labels for name_id in ids[positions].tolist()), dtype=bool, count=len(positions)
+    )
+    if not present.all():
+        selected = selected.copy()
+        selected[positions[~present]] = False
+        positions = positions[present]
+        keep = network.edge_mask(selected, pa, pb)
+        pa, pb, weights = pa[keep], pb[keep], weights[keep]
+        if scores is not None:
+            scores = scores[keep]
+
+    node_ids = ids[positions]
+    name_types, names, codes = {}, [], []
+    for name_id in node_ids.tolist():
+        name, name_type = labels[name_id]
+        names.append(name)
+        codes.append(name_types.setdefault(name_type or 'Unknown', len(name_types)))
+
+    nodes = {
+        'id': node_ids,
+        'name_type': np.array(codes, dtype=np.int64),
+        'attestations': attestations[positions],
+        'connections': connections[positions],
+    }
+    if communities is not None:
+        nodes['community'] = np.fromiter(
+            (communities.get(name_id, -1) for name_id in node_ids.tolist()), dtype=np.int64, count=len(node_ids)
+        )
+    if coordinates is not None:
+        nodes['x'], nodes['y'] = coordinates[positions, 0], coordinates[positions, 1]
+    index = np.cumsum(selected) - 1
+    edges = {'source': index[pa], 'target': index[pb], 'weight': weights}
+    if scores is not None:
+        edges['score'] = scores
+    return {'name_types': list(name_types), 'names': names, 'nodes': nodes, 'edges': edges}
+
+
+def columnar(columns, **fields):
+    """JSON-ready columnar response; `fields` (stats, ...) are added as they are"""
+    def listed(group):
+        return {
+            column: (values.round(FLOAT_DIGITS) if values.dtype.kind == 'f' else values).tolist()
+            for column, values in columns[group].items()
+        }
+
+    return dict(
+        fields,
+        format='columnar',
+        name_types=columns['name_types'],
+        nodes=dict({'name': columns['names']}, **listed('nodes')),
+        edges=listed('edges'),
+    )
+
+
+def binary_chunks(columns, **fields):
+    """Chunks of the binary response; `fields` go into the header"""
+    arrays, layout, offset = [], [], 0
+    for group in ('nodes', 'edges'):
+        for column, values in columns[group].items():
+            dtype = 'float32' if np.asarray(values).dtype.kind == 'f' else 'int32'
+            data = np.ascontiguousarray(values, dtype=DTYPES[dtype])
+            layout.append({'name': f'{group}.{column}', 'dtype': dtype, 'offset': offset, 'length': len(data)})
+            arrays.append(data)
+            offset += data.nbytes
+
+    header = json.dumps(dict(
+        fields,
+        format='binary',
+        name_types=columns['name_types'],
+        names=columns['names'],
+        arrays=layout,
+    )).encode('utf-8')
+    header += b' ' * (-(len(header) + 4) % 8)
+    yield struct.pack('<I', len(header)) + header
+    for data in arrays:
+        data = memoryview(data).cast('B')
+        for start in range(0, len(data), CHUNK_SIZE):
+            yield bytes(data[start:start + CHUNK_SIZE])
+
+
+def read_binary(content):
+    """Header and {name: array} of a binary response (the inverse of binary_chunks)"""
+    (length,) = struct.unpack_from('<I', content)
+    header = json.loads(content[4:4 + length])
+    base = 4 + length
+    arrays = {
+        array['name']: np.frombuffer(
+            content, dtype=DTYPES[array['dtype']], count=array['length'], offset=base + array['offset']
+        )
+        for array in header['arrays']
+    }
+    return header, arrays
@@ -0,0 +1,153 @@
+"""
+Network computations run in a worker process pool, with cached results.
+
+A ResultCache keeps the results of one function per key (typically a
+filter set) together with the data version they were computed at, so the
+same request at the same version reuses them. When the version moved on,
+the stale result can seed the new run through the cache's `warm_start`
+hook. A request waits at most NETWORK_COMPUTE_TIMEOUT seconds for a run;
+if it is not done by then the request is answered without the result and
+the pool is recycled: its workers are terminated, so an overrunning run
+does not keep holding them, and the next run starts a fresh pool. Other
+runs the old pool still had count as unfinished and are resubmitted by
+their next request.
+
+Processes of the background job runner (see jobs.py) are outside the web
+workers already: there runs happen inline, without a pool or a timeout.
+"""
+import multiprocessing
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+
+
+# Results a cache keeps
+CACHE_SIZE = 32
+
+Entry = namedtuple('Entry', 'version result')
+
+_executor = None
+_executor_lock = threading.Lock()
+_inline = False
+
+
+def start_job_process():
+    """Set up a job runner process: Django, and inline runs"""
+    global _inline
+    import django
+    django.setup()
+    _inline = True
+
+
+@contextmanager
+def inline():
+    """Run computations inline in this process for a while"""
+    global _inline
+    previous, _inline = _inline, True
+    try:
+        yield
+    finally:
+        _inline = previous
+
+
+def executor():
+    """This process's worker pool (started on first use)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            context = multiprocessing.get_context(
+                'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+            )
+            _executor = ProcessPoolExecutor(max_workers=settings.NETWORK_COMPUTE_WORKERS, mp_context=context)
+        return _executor
+
+
+def recycle(pool):
+    """Terminate a pool's workers and drop it, so the next run starts a new one"""
+    global _executor
+    with _executor_lock:
+        if _executor is pool:
+            _executor = None
+    processes = list((pool._processes or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+class ResultCache:
+    """
+    Results of `function(*args, initial=...)` by key and data version.
+    `warm_start(previous, *args)` turns the stale result of a key into the
+    `initial` argument of its next run (None for a cold start).
+    """
+
+    def __init__(self, function, warm_start=None, size=CACHE_SIZE):
+        self.function = function
+        self.warm_start = warm_start
+        self.size = size
+        self.entries = OrderedDict()
+        self.running = {}
+        self.lock = threading.Lock()
+
+    def result(self, key, version, *args, timeout=None):
+        """The result for `args`, or None if the run did not finish within the timeout"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.version == version:
+                self.entries.move_to_end(key)
+                return entry.result
+            job = self.running.get((key, version))
+            submitted = job is None
+            if submitted:
+                initial = None
+                if entry is not None and self.warm_start is not None:
+                    initial = self.warm_start(entry.result, *args)
+                if _inline:
+                    result = self.function(*args, initial=initial)
+                    self.entries[key] = Entry(version, result)
+                    self.trim()
+                    return result
+                pool = executor()
+                job = pool.submit(self.function, *args, initial=initial)
+                job.pool = pool
+                self.running[(key, version)] = job
+        # Outside the lock: a job already done runs its callback right away
+        if submitted:
+            job.add_done_callback(lambda done: self.finished(key, version, done))
+
+        try:
+            job.result(timeout=settings.NETWORK_COMPUTE_TIMEOUT if timeout is None else timeout)
+        except TimeoutError:
+            if not job.cancel():
+                recycle(job.pool)
+            return None
+        except BrokenProcessPool:
+            # Its pool was recycled while the run waited or ran
+            return None
+        # Done callbacks may run after waiters wake up, so store the result here too
+        self.finished(key, version, job)
+        return job.result()
+
+    def finished(self, key, version, job):
+        """Keep the result of a finished run"""
+        with self.lock:
+            self.running.pop((key, version), None)
+            if job.cancelled() or job.exception() is not None:
+                return
+            entry = self.entries.get(key)
+            if entry is None or entry.version <= version:
+                self.entries[key] = Entry(version, job.result())
+                self.entries.move_to_end(key)
+                self.trim()
+
+    def trim(self):
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
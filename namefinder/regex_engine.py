@@ -0,0 +1,146 @@
+"""
+Sandboxed regex search over the name columns.
+
+SQLite's REGEXP is a Python callback run per row inside the web worker, so
+one catastrophic pattern can block it until gunicorn's timeout. Instead,
+patterns are matched against an in-memory snapshot of (id, query, name,
+variant_forms, correspondence, then the text and normalized key of each
+variant and correspondence entry) inside a forked helper process. If a pattern does not finish
+within REGEX_SEARCH_TIMEOUT seconds the helper is killed (and respawned for
+the next search) and RegexTooExpensive is raised. A helper that dies during
+a search (say, out of memory) is treated the same way.
+
+Matched id lists - and expensive patterns - are cached per pattern until the
+Name data version changes.
+"""
+import multiprocessing
+import re
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+
+class RegexTooExpensive(Exception):
+    """The pattern did not finish within the time budget"""
+
+
+def _worker_loop(conn, rows):
+    """Helper process: answer patterns with the ids of matching rows"""
+    while True:
+        try:
+            pattern = conn.recv()
+        except EOFError:
+            return
+        try:
+            search = re.compile(pattern, re.IGNORECASE).search
+            conn.send([
+                row[0] for row in rows
+                if any(value and search(value) for value in row[1:])
+            ])
+        except Exception as e:
+            conn.send(e)
+
+
+class RegexSearchEngine:
+    """Per-process regex matcher with a killable helper and a result cache"""
+
+    def __init__(self, timeout=None, cache_size=None):
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.version = None
+        self.rows = None
+        self.process = None
+        self.conn = None
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def search(self, pattern):
+        """Return the ids of names matching `pattern` (case-insensitive search)"""
+        from .versioning import current_version
+
+        with self.lock:
+            version = current_version('name')
+            if version != self.version:
+                self.reset()
+                self.version = version
+
+            if pattern in self.cache:
+                self.cache.move_to_end(pattern)
+                result = self.cache[pattern]
+            else:
+                result = self.run(pattern)
+                self.cache[pattern] = result
+                while len(self.cache) > self.get_cache_size():
+                    self.cache.popitem(last=False)
+
+        if result is None:
+            raise RegexTooExpensive(pattern)
+        return result
+
+    def run(self, pattern):
+        """Match in the helper process; None if the time budget ran out or the helper died"""
+        if self.process is None or not self.process.is_alive():
+            self.start()
+
+        try:
+            self.conn.send(pattern)
+            if not self.conn.poll(self.get_timeout()):
+                self.stop()
+                return None
+            result = self.conn.recv()
+        except (EOFError, ConnectionError):
+            self.stop()
+            return None
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def start(self):
+        if self.rows is None:
+            self.rows = self.load_rows()
+        context = multiprocessing.get_context(
+            'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        )
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_loop, args=(child_conn, self.rows), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def reset(self):
+        """Drop the snapshot, the helper and the cache (data changed)"""
+        self.stop()
+        self.rows = None
+        self.cache.clear()
+
+    def load_rows(self):
+        from .models import Name, NameVariant
+        entries = {}
+        variants = NameVariant.objects.order_by('name_id', 'kind', 'position').values_list('name_id', 'text', 'key')
+        for name_id, text, key in variants:
+            entries.setdefault(name_id, []).extend((text, key))
+        return [
+            (*row, *entries.get(row[0], ()))
+            for row in Name.objects.order_by('id').values_list('id', 'query', 'name', 'variant_forms', 'correspondence')
+        ]
+
+    def get_timeout(self):
+        return self.timeout if self.timeout is not None else settings.REGEX_SEARCH_TIMEOUT
+
+    def get_cache_size(self):
+        return self.cache_size if self.cache_size is not None else settings.REGEX_SEARCH_CACHE_SIZE
+
+
+engine = RegexSearchEngine()
+
+
+def regex_search(pattern):
+    """Ids of names matching `pattern`, using the process-wide engine"""
+    return engine.search(pattern)
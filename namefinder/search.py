@@ -0,0 +1,395 @@
+"""
+Name search helpers shared by the search page and the CSV export.
+
+Substring searches go through the `namefinder_name_fts` FTS5 table (trigram
+tokenizer), which is kept in sync with `namefinder_name` by SQLite triggers
+(see migration 0006), so saves, deletes and bulk imports are all covered.
+Variant forms and correspondences are also matched entry by entry through
+NameVariant and its own trigram table (migration 0010). Attestation
+spellings are searched sign by sign through a token index over
+Instance.sign_key (migration 0011).
+"""
+import json
+import re
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q, Case, When, Value, IntegerField, Exists, OuterRef, Subquery, Count
+from django.db.models.functions import Coalesce
+from django.db.models.expressions import RawSQL
+from .models import Name, Instance, NameDate, NameVariant, spelling_signs
+from .regex_engine import regex_search
+from .versioning import current_version
+
+
+FTS_TABLE = 'namefinder_name_fts'
+
+# Columns of Name mirrored into the FTS table
+FTS_COLUMNS = ['name', 'query', 'variant_forms', 'correspondence']
+
+VARIANT_FTS_TABLE = 'namefinder_namevariant_fts'
+SPELLING_FTS_TABLE = 'namefinder_instance_signs_fts'
+
+# The trigram tokenizer can only answer substrings of at least 3 characters
+FTS_MIN_LENGTH = 3
+
+# Statements creating the FTS table and the triggers keeping it in sync.
+# Migration 0006 carries its own frozen copy; this one is used by the
+# benchmark command to build throwaway databases.
+FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        {', '.join(FTS_COLUMNS)},
+        content='namefinder_name', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON namefinder_name BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON namefinder_name BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF {', '.join(FTS_COLUMNS)} ON namefinder_name BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+        INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+    END""",
+]
+
+
+def fts_available():
+    """The trigram index only exists on SQLite databases"""
+    return connection.vendor == 'sqlite'
+
+
+def fts_phrase(text):
+    """Quote text as an FTS5 phrase (a plain substring for the trigram tokenizer)"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def match_expression(terms):
+    """
+    Build the FTS5 MATCH expression for `terms`, a mapping of Name columns
+    to the substring to look for in each. Returns None when a term is too
+    short for the trigram index.
+    """
+    if not all(len(term) >= FTS_MIN_LENGTH for term in terms.values()):
+        return None
+    return ' OR '.join(f'{column} : {fts_phrase(term)}' for column, term in terms.items())
+
+
+def contains_filter(terms):
+    """
+    Build a filter for case-insensitive substring matches: a name matches if
+    any of the columns in `terms` contains its term. Uses the trigram index
+    when possible, otherwise falls back to LIKE scans.
+    """
+    expression = match_expression(terms) if fts_available() else None
+    if expression is not None:
+        return Q(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [expression]
+        ))
+
+    q = Q()
+    for column, term in terms.items():
+        q |= Q(**{f'{column}__icontains': term})
+    return q
+
+
+def text_search_terms(query):
+    """
+    Column terms searched by the normal (non-regex) search box. A query
+    without a normalized key is not looked up in `query`, where the empty
+    string would match every name.
+    """
+    terms = {
+        'query': Name.normalize_for_search(query),
+        'name': query,
+        'variant_forms': query,
+        'correspondence': query,
+    }
+    if not terms['query']:
+        del terms['query']
+    return terms
+
+
+def text_search_filter(query):
+    """Filter for the normal (non-regex) search box"""
+    return contains_filter(text_search_terms(query)) | variant_filter(Name.normalize_for_search(query))
+
+
+def id_filter(ids):
+    """
+    Filter names by a precomputed list of ids. On SQLite the list is passed as
+    a single JSON parameter, which avoids the bound-variable limit.
+    """
+    ids = list(ids)
+    if fts_available():
+        return Q(pk__in=RawSQL('SELECT value FROM json_each(%s)', [json.dumps(ids)]))
+    return Q(pk__in=ids)
+
+
+def search_filter(query, use_regex=False):
+    """
+    The search box as a Q object on Name (empty for an empty query). Raises
+    RegexTooExpensive if a regex exceeds its time budget.
+    """
+    if not query:
+        return Q()
+
+    if use_regex:
+        try:
+            # Test if it's a valid regex
+            re.compile(query)
+        except re.error:
+            # Invalid regex, fall back to the plain substring search
+            return text_search_filter(query)
+        # Matched against the name columns and variant keys in the sandboxed engine
+        return id_filter(regex_search(query))
+
+    # Normalized substring search through the trigram index
+    return text_search_filter(query)
+
+
+def filter_names(names, query, use_regex=False):
+    """
+    Apply the search box to a Name queryset (search page and CSV export).
+    Raises RegexTooExpensive if a regex exceeds its time budget.
+    """
+    if not query:
+        return names
+    return names.filter(search_filter(query, use_regex))
+
+
+# =============================================================================
+# Relevance ranking
+# =============================================================================
+
+SORT_RELEVANCE = 'relevance'
+SORT_ALPHABETICAL = 'alphabetical'
+
+# Sort keys for keyset pagination; the last field must be unique
+ALPHABETICAL_ORDERING = ['query', 'name', 'id']
+RELEVANCE_ORDERING = ['relevance', '-attestation_count', 'query', 'name', 'id']
+
+# Relevance tiers, best first
+EXACT, PREFIX, VARIANT, SUBSTRING = range(4)
+
+
+def rank_names(names, query):
+    """
+    Annotate `relevance` (EXACT normalized match, PREFIX of the normalized
+    name, VARIANT exact or prefix match of a variant/correspondence key, else
+    SUBSTRING) and `attestation_count` on a Name queryset. Both are computed
+    by the database per row: the comparisons use the indexed `query` and
+    NameVariant.key columns and the count is an indexed subquery on
+    Instance.name_id, so paging stays a LIMIT over the sort. A query without
+    a normalized key (only punctuation) leaves every name a SUBSTRING hit.
+    """
+    key = Name.normalize_for_search(query)
+    attestations = Instance.objects.filter(name=OuterRef('pk')).order_by().values('name').annotate(
+        count=Count('id')
+    ).values('count')
+    attestation_count = Coalesce(Subquery(attestations, output_field=IntegerField()), 0)
+    if not key:
+        # Every name would be an exact or prefix match of the empty key
+        return names.annotate(relevance=Value(SUBSTRING, output_field=IntegerField()), attestation_count=attestation_count)
+
+    variant_match = Exists(NameVariant.objects.filter(
+        name=OuterRef('pk'), key__gte=key, key__lt=key + '\U0010ffff'
+    ))
+    return names.annotate(
+        relevance=Case(
+            When(query=key, then=Value(EXACT)),
+            When(query__startswith=key, then=Value(PREFIX)),
+            When(variant_match, then=Value(VARIANT)),
+            default=Value(SUBSTRING),
+            output_field=IntegerField(),
+        ),
+        attestation_count=attestation_count,
+    )
+
+
+def search_ordering(names, query, use_regex=False, sort=''):
+    """
+    Return the (queryset, ordering) used to list search results. Plain text
+    searches are ranked by relevance unless alphabetical order is asked for;
+    regex searches and queries without a normalized key (empty or only
+    punctuation) are always alphabetical.
+    """
+    if query and not use_regex and sort != SORT_ALPHABETICAL and Name.normalize_for_search(query):
+        return rank_names(names, query), RELEVANCE_ORDERING
+    return names, ALPHABETICAL_ORDERING
+
+
+# =============================================================================
+# Date index
+# =============================================================================
+
+def date_filter(date):
+    """Names attested on a fragment with this date (indexed NameDate lookup)"""
+    return Q(pk__in=NameDate.objects.filter(date=date).values('name_id'))
+
+
+def date_choices():
+    """Distinct fragment dates with attested names, cached per data version"""
+    cache_key = f"namefinder:date_choices:{current_version('instance', 'fragment')}"
+    choices = cache.get(cache_key)
+    if choices is None:
+        choices = list(NameDate.objects.values_list('date', flat=True).distinct().order_by('date'))
+        cache.set(cache_key, choices, None)
+    return choices
+
+
+def _name_date_pairs(instances):
+    return instances.filter(
+        name__isnull=False, fragment__date__isnull=False
+    ).exclude(fragment__date='').order_by().values_list('name_id', 'fragment__date').distinct()
+
+
+def refresh_name_dates(name_ids):
+    """Recompute the NameDate rows of some names from their attestations"""
+    name_ids = {name_id for name_id in name_ids if name_id}
+    if not name_ids:
+        return
+    pairs = list(_name_date_pairs(Instance.objects.filter(name_id__in=name_ids)))
+    NameDate.objects.filter(name_id__in=name_ids).delete()
+    NameDate.objects.bulk_create([NameDate(name_id=name_id, date=date) for name_id, date in pairs])
+
+
+def rebuild_name_dates():
+    """Rebuild the whole NameDate table"""
+    NameDate.objects.all().delete()
+    NameDate.objects.bulk_create(
+        [NameDate(name_id=name_id, date=date) for name_id, date in _name_date_pairs(Instance.objects.all())],
+        batch_size=5000
+    )
+
+
+# =============================================================================
+# Variant index
+# =============================================================================
+
+def variant_lookup_filter(key, prefix=False):
+    """Names with a variant or correspondence whose normalized key equals (or starts with) `key`"""
+    if prefix:
+        variants = NameVariant.objects.filter(key__gte=key, key__lt=key + '\U0010ffff')
+    else:
+        variants = NameVariant.objects.filter(key=key)
+    return Q(pk__in=variants.values('name_id'))
+
+
+def variant_filter(key):
+    """
+    Names with a variant or correspondence containing the normalized `key`.
+    Keys too short for the trigram index fall back to a prefix lookup, as a
+    one or two letter substring of every variant is only noise.
+    """
+    if not key:
+        return Q(pk__in=[])
+    if len(key) < FTS_MIN_LENGTH:
+        return variant_lookup_filter(key, prefix=True)
+    if fts_available():
+        return Q(pk__in=RawSQL(
+            f'SELECT name_id FROM namefinder_namevariant WHERE id IN '
+            f'(SELECT rowid FROM {VARIANT_FTS_TABLE} WHERE {VARIANT_FTS_TABLE} MATCH %s)',
+            [f'key : {fts_phrase(key)}']
+        ))
+    return Q(pk__in=NameVariant.objects.filter(key__contains=key).values('name_id'))
+
+
+def _variant_rows(names):
+    names = [name for name in names if name.pk]
+    entries = [(name.pk, kind, text) for name in names for kind, text in name.variant_entries()]
+    keys = Name.normalize_many(text for _, _, text in entries)
+    positions = {}
+    for (name_id, kind, text), key in zip(entries, keys):
+        if not key:
+            continue
+        position = positions[name_id, kind] = positions.get((name_id, kind), -1) + 1
+        yield NameVariant(name_id=name_id, kind=kind, position=position, text=text[:500], key=key[:500])
+
+
+def refresh_name_variants(names):
+    """Re-parse the variants and correspondences of some saved names"""
+    names = list(names)
+    NameVariant.objects.filter(name_id__in=[name.pk for name in names]).delete()
+    NameVariant.objects.bulk_create(list(_variant_rows(names)))
+
+
+def rebuild_name_variants(batch_size=2000):
+    """Rebuild the whole NameVariant table"""
+    NameVariant.objects.all().delete()
+    names = Name.objects.only('id', 'variant_forms', 'correspondence').order_by('id')
+    batch = []
+    for name in names.iterator(chunk_size=batch_size):
+        batch.append(name)
+        if len(batch) >= batch_size:
+            NameVariant.objects.bulk_create(list(_variant_rows(batch)))
+            batch = []
+    NameVariant.objects.bulk_create(list(_variant_rows(batch)))
+
+
+# =============================================================================
+# Spelling search
+# =============================================================================
+
+def spelling_filter(text):
+    """
+    Filter for attestations whose spelling contains the sign sequence of
+    `text` ('ta-ḫa' matches 'ᵐta-ḫa-aš' but not 'ta-ḫu-ḫa'). On SQLite this
+    is a phrase query on the positional sign index, elsewhere a LIKE scan.
+    """
+    signs = spelling_signs(text)
+    if not signs:
+        return Q(pk__in=[])
+    key = ' '.join(signs)
+    if fts_available():
+        return Q(pk__in=RawSQL(
+            f'SELECT rowid FROM {SPELLING_FTS_TABLE} WHERE {SPELLING_FTS_TABLE} MATCH %s',
+            [f'sign_key : {fts_phrase(key)}']
+        ))
+    return (
+        Q(sign_key=key) | Q(sign_key__startswith=key + ' ')
+        | Q(sign_key__endswith=' ' + key) | Q(sign_key__contains=' ' + key + ' ')
+    )
+
+
+def spelling_search(text):
+    """Attestations matching a sign-sequence query, with their names and fragments"""
+    return Instance.objects.filter(spelling_filter(text)).select_related(
+        'name', 'name__name_type', 'fragment'
+    )
+
+
+def rebuild_sign_keys(batch_size=2000):
+    """Recompute Instance.sign_key for every attestation"""
+    instances = []
+    for instance in Instance.objects.only('id', 'spelling', 'sign_key').order_by().iterator(chunk_size=batch_size):
+        sign_key = ' '.join(spelling_signs(instance.spelling))
+        if sign_key != instance.sign_key:
+            instance.sign_key = sign_key
+            instances.append(instance)
+    Instance.objects.bulk_update(instances, ['sign_key'], batch_size=batch_size)
+    return len(instances)
+
+
+# =============================================================================
+# Full-text index maintenance
+# =============================================================================
+
+def optimize_index():
+    """Merge the FTS index b-trees, worthwhile after large imports"""
+    if fts_available():
+        with connection.cursor() as cursor:
+            for table in (FTS_TABLE, VARIANT_FTS_TABLE, SPELLING_FTS_TABLE):
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+
+
+def rebuild_index():
+    """Rebuild the FTS indexes from scratch from the Name, NameVariant and Instance tables"""
+    if fts_available():
+        with connection.cursor() as cursor:
+            for table in (FTS_TABLE, VARIANT_FTS_TABLE, SPELLING_FTS_TABLE):
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
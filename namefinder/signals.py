@@ -0,0 +1,151 @@
+"""
+Signal handlers recording writes in the DataChange journal and keeping the
+denormalized tables (NameDate, NameVariant, NamePair) in sync.
+
+Bulk operations that bypass signals (bulk_create, bulk_update, queryset
+update) must call versioning.record_change(..., 'bulk') themselves. Long
+imports can wrap their work in deferred_index_updates() to skip per-row
+maintenance and rebuild everything once at the end.
+"""
+import threading
+from contextlib import contextmanager
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Name, Instance, Fragment
+from .lookups import LOOKUP_MODELS
+from .versioning import record_change
+from . import search, cooccurrence
+
+
+_state = threading.local()
+
+
+def updates_deferred():
+    return getattr(_state, 'deferred', False)
+
+
+@contextmanager
+def deferred_index_updates():
+    """Skip per-row journal entries and index maintenance inside the block"""
+    if updates_deferred():
+        yield
+        return
+    _state.deferred = True
+    try:
+        yield
+    finally:
+        _state.deferred = False
+    rebuild_indexes()
+
+
+def rebuild_indexes():
+    """Rebuild every denormalized search table and bump all data versions"""
+    search.rebuild_name_dates()
+    search.rebuild_name_variants()
+    cooccurrence.rebuild_name_pairs()
+    for model_type in ('name', 'fragment', 'instance', 'lookup'):
+        record_change(model_type, 'bulk')
+
+
+# =============================================================================
+# Name
+# =============================================================================
+
+@receiver(post_save, sender=Name)
+def name_saved(sender, instance, **kwargs):
+    if updates_deferred():
+        return
+    search.refresh_name_variants([instance])
+    record_change('name', 'save', instance.pk)
+
+
+@receiver(post_delete, sender=Name)
+def name_deleted(sender, instance, **kwargs):
+    if not updates_deferred():
+        record_change('name', 'delete', instance.pk)
+
+
+# =============================================================================
+# Instance
+# =============================================================================
+
+@receiver(pre_save, sender=Instance)
+def instance_pre_save(sender, instance, **kwargs):
+    # Remember the previous name and fragment so dates and pairs follow the change
+    instance._previous_link = (None, None)
+    if instance.pk and not updates_deferred():
+        instance._previous_link = Instance.objects.filter(
+            pk=instance.pk
+        ).values_list('name_id', 'fragment_id').first() or (None, None)
+
+
+@receiver(post_save, sender=Instance)
+def instance_saved(sender, instance, **kwargs):
+    if updates_deferred():
+        return
+    previous_name_id, previous_fragment_id = getattr(instance, '_previous_link', (None, None))
+    search.refresh_name_dates({instance.name_id, previous_name_id})
+    if (previous_name_id, previous_fragment_id) != (instance.name_id, instance.fragment_id):
+        cooccurrence.unlink(previous_name_id, previous_fragment_id)
+        cooccurrence.link(instance.name_id, instance.fragment_id, instance.pk)
+    record_change('instance', 'save', instance.pk)
+
+
+@receiver(post_delete, sender=Instance)
+def instance_deleted(sender, instance, **kwargs):
+    if updates_deferred():
+        return
+    search.refresh_name_dates({instance.name_id})
+    cooccurrence.refresh_name_pairs({instance.name_id})
+    record_change('instance', 'delete', instance.pk)
+
+
+# =============================================================================
+# Fragment
+# =============================================================================
+
+@receiver(pre_save, sender=Fragment)
+def fragment_pre_save(sender, instance, **kwargs):
+    # Remember the previous date to see whether name dates need refreshing
+    instance._previous_date = None
+    if instance.pk and not updates_deferred():
+        instance._previous_date = Fragment.objects.filter(
+            pk=instance.pk
+        ).values_list('date', flat=True).first()
+
+
+@receiver(post_save, sender=Fragment)
+def fragment_saved(sender, instance, created, **kwargs):
+    if updates_deferred():
+        return
+    if not created and instance.date != getattr(instance, '_previous_date', None):
+        search.refresh_name_dates(
+            Instance.objects.filter(fragment=instance).values_list('name_id', flat=True)
+        )
+    record_change('fragment', 'save', instance.pk)
+
+
+@receiver(post_delete, sender=Fragment)
+def fragment_deleted(sender, instance, **kwargs):
+    # Attestations on the fragment are cascade-deleted and refresh their names
+    if not updates_deferred():
+        record_change('fragment', 'delete', instance.pk)
+
+
+# =============================================================================
+# Lookup tables
+# =============================================================================
+
+def lookup_saved(sender, instance, **kwargs):
+    if not updates_deferred():
+        record_change('lookup', 'save', instance.pk)
+
+
+def lookup_deleted(sender, instance, **kwargs):
+    if not updates_deferred():
+        record_change('lookup', 'delete', instance.pk)
+
+
+for lookup_model in LOOKUP_MODELS:
+    post_save.connect(lookup_saved, sender=lookup_model)
+    post_delete.connect(lookup_deleted, sender=lookup_model)
@@ -1,3 +1,1166 @@
-from django.test import TestCase
+import importlib.util
+import io
+import json
+import random
+import tempfile
+import time
+import networkx as nx
+import numpy as np
+from unittest import mock, skipUnless
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+from .models import Name, Fragment, Instance, NameDate, NameVariant, NamePair, NetworkJob, Series, Milieu, NameType, split_variants, spelling_signs
+from .lookups import lookups, registry
+from .pagination import KeysetPaginator, encode_cursor
+from . import search
+from .typeahead import TypeaheadIndex, index as typeahead_index
+from .matching import registry as match_registry
+from .facets import facet_counts, registry as facet_registry
+from .cooccurrence import rebuild_name_pairs, co_occurring_names
+from . import network, communities, layouts, metrics, payload, pool, jobs, api_views
+from .views import fuzzy_suggestions
+from .regex_engine import RegexSearchEngine, RegexTooExpensive
+from .management.commands.benchmark_normalize import hittite_corpus, reference_normalize_for_search
 
-# Create your tests here.
+
+def sleep(seconds, initial=None):
+    """A pool run taking `seconds`"""
+    time.sleep(seconds)
+    return seconds
+
+
+class NormalizeForSearchTests(SimpleTestCase):
+    """The translation-table normalization must match the original implementation"""
+
+    def test_examples(self):
+        self.assertEqual(Name.normalize_for_search('Kattaḫḫa'), 'kataha')
+        self.assertEqual(Name.normalize_for_search('<sup>d</sup>Tarḫunta'), 'tarhunta')
+        self.assertEqual(Name.normalize_for_search('Gadaḫa'), 'kataha')
+        self.assertEqual(Name.normalize_for_search(''), '')
+        self.assertEqual(Name.normalize_for_search(None), '')
+
+    def test_matches_reference_on_name_corpus(self):
+        corpus = hittite_corpus(50000)
+        expected = [reference_normalize_for_search(text) for text in corpus]
+        self.assertEqual([Name.normalize_for_search(text) for text in corpus], expected)
+        self.assertEqual(Name.normalize_many(corpus), expected)
+
+    def test_matches_reference_on_unicode(self):
+        rng = random.Random(7)
+        corpus = [
+            ''.join(chr(rng.randint(0x20, 0x2FFF)) for _ in range(rng.randint(1, 12)))
+            for _ in range(20000)
+        ]
+        corpus += [chr(codepoint) for codepoint in range(0x20, 0x10000) if not 0xD800 <= codepoint < 0xE000]
+        expected = [reference_normalize_for_search(text) for text in corpus]
+        self.assertEqual(Name.normalize_many(corpus), expected)
+
+
+class TextSearchIndexTests(TestCase):
+    """The trigram table follows Name writes; short terms fall back to LIKE"""
+
+    def fts_ids(self, column, term):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {search.FTS_TABLE} WHERE {search.FTS_TABLE} MATCH %s',
+                [search.match_expression({column: term})]
+            )
+            return sorted(row[0] for row in cursor.fetchall())
+
+    def assertIndexIntact(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}, rank) VALUES ('integrity-check', 1)")
+
+    def test_triggers(self):
+        name = Name.objects.create(name='Tarḫunta', variant_forms='Tarhuntas')
+        other = Name.objects.create(name='Kurunta')
+        self.assertEqual(self.fts_ids('name', 'unta'), [name.pk, other.pk])
+        self.assertEqual(self.fts_ids('query', 'tarhunta'), [name.pk])
+        self.assertEqual(self.fts_ids('variant_forms', 'untas'), [name.pk])
+
+        name.name = 'Arma'
+        name.variant_forms = ''
+        name.save()
+        self.assertEqual(self.fts_ids('name', 'unta'), [other.pk])
+        self.assertEqual(self.fts_ids('query', 'arma'), [name.pk])
+        self.assertEqual(self.fts_ids('variant_forms', 'untas'), [])
+
+        # Queryset updates bypass signals, not the triggers
+        Name.objects.filter(pk=other.pk).update(correspondence='Kuruntiya')
+        self.assertEqual(self.fts_ids('correspondence', 'runti'), [other.pk])
+        other.delete()
+        self.assertEqual(self.fts_ids('name', 'unta'), [])
+        self.assertEqual(self.fts_ids('correspondence', 'runti'), [])
+        self.assertIndexIntact()
+
+    def test_short_terms_use_like(self):
+        names = [Name.objects.create(name=label) for label in ['Ta', 'Pita', 'Kurunta']]
+        self.assertIsNone(search.match_expression({'name': 'ta'}))
+        found = search.filter_names(Name.objects.all(), 'ta')
+        self.assertNotIn('MATCH', str(found.query))
+        self.assertEqual(sorted(found.values_list('pk', flat=True)), [name.pk for name in names])
+        self.assertIn('MATCH', str(search.filter_names(Name.objects.all(), 'unt').query))
+        self.assertEqual(list(search.filter_names(Name.objects.all(), 'unt')), [names[2]])
+
+    def test_migration_requires_trigram_support(self):
+        migration = importlib.import_module('namefinder.migrations.0006_name_fts_index')
+        migration.check_trigram_support(connection)
+        old = mock.MagicMock()
+        old.Database.sqlite_version = '3.31.1'
+        old.cursor.return_value.__enter__.return_value.execute.side_effect = (
+            connection.Database.OperationalError('no such tokenizer: trigram')
+        )
+        with self.assertRaisesMessage(ImproperlyConfigured, 'this Python uses SQLite 3.31.1 (no such tokenizer: trigram)'):
+            migration.check_trigram_support(old)
+
+
+class RegexEngineTests(TestCase):
+    """Regex searches run in a killable helper process with a time budget"""
+
+    def setUp(self):
+        self.engine = RegexSearchEngine(timeout=1.0, cache_size=10)
+        self.addCleanup(self.engine.reset)
+        self.kattahha = Name.objects.create(name='Kattaḫḫa')
+        self.tarhunta = Name.objects.create(name='Tarḫunta', variant_forms='Tarḫuna')
+
+    def test_matches_name_columns(self):
+        self.assertEqual(self.engine.search('^kat'), [self.kattahha.id])
+        self.assertEqual(self.engine.search('ḫuna$'), [self.tarhunta.id])
+
+    def test_matches_variants_and_correspondences(self):
+        tessub = Name.objects.create(name='Tešup', variant_forms='Teššuba', correspondence='Teššub; Adad')
+        self.assertEqual(self.engine.search('teššub$'), [tessub.id])
+        self.assertEqual(self.engine.search('^adad$'), [tessub.id])
+        # Normalized variant keys, like the plain search
+        self.assertEqual(self.engine.search('^tesupa$'), [tessub.id])
+        # An invalid pattern falls back to the plain search, variants included
+        self.assertEqual(list(search.filter_names(Name.objects.all(), 'Adad(', use_regex=True)), [tessub])
+        self.assertEqual(list(search.filter_names(Name.objects.all(), 'teššub[', use_regex=True)), [tessub])
+
+    def test_refreshes_when_names_change(self):
+        self.assertEqual(self.engine.search('^zit'), [])
+        zita = Name.objects.create(name='Zita')
+        self.assertEqual(self.engine.search('^zit'), [zita.id])
+
+    def test_catastrophic_pattern_is_rejected(self):
+        Name.objects.create(name='a' * 40 + '!')
+        with self.assertRaises(RegexTooExpensive):
+            self.engine.search('^(a+)+b')
+        # The helper is respawned for the next pattern
+        self.assertEqual(self.engine.search('^kat'), [self.kattahha.id])
+
+    def test_dead_helper_is_respawned(self):
+        self.engine.search('^kat')
+        # The helper dies without the engine noticing before it sends a pattern
+        self.engine.process.kill()
+        self.engine.process.join()
+        with mock.patch.object(self.engine.process, 'is_alive', return_value=True):
+            with self.assertRaises(RegexTooExpensive):
+                self.engine.search('^tar')
+        self.assertEqual(self.engine.search('una$'), [self.tarhunta.id])
+
+
+class KeysetPaginatorTests(TestCase):
+    """Walking cursors forwards and backwards visits every name exactly once"""
+
+    def setUp(self):
+        for i in range(23):
+            Name.objects.create(name=f'Name{i % 7}')
+        # Names without a query sort first, as with OFFSET pagination
+        Name.objects.bulk_create([Name(name='Untitled'), Name(name='Another')])
+        self.ordering = ['query', 'name', 'id']
+        self.expected = list(Name.objects.order_by(*self.ordering).values_list('id', flat=True))
+
+    def test_forward_and_backward(self):
+        paginator = KeysetPaginator(Name.objects.all(), self.ordering, 5, count_key={'test': 1})
+        self.assertEqual(paginator.count, 25)
+        self.assertEqual(paginator.num_pages, 5)
+
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([name.id for page in pages for name in page], self.expected)
+        self.assertEqual([page.number for page in pages], [1, 2, 3, 4, 5])
+
+        page = paginator.get_page(pages[-1].last_cursor)
+        self.assertEqual([name.id for name in page], self.expected[20:])
+        visited = list(page)
+        while page.has_previous():
+            page = paginator.get_page(page.previous_cursor)
+            visited = list(page) + visited
+        self.assertEqual([name.id for name in visited], self.expected)
+
+    def test_invalid_cursor_returns_first_page(self):
+        paginator = KeysetPaginator(Name.objects.all(), self.ordering, 5)
+        self.assertEqual([name.id for name in paginator.get_page('not-a-cursor')], self.expected[:5])
+
+    def test_tampered_cursor_returns_first_page(self):
+        paginator = KeysetPaginator(Name.objects.all(), self.ordering, 5)
+        for values in (['name1', 'Name1', 'x'], ['name1', 'Name1', 2 ** 70], ['name1', 'Name1', [1]]):
+            page = paginator.get_page(encode_cursor('next', 2, values))
+            self.assertEqual([name.id for name in page], self.expected[:5])
+        # Relevance is an annotation: its output field checks the value
+        names, ordering = search.search_ordering(search.filter_names(Name.objects.all(), 'name'), 'name')
+        paginator = KeysetPaginator(names, ordering, 5)
+        first = [name.id for name in paginator.get_page()]
+        self.assertEqual([name.id for name in paginator.get_page(encode_cursor('next', 2, ['best', 0, '', '', 1]))], first)
+
+
+class NameDateIndexTests(TestCase):
+    """The NameDate table follows attestation and fragment edits"""
+
+    def setUp(self):
+        self.name = Name.objects.create(name='Pijamaradu')
+        self.other = Name.objects.create(name='Tawagalawa')
+        self.series = Series.objects.create(name='KUB')
+        self.fragment = Fragment.objects.create(
+            series=self.series, fragment_number='14.3', series_fragment='KUB 14.3', date='NH'
+        )
+
+    def dates(self, name):
+        return list(NameDate.objects.filter(name=name).values_list('date', flat=True))
+
+    def test_signals_keep_dates_in_sync(self):
+        instance = Instance.objects.create(name=self.name, fragment=self.fragment)
+        self.assertEqual(self.dates(self.name), ['NH'])
+
+        self.fragment.date = 'LNS'
+        self.fragment.save()
+        self.assertEqual(self.dates(self.name), ['LNS'])
+        self.assertEqual(search.date_choices(), ['LNS'])
+
+        instance.name = self.other
+        instance.save()
+        self.assertEqual(self.dates(self.name), [])
+        self.assertEqual(self.dates(self.other), ['LNS'])
+
+        instance.delete()
+        self.assertFalse(NameDate.objects.exists())
+
+    def test_date_filter(self):
+        Instance.objects.create(name=self.name, fragment=self.fragment)
+        Instance.objects.create(name=self.name, fragment=Fragment.objects.create(
+            series=self.series, fragment_number='1.1', series_fragment='KUB 1.1', date='NH'
+        ))
+        names = Name.objects.filter(search.date_filter('NH'))
+        self.assertEqual(list(names), [self.name])
+
+
+class NameVariantTests(TestCase):
+    """Variants and correspondences are parsed into their own indexed rows"""
+
+    def setUp(self):
+        self.name = Name.objects.create(
+            name='Muwattalli', variant_forms='Muwatalli; Muu̯atalli', correspondence='Mutallu'
+        )
+
+    def test_split_variants(self):
+        self.assertEqual(split_variants('a, b;c<br>d\na, '), ['a', 'b', 'c', 'd'])
+        self.assertEqual(split_variants(None), [])
+
+    def test_rows_follow_saves(self):
+        rows = list(NameVariant.objects.values_list('kind', 'position', 'key'))
+        self.assertEqual(rows, [
+            ('correspondence', 0, 'mutalu'), ('variant', 0, 'muwatali'), ('variant', 1, 'muatali'),
+        ])
+        self.assertEqual(self.name.query, 'muwatali')
+
+        self.name.variant_forms = ''
+        self.name.save()
+        self.assertEqual(NameVariant.objects.filter(kind='variant').count(), 0)
+
+    def test_migration(self):
+        from django.apps import apps
+        migration = importlib.import_module('namefinder.migrations.0010_namevariant')
+        self.name.variant_forms = '?; Muwatalli; Muu̯atalli'
+        self.name.save()
+        saved = list(NameVariant.objects.values_list('name_id', 'kind', 'position', 'text', 'key'))
+        NameVariant.objects.all().delete()
+        # Positions skip the entry without a key, as on save
+        migration.populate_variants(apps, None)
+        self.assertEqual(list(NameVariant.objects.values_list('name_id', 'kind', 'position', 'text', 'key')), saved)
+
+        migration.restore_combined_query(apps, None)
+        self.name.refresh_from_db()
+        self.assertEqual(self.name.query, Name.normalize_for_search('Muwattalli ?; Muwatalli; Muu̯atalli Mutallu'))
+
+    def test_lookups(self):
+        other = Name.objects.create(name='Tawagalawa', variant_forms='Tawakalawa')
+        self.assertEqual(list(Name.objects.filter(search.variant_lookup_filter('mutalu'))), [self.name])
+        self.assertEqual(list(Name.objects.filter(search.variant_lookup_filter('muwa', prefix=True))), [self.name])
+        self.assertEqual(list(Name.objects.filter(search.variant_lookup_filter('muwa'))), [])
+        self.assertEqual(list(search.filter_names(Name.objects.all(), 'wakala')), [other])
+        # Entries are matched one by one, never across a separator
+        self.assertEqual(list(search.filter_names(Name.objects.all(), 'lim')), [])
+
+
+class RelevanceRankingTests(TestCase):
+    """Plain searches list exact, prefix, variant and substring hits in that order"""
+
+    def setUp(self):
+        self.series = Series.objects.create(name='KUB')
+        fragment = Fragment.objects.create(series=self.series, fragment_number='1.1', series_fragment='KUB 1.1')
+        self.names = {
+            label: Name.objects.create(name=label, variant_forms=variants)
+            for label, variants in [
+                ('Tarhuntassa', ''), ('Tarhunta', ''), ('Piha-Tarhunta', ''),
+                ('Tarhuntapiya', ''), ('Runtiya', 'Tarhuntiya'), ('Kurunta', 'Tarhuntaš'),
+            ]
+        }
+        for _ in range(3):
+            Instance.objects.create(name=self.names['Tarhuntapiya'], fragment=fragment)
+
+    def ranked(self, query, **kwargs):
+        names, ordering = search.search_ordering(search.filter_names(Name.objects.all(), query), query, **kwargs)
+        return [name.name for name in names.order_by(*ordering)]
+
+    def test_tiers(self):
+        self.assertEqual(self.ranked('tarhunta'), [
+            'Tarhunta', 'Tarhuntapiya', 'Tarhuntassa', 'Kurunta', 'Piha-Tarhunta',
+        ])
+        self.assertEqual(self.ranked('tarhunta', sort=search.SORT_ALPHABETICAL), [
+            'Kurunta', 'Piha-Tarhunta', 'Tarhunta', 'Tarhuntapiya', 'Tarhuntassa',
+        ])
+
+    def test_punctuation_query(self):
+        # '-.' normalizes to nothing: no name is an exact or prefix match of it
+        self.assertEqual(Name.normalize_for_search('-.'), '')
+        ranked = search.rank_names(Name.objects.all(), '-.')
+        self.assertEqual(set(ranked.values_list('relevance', flat=True)), {search.SUBSTRING})
+        self.assertEqual(ranked.get(name='Tarhuntapiya').attestation_count, 3)
+        self.assertEqual(self.ranked('-'), ['Piha-Tarhunta'])
+        self.assertEqual(search.search_ordering(Name.objects.all(), '-.')[1], search.ALPHABETICAL_ORDERING)
+
+    def test_keyset_pages(self):
+        names, ordering = search.search_ordering(search.filter_names(Name.objects.all(), 'tar'), 'tar')
+        paginator = KeysetPaginator(names, ordering, 2)
+        page = paginator.get_page()
+        seen = [name.name for name in page]
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            seen.extend(name.name for name in page)
+        self.assertEqual(seen, self.ranked('tar'))
+
+
+class NameMatchApiTests(TestCase):
+    """The bulk matching endpoint streams one typed result per input"""
+
+    def setUp(self):
+        match_registry.clear()
+        typeahead_index.version = None
+        self.name = Name.objects.create(name='Ḫattušili', variant_forms='Hattusilis')
+        self.url = '/api/name/match/'
+
+    def results(self, response):
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_match_types(self):
+        response = self.client.post(
+            self.url, json.dumps({'names': ['HATTUSILI', 'hattusilis', 'Hatusilli', 'xyz', 'hattusili']}),
+            content_type='application/json'
+        )
+        results = self.results(response)
+        self.assertEqual([r['match'] for r in results], ['exact', 'variant', 'exact', 'none', 'exact'])
+        self.assertEqual(results[0]['names'], [{'id': self.name.pk, 'name': 'Ḫattušili'}])
+        self.assertEqual(results[1]['normalized'], 'hatusilis')
+
+        response = self.client.post(self.url, 'Hattusila\n', content_type='text/plain')
+        [result] = self.results(response)
+        self.assertEqual(result['match'], 'fuzzy')
+        self.assertEqual(result['names'][0]['id'], self.name.pk)
+
+    def test_fuzzy_flag(self):
+        def match(fuzzy):
+            response = self.client.post(
+                self.url, json.dumps({'names': ['Hattusila'], 'fuzzy': fuzzy}), content_type='application/json'
+            )
+            return [r['match'] for r in self.results(response)] if response.status_code == 200 else response.status_code
+
+        self.assertEqual(match(True), ['fuzzy'])
+        self.assertEqual(match(False), ['none'])
+        self.assertEqual(match('false'), ['none'])
+        self.assertEqual(match('Yes'), ['fuzzy'])
+        self.assertEqual(match('maybe'), 400)
+        self.assertEqual(match(0), 400)
+
+    def test_rejects_bad_batches(self):
+        self.assertEqual(self.client.post(self.url, '{"names": 1}', content_type='application/json').status_code, 400)
+        with self.settings(NAME_MATCH_MAX_BATCH=2):
+            response = self.client.post(self.url, json.dumps({'names': ['a', 'b', 'c']}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SpellingSearchTests(TestCase):
+    """Spellings are tokenized into signs and searched by sign sequence"""
+
+    def test_signs(self):
+        self.assertEqual(spelling_signs('ᵐta-ḫa-aš₂'), ['{m}', 'ta', 'ha', 'as'])
+        self.assertEqual(spelling_signs('<sup>URU</sup>[Ḫa-at]-⸢tu⸣-ša'), ['{uru}', 'ha', 'at', 'tu', 'sa'])
+        self.assertEqual(spelling_signs('DUMU.LUGAL=ša'), ['dumu', 'lugal', 'sa'])
+        self.assertEqual(spelling_signs(None), [])
+
+    def test_sign_sequences(self):
+        series = Series.objects.create(name='KBo')
+        fragment = Fragment.objects.create(series=series, fragment_number='3.4', series_fragment='KBo 3.4')
+        name = Name.objects.create(name='Taḫaš')
+        spellings = ['ᵐta-ḫa-aš', 'ta-ḫu-ḫa', '{m}ta-ḫa-a-ta']
+        for spelling in spellings:
+            Instance.objects.create(name=name, fragment=fragment, spelling=spelling)
+
+        def found(query):
+            return sorted(instance.spelling for instance in search.spelling_search(query))
+
+        self.assertEqual(found('ta-ḫa'), ['{m}ta-ḫa-a-ta', 'ᵐta-ḫa-aš'])
+        self.assertEqual(found('ᵐta-ha'), ['{m}ta-ḫa-a-ta', 'ᵐta-ḫa-aš'])
+        self.assertEqual(found('ḫa-ta'), [])
+        self.assertEqual(found('ḫu'), ['ta-ḫu-ḫa'])
+
+        instance = Instance.objects.get(spelling='ta-ḫu-ḫa')
+        instance.spelling = 'ta-ḫa'
+        instance.save()
+        self.assertEqual(len(found('ta-ḫa')), 3)
+
+
+class FacetCountTests(TestCase):
+    """Each facet counts the hits its values would leave under the other filters"""
+
+    def setUp(self):
+        facet_registry.clear()
+        registry.clear()
+        self.person = NameType.objects.create(name='person')
+        self.deity = NameType.objects.create(name='deity')
+        self.hattian = Milieu.objects.create(name='Hattian')
+        self.series = Series.objects.create(name='KUB')
+        fragment = Fragment.objects.create(series=self.series, fragment_number='1.1', series_fragment='KUB 1.1', date='NH')
+        for name, name_type, milieu in [
+            ('Tarhunta', self.deity, None), ('Tarhuntassa', self.person, self.hattian),
+            ('Tarhuntapiya', self.person, None), ('Kurunta', self.person, self.hattian),
+        ]:
+            name = Name.objects.create(name=name, name_type=name_type, milieu=milieu)
+            if name.name != 'Kurunta':
+                Instance.objects.create(name=name, fragment=fragment)
+
+    def counts(self, query, filters):
+        return facet_counts(filters, search.filter_names(Name.objects.all(), query) if query else None)
+
+    def test_counts(self):
+        counts = self.counts('tarh', {})
+        self.assertEqual(counts['total'], 3)
+        self.assertEqual(counts['name_type'], {self.deity.pk: 1, self.person.pk: 2})
+        self.assertEqual(counts['milieu'], {self.hattian.pk: 1})
+        self.assertEqual(counts['date'], {'NH': 3})
+
+        # A selected filter narrows the other facets but not its own
+        counts = self.counts('', {'name_type': str(self.person.pk)})
+        self.assertEqual(counts['total'], 3)
+        self.assertEqual(counts['name_type'], {self.deity.pk: 1, self.person.pk: 3})
+        self.assertEqual(counts['milieu'], {self.hattian.pk: 2})
+        self.assertEqual(counts['date'], {'NH': 2})
+
+    def test_json(self):
+        response = self.client.get('/api/search/facets/', {'q': 'tarh', 'milieu': str(self.hattian.pk)})
+        data = response.json()
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(
+            [(row['name'], row['count']) for row in data['facets']['name_type']], [('deity', 0), ('person', 1)]
+        )
+        self.assertEqual(data['facets']['date'], [{'name': 'NH', 'count': 1}])
+
+    def test_incremental_refresh(self):
+        queries = [('tarh', {}), ('', {'name_type': str(self.person.pk)}), ('', {'date': 'OH'}), ('a', {'milieu': str(self.hattian.pk)})]
+        before = [self.counts(*query) for query in queries]
+        self.assertEqual(facet_registry.last_refresh['kind'], 'full')
+        tarhunta, kurunta = Name.objects.get(name='Tarhunta'), Name.objects.get(name='Kurunta')
+        old = Fragment.objects.create(series=self.series, fragment_number='2', series_fragment='KUB 2', date='MH')
+        attestation = Instance.objects.create(name=kurunta, fragment=old)
+        Instance.objects.create(name=Name.objects.create(name='Arma', milieu=self.hattian), fragment=old)
+        tarhunta.name_type = self.person
+        tarhunta.save()
+        Name.objects.get(name='Tarhuntapiya').delete()
+        old.date = 'OH'
+        old.save()
+        attestation.delete()
+
+        after = [self.counts(*query) for query in queries]
+        self.assertEqual(facet_registry.last_refresh['kind'], 'incremental')
+        self.assertNotEqual(after, before)
+        facet_registry.clear()
+        self.assertEqual([self.counts(*query) for query in queries], after)
+        self.assertEqual(facet_registry.last_refresh['kind'], 'full')
+
+
+class NamePairTests(TestCase):
+    """The pair table follows attestation writes and matches a full rebuild"""
+
+    def setUp(self):
+        self.series = Series.objects.create(name='KUB')
+        self.fragments = [
+            Fragment.objects.create(series=self.series, fragment_number=str(i), series_fragment=f'KUB {i}')
+            for i in range(3)
+        ]
+        self.names = [Name.objects.create(name=label) for label in ['Aba', 'Bada', 'Kada', 'Zida']]
+        network.store.clear()
+
+    def pairs(self):
+        return set(NamePair.objects.values_list('name_a__name', 'name_b__name', 'shared_fragments'))
+
+    def assert_consistent(self):
+        pairs = self.pairs()
+        rebuild_name_pairs()
+        self.assertEqual(pairs, self.pairs())
+        # The graph store patched in memory agrees with the table
+        self.assertEqual(pairs, {
+            (name.name, other.name, other.co_occurrence_count)
+            for name in self.names for other in co_occurring_names(name) if name.name < other.name
+        })
+        return pairs
+
+    def test_incremental_maintenance(self):
+        a, b, c, d = self.names
+        f0, f1, f2 = self.fragments
+        Instance.objects.create(name=a, fragment=f0)
+        Instance.objects.create(name=b, fragment=f0)
+        Instance.objects.create(name=b, fragment=f0)
+        moving = Instance.objects.create(name=c, fragment=f1)
+        Instance.objects.create(name=a, fragment=f1)
+        Instance.objects.create(name=d, fragment=f1)
+        self.assertEqual(self.assert_consistent(), {
+            ('Aba', 'Bada', 1), ('Aba', 'Kada', 1), ('Aba', 'Zida', 1), ('Kada', 'Zida', 1),
+        })
+
+        moving.fragment = f0
+        moving.save()
+        self.assertEqual(self.assert_consistent(), {
+            ('Aba', 'Bada', 1), ('Aba', 'Kada', 1), ('Bada', 'Kada', 1), ('Aba', 'Zida', 1),
+        })
+
+        # Batch deletes and cascades
+        Instance.objects.filter(fragment=f0, name__in=[a, b]).delete()
+        self.assertEqual(self.assert_consistent(), {('Aba', 'Zida', 1)})
+        f1.delete()
+        self.assertEqual(self.assert_consistent(), set())
+
+    def test_co_occurring_names(self):
+        a, b, c, d = self.names
+        for fragment in self.fragments:
+            Instance.objects.create(name=a, fragment=fragment)
+        for name, fragments in [(d, self.fragments), (c, self.fragments[:2]), (b, self.fragments[:2])]:
+            for fragment in fragments:
+                Instance.objects.create(name=name, fragment=fragment)
+        names = co_occurring_names(a, limit=2)
+        self.assertEqual([(name.name, name.co_occurrence_count) for name in names], [('Zida', 3), ('Bada', 2)])
+
+
+class NetworkTestCase(TestCase):
+    """Empty network caches, and helpers to attest names on KUB fragments"""
+
+    def setUp(self):
+        network.store.clear()
+        communities.cache.clear()
+        layouts.cache.clear()
+        metrics.cache.clear()
+        self.kub = Series.objects.create(name='KUB')
+
+    def fragments(self, count, series=None, dates=None):
+        series = series or self.kub
+        return [
+            Fragment.objects.create(series=series, fragment_number=str(i), series_fragment=f'{series.name} {i}', date=date)
+            for i, date in enumerate(dates or [None] * count)
+        ]
+
+    def names(self, labels, **fields):
+        return [Name.objects.create(name=label, **fields) for label in labels]
+
+    def attest(self, fragments, pairs):
+        """One instance per (name, fragment position) pair"""
+        for name, fragment in pairs:
+            Instance.objects.create(name=name, fragment=fragments[fragment])
+
+
+class NetworkEngineTests(NetworkTestCase):
+    """Sparse co-occurrence edges match pairwise counting"""
+
+    def test_incidence_edges(self):
+        rng = random.Random(7)
+        name_ids = [rng.randint(1, 40) for _ in range(600)]
+        fragment_ids = [rng.randint(1, 90) for _ in range(600)]
+        by_fragment = {}
+        for name_id, fragment_id in zip(name_ids, fragment_ids):
+            by_fragment.setdefault(fragment_id, set()).add(name_id)
+        expected = {}
+        for names in by_fragment.values():
+            for a in names:
+                for b in names:
+                    if a < b:
+                        expected[(a, b)] = expected.get((a, b), 0) + 1
+        a, b, weights = network.incidence_edges(name_ids, fragment_ids)
+        self.assertEqual(dict(zip(zip(a.tolist(), b.tolist()), weights.tolist())), expected)
+        self.assertEqual(len(network.incidence_edges([1, 2], [1, 2])[0]), 0)
+
+    def test_build_reads_pairs(self):
+        fragments = self.fragments(2)
+        a, b, c = self.names(['Aba', 'Bada', 'Kada'])
+        self.attest(fragments, [(a, 0), (b, 0), (a, 1), (b, 1), (c, 1)])
+        store = network.GraphStore()
+        with store.lock:
+            store.refresh()
+        self.assertEqual(store.edge_weights.tolist(), [2, 1, 1])
+        # A full build takes the pair table as it stands
+        NamePair.objects.filter(name_a=a, name_b=b).update(shared_fragments=5)
+        store.build(store.version)
+        self.assertEqual(store.edge_weights.tolist(), [5, 1, 1])
+
+    def test_network_data(self):
+        kbo = Series.objects.create(name='KBo')
+        fragments = self.fragments(2) + self.fragments(1, kbo)
+        a, b, c, d = self.names(['Aba', 'Bada', 'Kada', 'Zida'])
+        self.attest(fragments, [(a, 0), (b, 0), (a, 1), (b, 1), (c, 1), (a, 2), (c, 2)])
+        Instance.objects.create(name=d)
+
+        def network_data(**params):
+            data = json.loads(self.client.get('/api/network/', params).content)
+            return (
+                {node['name']: (node['attestations'], node['connections']) for node in data['nodes']},
+                {(edge['source'], edge['target'], edge['weight']) for edge in data['edges']},
+            )
+
+        nodes, edges = network_data()
+        self.assertEqual(nodes, {'Aba': (3, 2), 'Bada': (2, 2), 'Kada': (2, 2)})
+        self.assertEqual(edges, {(a.pk, b.pk, 2), (a.pk, c.pk, 2), (b.pk, c.pk, 1)})
+        nodes, edges = network_data(series=self.kub.pk, min_attestations=3, min_connections=0)
+        self.assertEqual(nodes, {'Aba': (3, 0)})
+        nodes, edges = network_data(series=self.kub.pk, min_connections=2)
+        self.assertEqual(nodes, {'Aba': (3, 2), 'Bada': (2, 2), 'Kada': (2, 2)})
+        self.assertEqual(edges, {(a.pk, b.pk, 2), (a.pk, c.pk, 1), (b.pk, c.pk, 1)})
+
+    def test_compact_formats(self):
+        god = NameType.objects.create(name='DN')
+        fragments = self.fragments(3)
+        a, b, c = self.names(['Aba', 'Bada', 'Kada'], name_type=god)
+        d, = self.names(['Zida'])
+        self.attest(fragments, [(a, 0), (b, 0), (a, 1), (c, 1), (d, 1), (b, 2), (d, 2)])
+
+        def decoded(**params):
+            response = self.client.get('/api/network/', params)
+            if params['format'] == 'columnar':
+                data = json.loads(response.content)
+                columns = {f'{group}.{column}': values for group in ('nodes', 'edges') for column, values in data[group].items()}
+                names = columns['nodes.name']
+            else:
+                data, columns = payload.read_binary(b''.join(response.streaming_content))
+                names = data['names']
+            ids = list(columns['nodes.id'])
+            nodes = {
+                int(node_id): (name, data['name_types'][code], int(count), int(connections))
+                for node_id, name, code, count, connections in zip(
+                    ids, names, columns['nodes.name_type'], columns['nodes.attestations'], columns['nodes.connections']
+                )
+            }
+            edges = {
+                (int(ids[source]), int(ids[target]), int(weight))
+                for source, target, weight in zip(columns['edges.source'], columns['edges.target'], columns['edges.weight'])
+            }
+            return nodes, edges, data['ego'], data['stats']
+
+        for params in [{}, {'ego_name': d.pk}, {'min_connections': 3}]:
+            data = json.loads(self.client.get('/api/network/', params).content)
+            nodes = {
+                node['id']: (node['name'], node['name_type'], node['attestations'], node['connections'])
+                for node in data['nodes']
+            }
+            edges = {(edge['source'], edge['target'], edge['weight']) for edge in data['edges']}
+            ego = [node['id'] for node in data['nodes'] if node.get('is_ego')]
+            for response_format in ('columnar', 'binary'):
+                self.assertEqual(decoded(format=response_format, **params), (nodes, edges, ego, data['stats']))
+        self.assertEqual(decoded(format='binary')[0][d.pk], ('Zida', 'Unknown', 2, 3))
+        self.assertEqual(self.client.get('/api/network/', {'format': 'xml'}).status_code, 400)
+
+    def test_store_incremental(self):
+        kbo = Series.objects.create(name='KBo')
+        fragments = self.fragments(4)
+        names = self.names([f'Name{i}' for i in range(6)])
+        rng = random.Random(5)
+        instances = [
+            Instance.objects.create(name=rng.choice(names), fragment=rng.choice(fragments)) for _ in range(20)
+        ]
+
+        def snapshot(store, series=()):
+            graph = store.graph(series)
+            return (
+                graph.ids.tolist(), graph.attestations.tolist(), graph.type_ids.tolist(),
+                sorted(zip(graph.ids[graph.pa].tolist(), graph.ids[graph.pb].tolist(), graph.weights.tolist())),
+            )
+
+        store = network.GraphStore()
+        snapshot(store)
+        self.assertEqual(store.last_refresh['kind'], 'full')
+        for step in range(6):
+            instances[step].fragment = rng.choice(fragments)
+            instances[step].save()
+            instances[-1 - step].delete()
+            Instance.objects.create(name=rng.choice(names), fragment=rng.choice(fragments))
+            Instance.objects.create(name=rng.choice(names))
+        names[0].name_type = NameType.objects.create(name='Deity')
+        names[0].save()
+        names[1].delete()
+        Name.objects.create(name='Late')
+        fragments[0].series = kbo
+        fragments[0].save()
+
+        for series in [(), (kbo.pk,)]:
+            self.assertEqual(snapshot(store, series), snapshot(network.GraphStore(), series))
+        self.assertEqual(store.last_refresh['kind'], 'incremental')
+        self.assertEqual(store.stats()['attestations'], Instance.objects.count())
+
+    def test_store_patches(self):
+        rng = random.Random(11)
+        rows = {pk: (pk, rng.randint(1, 8), rng.choice([None, *range(1, 6)])) for pk in range(10, 60)}
+        names, fragments = [(i, None) for i in range(1, 9)], [(i, 1, None) for i in range(1, 6)]
+        store = network.GraphStore()
+        store.load(sorted(rows.values()), names, fragments)
+        for _ in range(30):
+            pks = set(rng.sample(sorted(rows), 3)) | {rng.randint(1, 100)}
+            for pk in pks:
+                if rng.random() < 0.4:
+                    rows.pop(pk, None)
+                else:
+                    rows[pk] = (pk, rng.randint(1, 8), rng.choice([None, *range(1, 6)]))
+            store.update_instances(sorted(pks), [rows[pk] for pk in pks if pk in rows])
+            fresh = network.GraphStore()
+            fresh.load(sorted(rows.values()), names, fragments)
+            self.assertEqual(store.edge_keys.tolist(), fresh.edge_keys.tolist())
+            self.assertEqual(store.edge_weights.tolist(), fresh.edge_weights.tolist())
+            self.assertEqual(store.attestations.tolist(), fresh.attestations.tolist())
+            self.assertEqual(store.describe()['attestations'], len(rows))
+
+
+class EgoNetworkTests(NetworkTestCase):
+    """Multi-hop neighbourhoods of chosen names"""
+
+    def test_ego_limits(self):
+        # Star around 1 (shared fragments 5, 4, 3), then a chain 4 - 5 - 6
+        ids = np.arange(1, 7)
+        graph = network.Graph()
+        graph.load(ids, np.ones(6, dtype=np.int64), np.zeros(6, dtype=np.int64),
+                   np.array([1, 1, 1, 4, 5]), np.array([2, 3, 4, 5, 6]), np.array([3, 5, 4, 1, 1]))
+
+        def ego(*args, **kwargs):
+            mask, truncated = graph.ego_mask(*args, **kwargs)
+            return ids[mask].tolist(), truncated
+
+        self.assertEqual(ego([2], 1), ([1, 2], False))
+        self.assertEqual(ego([2], 3), ([1, 2, 3, 4, 5], False))
+        self.assertEqual(ego([2], 4), ([1, 2, 3, 4, 5, 6], False))
+        self.assertEqual(ego([1], 1, hop_limit=2), ([1, 3, 4], True))
+        self.assertEqual(ego([1], 3, max_nodes=3), ([1, 3, 4], True))
+        self.assertEqual(ego([99], 2), ([], False))
+
+    def test_ego_api(self):
+        fragments = self.fragments(3)
+        a, b, c, d = self.names(['Aba', 'Bada', 'Kada', 'Zida'])
+        self.attest(fragments, [(a, 0), (b, 0), (a, 1), (b, 1), (c, 1), (a, 2), (c, 2)])
+        Instance.objects.create(name=d)
+
+        def ego_names(**params):
+            data = self.client.get('/api/network/', params).json()
+            return {node['name']: (node['attestations'], node['connections']) for node in data['nodes']}
+
+        self.assertEqual(ego_names(ego_name=b.pk, min_attestations=3), {'Aba': (3, 2), 'Bada': (2, 2), 'Kada': (2, 2)})
+        # Multi-hop expansion reaches Zida only at two hops
+        Instance.objects.create(name=d, fragment=fragments[2])
+        self.assertNotIn('Zida', ego_names(ego_name=b.pk))
+        self.assertEqual(ego_names(ego_name=b.pk, ego_degree=2)['Zida'], (2, 2))
+
+
+class EdgePruningTests(NetworkTestCase):
+    """Edge association scores, top-k and backbone pruning"""
+
+    def test_top_edges(self):
+        rng = np.random.default_rng(3)
+        pa, pb = rng.integers(0, 30, 200), rng.integers(0, 30, 200)
+        scores = rng.integers(0, 5, 200).astype(float)
+        keep = network.top_edges(30, pa, pb, scores, 3)
+        for edge in range(200):
+            best = [
+                sorted((-scores[other], other) for other in range(200) if end in (pa[other], pb[other]))[:3]
+                for end in (pa[edge], pb[edge])
+            ]
+            self.assertEqual(keep[edge], any((-scores[edge], edge) in top for top in best))
+
+    def test_disparity(self):
+        # A strong edge among weak ones belongs to the backbone
+        alphas = network.disparity(4, np.array([0, 0, 0, 1]), np.array([1, 2, 3, 2]), np.array([20, 1, 1, 1]))
+        self.assertLess(alphas[0], 0.05)
+        self.assertTrue((alphas[1:] > 0.05).all())
+
+    def test_edge_weights_api(self):
+        fragments = self.fragments(4)
+        a, b, c, d = self.names(['Aba', 'Bada', 'Kada', 'Zida'])
+        self.attest(fragments, [(a, 0), (b, 0), (a, 1), (b, 1), (c, 1), (a, 2), (c, 2), (d, 3)])
+
+        def scored(**params):
+            data = json.loads(self.client.get('/api/network/', params).content)
+            return {(edge['source'], edge['target']): edge['score'] for edge in data['edges']}, data['stats']
+
+        edges, stats = scored(edge_weight='jaccard')
+        self.assertEqual(edges, {(a.pk, b.pk): 0.6667, (a.pk, c.pk): 0.6667, (b.pk, c.pk): 0.3333})
+        edges, stats = scored(edge_weight='pmi')
+        self.assertAlmostEqual(edges[(b.pk, c.pk)], round(float(np.log(4 / 4)), 4))
+        self.assertAlmostEqual(edges[(a.pk, b.pk)], round(float(np.log(2 * 4 / 6)), 4))
+        edges, stats = scored(edge_weight='jaccard', top_k=1)
+        self.assertEqual(set(edges), {(a.pk, b.pk), (a.pk, c.pk)})
+        self.assertEqual(stats['pruned_edges'], 1)
+        self.assertEqual(self.client.get('/api/network/', {'edge_weight': 'cosine'}).status_code, 400)
+
+    def test_invalid_parameters(self):
+        # Errors name the parameter, not Python's conversion message
+        for url, params, error in [
+            ('/api/network/', {'min_connections': 'x'}, 'min_connections must be an integer'),
+            ('/api/network/', {'backbone': '5%'}, 'backbone must be a number'),
+            ('/api/network/', {'backbone': '0.05', 'top_k': 'all'}, 'top_k must be an integer'),
+            ('/api/network/', {'series': 'KUB'}, 'series must be integer ids'),
+            ('/api/network/', {'ego_name': '1', 'ego_degree': '1.5'}, 'ego_degree must be an integer'),
+            ('/api/network/metrics/', {'limit': 'ten'}, 'limit must be an integer'),
+            ('/api/network/metrics/', {'name_type': 'god'}, 'name_type must be integer ids'),
+            ('/api/network/', {'period': 'mh', 'min_attestations': '2.0'}, 'min_attestations must be an integer'),
+            ('/api/network/', {'period': 'mh', 'ego_name': 'Aba'}, 'ego_name must be integer ids'),
+        ]:
+            response = self.client.get(url, params)
+            self.assertEqual((response.status_code, response.json()), (400, {'error': error}))
+
+
+class NetworkJobTests(NetworkTestCase):
+    """Large networks are computed by background jobs"""
+
+    def test_network_jobs(self):
+        fragments = self.fragments(1)
+        self.attest(fragments, [(name, 0) for name in self.names(['Aba', 'Bada', 'Kada'])])
+        params = {'format': 'binary', 'communities': 'true', 'layout': 'true'}
+        inline = b''.join(self.client.get('/api/network/', params).streaming_content)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(NETWORK_JOB_MIN_EDGES=2, NETWORK_JOB_DIR=directory):
+            response = self.client.get('/api/network/', params)
+            self.assertEqual(response.status_code, 202)
+            job = response.json()
+            self.assertEqual(job['status'], 'queued')
+            self.assertEqual(NetworkJob.objects.get(pk=job['job']).status, 'queued')
+            # The same request shares the job
+            self.assertEqual(self.client.get('/api/network/', dict(reversed(params.items()))).json()['job'], job['job'])
+            self.assertEqual(self.client.get(f'/api/network/jobs/{job["job"]}/result/').status_code, 409)
+
+            call_command('run_network_jobs', once=True, stdout=io.StringIO())
+            job = self.client.get(job['status_url']).json()
+            self.assertEqual(job['status'], 'done')
+            row = NetworkJob.objects.get(pk=job['job'])
+            self.assertEqual((row.status, row.content_type), ('done', 'application/octet-stream'))
+            self.assertIsNotNone(row.finished_at)
+            result = self.client.get(job['result_url'])
+            self.assertEqual(result['Content-Type'], 'application/octet-stream')
+            self.assertEqual(b''.join(result.streaming_content), inline)
+
+            # Small networks stay inline
+            self.assertEqual(self.client.get('/api/network/', {'min_connections': 3}).status_code, 200)
+            # Size is bounded from degrees before selecting: pruning does not keep a request inline
+            self.assertEqual(self.client.get('/api/network/', {'top_k': 1}).status_code, 202)
+
+    def test_size_counts_selected_edges(self):
+        god = NameType.objects.create(name='DN')
+        fragments = self.fragments(2)
+        a, b = self.names(['Aba', 'Bada'], name_type=god)
+        self.attest(fragments, [(a, 0), (b, 0)] + [(name, 1) for name in [a] + self.names(['Kada', 'Zida', 'Piha'])])
+        graph = network.store.graph()
+        # Aba's edges to the untyped names do not count for a DN network
+        self.assertEqual(api_views.network_size(QueryDict(f'name_type={god.pk}'), graph), 1)
+        self.assertEqual(api_views.network_size(QueryDict(''), graph), 7)
+        with override_settings(NETWORK_JOB_MIN_EDGES=1):
+            self.assertEqual(self.client.get('/api/network/', {'name_type': god.pk}).status_code, 200)
+
+    def test_submit_shares_one_row(self):
+        params = QueryDict('min_connections=2&series=1')
+        job = jobs.submit(params, 5)
+        self.assertEqual(jobs.submit(QueryDict('series=1&min_connections=2'), 5), job)
+        self.assertNotEqual(jobs.submit(params, 6), job)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            NetworkJob.objects.create(query=job.query, version=5)
+        # A failed job is queued again
+        NetworkJob.objects.filter(pk=job.pk).update(status='failed', error='boom')
+        again = jobs.submit(params, 5)
+        self.assertEqual((again.pk, again.status, again.error), (job.pk, 'queued', ''))
+        self.assertEqual(NetworkJob.objects.filter(version=5).count(), 1)
+
+
+class NetworkPeriodTests(NetworkTestCase):
+    """One network per group of dates, with the changes between them"""
+
+    def test_date_slices(self):
+        fragments = self.fragments(5, dates=['mh', 'mh', 'jh', 'sjh', None])
+        a, b, c, d = self.names(['Aba', 'Bada', 'Kada', 'Zida'])
+        self.attest(fragments, [(a, 0), (b, 0), (a, 1), (b, 1), (a, 2), (b, 2), (c, 2), (c, 3), (d, 3), (d, 4), (a, 4)])
+
+        data = self.client.get('/api/network/', {'period': ['mh', 'jh,sjh'], 'min_connections': 1}).json()
+        self.assertEqual([period['dates'] for period in data['periods']], [['mh'], ['jh', 'sjh']])
+        self.assertEqual({name['id'] for name in data['names']}, {a.pk, b.pk, c.pk, d.pk})
+        first, second = data['periods']
+        self.assertEqual(first['edges'], [{'source': a.pk, 'target': b.pk, 'weight': 2}])
+        self.assertEqual({node['id']: node['attestations'] for node in first['nodes']}, {a.pk: 2, b.pk: 2})
+        self.assertEqual(first['diff']['added_nodes'], [a.pk, b.pk])
+        self.assertEqual(
+            {(edge['source'], edge['target']): edge['weight'] for edge in second['edges']},
+            {(a.pk, b.pk): 1, (a.pk, c.pk): 1, (b.pk, c.pk): 1, (c.pk, d.pk): 1},
+        )
+        self.assertEqual(second['diff']['added_nodes'], [c.pk, d.pk])
+        self.assertEqual(second['diff']['removed_nodes'], [])
+        self.assertEqual(sorted(second['diff']['added_edges']), sorted([[a.pk, c.pk, 1], [b.pk, c.pk, 1], [c.pk, d.pk, 1]]))
+        self.assertEqual(second['diff']['reweighted_edges'], [[a.pk, b.pk, 1]])
+
+        # Reversed slices: the later names leave again
+        data = self.client.get('/api/network/', {'period': ['jh,sjh', 'mh']}).json()
+        diff = data['periods'][1]['diff']
+        self.assertEqual(diff['removed_nodes'], [c.pk, d.pk])
+        self.assertEqual(sorted(diff['removed_edges']), sorted([[a.pk, c.pk], [b.pk, c.pk], [c.pk, d.pk]]))
+        # Aba joins Zida's ego network on the undated fragment, and is attested in mh
+        ego = self.client.get('/api/network/', {'period': ['mh', 'sjh'], 'ego_name': d.pk}).json()
+        self.assertEqual([[node['id'] for node in period['nodes']] for period in ego['periods']], [[a.pk], [c.pk, d.pk]])
+        self.assertEqual(self.client.get('/api/network/', {'period': 'mh', 'format': 'binary'}).status_code, 400)
+
+
+class CentralityTests(NetworkTestCase):
+    """Centrality scores of the names of a network"""
+
+    def setUp(self):
+        super().setUp()
+        self.graph = nx.gnm_random_graph(40, 90, seed=5)
+        self.graph.add_node(40)
+        for a, b in self.graph.edges:
+            self.graph[a][b]['weight'] = (a * b) % 4 + 1
+        edges = np.array(sorted(self.graph.edges))
+        weights = np.array([self.graph[a][b]['weight'] for a, b in edges])
+        _, self.scores = metrics.centrality(np.arange(41), edges[:, 0], edges[:, 1], weights)
+
+    def assertMatches(self, metric, expected):
+        np.testing.assert_allclose(self.scores[metric], [expected[node] for node in range(41)], atol=1e-8)
+
+    def test_matches_networkx(self):
+        self.assertMatches('eigenvector', nx.eigenvector_centrality(self.graph, weight='weight', tol=1e-12, max_iter=1000))
+        self.assertMatches('betweenness', nx.betweenness_centrality(self.graph))
+        self.assertAlmostEqual(self.scores['pagerank'].sum(), 1.0)
+
+    @skipUnless(importlib.util.find_spec('scipy'), 'networkx computes PageRank with scipy')
+    def test_pagerank_matches_networkx(self):
+        self.assertMatches('pagerank', nx.pagerank(self.graph, weight='weight', tol=1e-12, max_iter=1000))
+
+    def test_metrics_api(self):
+        # A chain: the middle names lie on most shortest paths
+        fragments = self.fragments(3)
+        names = self.names(['Aba', 'Bada', 'Kada', 'Zida'])
+        self.attest(fragments, [(names[i + end], i) for i in range(3) for end in (0, 1)])
+        data = self.client.get('/api/network/metrics/', {'order_by': 'betweenness', 'limit': 2}).json()
+        self.assertEqual([row['id'] for row in data['names']], [names[1].pk, names[2].pk])
+        self.assertEqual(data['names'][0]['betweenness'], round(2 / 3, 6))
+        self.assertEqual(data['names'][0]['degree'], 2)
+        self.assertEqual(data['stats']['total_nodes'], 4)
+        self.assertEqual(self.client.get('/api/network/metrics/', {'order_by': 'closeness'}).status_code, 400)
+
+
+class LayoutTests(NetworkTestCase):
+    """Node positions, warm-started from the cached layout"""
+
+    def test_layouts(self):
+        # Two groups of names sharing one fragment each, joined by one shared name
+        fragments = self.fragments(2)
+        names = self.names([f'Name {i}' for i in range(9)])
+        self.attest(fragments, [(name, i // 5) for i, name in enumerate(names)] + [(names[0], 1)])
+
+        data = json.loads(self.client.get('/api/network/', {'layout': 'true'}).content)
+        self.assertFalse(data['stats']['layout_pending'])
+        places = {node['id']: np.array([node['x'], node['y']]) for node in data['nodes']}
+        self.assertTrue(all(0 <= value <= 1 for place in places.values() for value in place))
+        centres = [np.mean([places[name.pk] for name in group], axis=0) for group in (names[1:5], names[5:])]
+        spread = max(np.linalg.norm(places[name.pk] - centres[0]) for name in names[1:5])
+        self.assertGreater(np.linalg.norm(centres[0] - centres[1]), spread)
+
+        header, columns = payload.read_binary(b''.join(
+            self.client.get('/api/network/', {'layout': 'true', 'format': 'binary'}).streaming_content
+        ))
+        for name_id, x, y in zip(columns['nodes.id'], columns['nodes.x'], columns['nodes.y']):
+            self.assertTrue(np.allclose(places[int(name_id)], [x, y], atol=1e-4))
+
+        # A new name starts from the cached layout: the others barely move
+        Instance.objects.create(name=Name.objects.create(name='Name 9'), fragment=fragments[1])
+        data = json.loads(self.client.get('/api/network/', {'layout': 'true'}).content)
+        moved = [np.linalg.norm(places[node['id']] - [node['x'], node['y']]) for node in data['nodes'] if node['id'] in places]
+        self.assertLess(np.mean(moved), 0.2)
+
+
+class CommunityTests(NetworkTestCase):
+    """Louvain communities at every level of the dendrogram"""
+
+    # Two triangles joined by one weak edge
+    NODES = list(range(1, 7))
+    EDGES = [(1, 2, 5), (1, 3, 5), (2, 3, 5), (4, 5, 5), (4, 6, 5), (5, 6, 5), (3, 4, 1)]
+
+    def test_partition(self):
+        dendrogram = communities.louvain(self.NODES, self.EDGES, 1.0)
+        self.assertEqual(dendrogram, communities.louvain(self.NODES, self.EDGES, 1.0))
+        partition = communities.partition(dendrogram)
+        self.assertEqual(partition[1], partition[3])
+        self.assertNotEqual(partition[1], partition[4])
+        self.assertEqual(communities.partition(dendrogram, 99), partition)
+        self.assertEqual(set(communities.partition(dendrogram, 0)), set(self.NODES))
+
+    def test_cache(self):
+        # Cached per key and version; a new version warm-starts from the last partition
+        nodes, edges = self.NODES, self.EDGES
+        cached = communities.cache.result('key', 1, nodes, edges, 1.0, timeout=30)
+        self.assertEqual(cached, communities.louvain(nodes, edges, 1.0))
+        self.assertIs(communities.cache.result('key', 1, [], [], 1.0, timeout=30), cached)
+        moved = communities.cache.result('key', 2, nodes + [7], edges + [(6, 7, 5)], 1.0, timeout=30)
+        self.assertEqual(communities.partition(moved)[7], communities.partition(moved)[4])
+        self.assertEqual(communities.cache.entries['key'].version, 2)
+        # Numbered by smallest member, a warm start agrees with a cold one
+        self.assertEqual(communities.partition(moved), {1: 0, 2: 0, 3: 0, 4: 1, 5: 1, 6: 1, 7: 1})
+        communities.cache.clear()
+        self.assertEqual(communities.cache.result('key', 2, nodes + [7], edges + [(6, 7, 5)], 1.0, timeout=30), moved)
+
+    def test_canonical_numbers(self):
+        dendrogram = [{1: 5, 2: 5, 3: 2, 4: 7}, {5: 1, 2: 0, 7: 0}]
+        self.assertEqual(communities.canonical(dendrogram), [{1: 0, 2: 0, 3: 1, 4: 2}, {0: 0, 1: 1, 2: 1}])
+        self.assertEqual(communities.partition(communities.canonical(dendrogram)), {1: 0, 2: 0, 3: 1, 4: 1})
+
+    def test_timeout_recycles_pool(self):
+        cache = pool.ResultCache(sleep)
+        with mock.patch.object(pool, '_inline', False):
+            first = pool.executor()
+            self.assertIsNone(cache.result('key', 1, 30, timeout=0.5))
+            self.assertIsNot(pool.executor(), first)
+            self.assertEqual(cache.result('key', 2, 0, timeout=30), 0)
+
+    def test_communities_api(self):
+        # Any level of the cached dendrogram, and the graph of the communities
+        names = {node: name for node, name in zip(self.NODES, self.names([f'Name {node}' for node in self.NODES]))}
+        fragments = iter(self.fragments(sum(weight for _, _, weight in self.EDGES)))
+        for a, b, weight in self.EDGES:
+            for _ in range(weight):
+                fragment = next(fragments)
+                Instance.objects.create(name=names[a], fragment=fragment)
+                Instance.objects.create(name=names[b], fragment=fragment)
+        params = {'communities': 'true', 'supergraph': 'true', 'min_connections': 1}
+        data = self.client.get('/api/network/', params).json()
+        self.assertGreaterEqual(data['stats']['community_levels'], 1)
+        self.assertEqual([node['members'] for node in data['supergraph']['nodes']], [3, 3])
+        self.assertEqual([node['internal_weight'] for node in data['supergraph']['nodes']], [15, 15])
+        self.assertEqual(data['supergraph']['edges'], [{'source': 0, 'target': 1, 'weight': 1}])
+        finest = self.client.get('/api/network/', dict(params, community_level=0)).json()
+        self.assertEqual(sum(node['members'] for node in finest['supergraph']['nodes']), 6)
+        header, _ = payload.read_binary(b''.join(
+            self.client.get('/api/network/', dict(params, format='binary')).streaming_content
+        ))
+        self.assertEqual(header['supergraph'], data['supergraph'])
+
+
+class LookupRegistryTests(TestCase):
+    """Lookup tables are served from memory until a lookup row changes"""
+
+    def setUp(self):
+        registry.clear()
+        Milieu.objects.create(name='Hattian')
+
+    def test_reloads_after_write(self):
+        tables = lookups()
+        self.assertEqual(tables.id_for(Milieu, 'Hattian'), Milieu.objects.get(name='Hattian').pk)
+        with self.assertNumQueries(1):
+            self.assertIs(lookups(), tables)
+
+        hurrian = Milieu.objects.create(name='Hur')
+        tables = lookups()
+        self.assertEqual(tables.by_label(Milieu, 'Hur'), hurrian)
+        self.assertEqual(tables.get(Milieu, str(hurrian.pk)), hurrian)
+        self.assertIsNone(tables.by_label(Milieu, 'Luwian'))
+
+
+class TypeaheadTests(TestCase):
+    """Exact, prefix and substring tiers, ordered by attestation count"""
+
+    def setUp(self):
+        series = Series.objects.create(name='KBo')
+        fragment = Fragment.objects.create(series=series, fragment_number='1.1', series_fragment='KBo 1.1')
+        self.names = {}
+        for label, attestations in [('Tarḫunta', 1), ('Tarḫuntašša', 3), ('Arma-Tarḫunta', 5), ('Tar', 0)]:
+            name = Name.objects.create(name=label)
+            for _ in range(attestations):
+                Instance.objects.create(name=name, fragment=fragment)
+            self.names[label] = name
+        self.index = TypeaheadIndex()
+
+    def labels(self, q):
+        return [(name, match) for _, name, _, _, match in self.index.search(q)]
+
+    def test_ranking(self):
+        self.assertEqual(self.labels('tarhunta'), [
+            ('Tarḫunta', 'exact'), ('Tarḫuntašša', 'prefix'), ('Arma-Tarḫunta', 'substring'),
+        ])
+        self.assertEqual(self.labels('ta')[0], ('Tarḫuntašša', 'prefix'))
+
+    def test_incremental_refresh(self):
+        self.index.search('tar')
+        name = self.names['Tarḫunta']
+        name.name = 'Kurunta'
+        name.save()
+        self.names['Tar'].delete()
+        self.assertEqual([label for label, _ in self.labels('tar')], ['Tarḫuntašša', 'Arma-Tarḫunta'])
+        self.assertEqual(self.labels('kurunta'), [('Kurunta', 'exact')])
+
+        Instance.objects.filter(name=self.names['Arma-Tarḫunta']).delete()
+        self.assertEqual(self.labels('tarhunta'), [('Tarḫuntašša', 'prefix'), ('Arma-Tarḫunta', 'substring')])
+
+        # Moving an attestation recounts its old and its new name
+        attestation = Instance.objects.filter(name=self.names['Tarḫuntašša']).first()
+        attestation.name = name
+        attestation.save()
+        counts = {label: count for _, label, _, count, _ in self.index.search('unta')}
+        self.assertEqual(counts, {'Tarḫuntašša': 2, 'Kurunta': 2, 'Arma-Tarḫunta': 0})
+
+    def test_variants_and_correspondences(self):
+        name = self.names['Tarḫunta']
+        name.variant_forms = 'Tarḫuntaš; Tarḫunza'
+        name.correspondence = 'Teššub'
+        name.save()
+        self.assertEqual(self.labels('tarhuntas')[0], ('Tarḫunta', 'exact'))
+        self.assertEqual(self.labels('teššub'), [('Tarḫunta', 'exact')])
+        self.assertEqual(self.labels('tesu'), [('Tarḫunta', 'prefix')])
+
+        # Variants follow name edits, and a full build indexes them too
+        name.correspondence = 'Adad'
+        name.save()
+        self.assertEqual(self.labels('teššub'), [])
+        self.assertEqual(self.labels('adad'), [('Tarḫunta', 'exact')])
+        self.index.version = None
+        self.assertEqual(self.labels('tarhunza'), [('Tarḫunta', 'exact')])
+
+        typeahead_index.version = None
+        results = self.client.get('/api/name/search/', {'q': 'Adad'}).json()['results']
+        self.assertEqual([result['name'] for result in results], ['Tarḫunta'])
+
+    def test_nearest(self):
+        nearest = [(name, distance) for _, name, _, _, distance in self.index.nearest('Tarhunda')]
+        self.assertEqual(nearest[0], ('Tarḫunta', 0))
+        nearest = [(name, distance) for _, name, _, _, distance in self.index.nearest('Tarunta')]
+        self.assertEqual(nearest[0], ('Tarḫunta', 1))
+        self.assertEqual(self.index.nearest('Kurunta'), [])
+
+    def test_did_you_mean(self):
+        typeahead_index.version = None
+        suggestions = fuzzy_suggestions(Name.objects.exclude(name='Tarḫuntašša'), 'Tarunta')
+        self.assertEqual([(name.name, name.distance) for name in suggestions], [('Tarḫunta', 1)])
+
+    def test_http_caching(self):
+        typeahead_index.version = None
+        response = self.client.get('/api/name/search/', {'q': 'tarh'})
+        self.assertEqual(response.json()['results'][0]['name'], 'Tarḫuntašša')
+        self.assertIn('max-age', response['Cache-Control'])
+        response = self.client.get('/api/name/search/', {'q': 'tarh'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
@@ -0,0 +1,513 @@
+"""
+In-memory name index for autocompletion and "did you mean" suggestions.
+
+Every name is indexed under its original form (tags stripped,
+lower-cased), the normalized keys of its spelling variants and
+correspondences (NameVariant rows) and its normalized search form, so
+"Tarhuntas" or "Teššub" find the name they are listed under. Results are
+ranked exact
+matches first, then prefix matches, then substring matches, each tier
+ordered by attestation count (then name, then id).
+
+* exact matches come from a key -> slots dict;
+* prefixes of up to PREFIX_DEPTH characters have a precomputed top list,
+  longer prefixes are a bisect range over the sorted keys (or, for very
+  common prefixes, a walk over the rank-ordered postings);
+* substrings walk the rank-ordered posting list of the rarest bi-/trigram
+  of the query and stop as soon as enough results are found.
+
+The index is built once per worker and then kept in sync incrementally
+from the DataChange journal: changed names are re-indexed one by one and
+attestation changes only recount the names of the changed attestations
+(their previous names are kept in an AttestedNames map), moving those
+whose counts changed. Bulk changes (or a journal gap) trigger a full
+rebuild. Results are cached per query until
+the next change.
+
+The same posting lists serve as the n-gram candidate index of the fuzzy
+search: names sharing the most grams with the query are verified with a
+bounded edit distance, so no query scans every name.
+"""
+import heapq
+import threading
+import numpy as np
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from .models import Name, NameVariant, DataChange, HTML_TAG_RE
+from .versioning import current_version, AttestedNames, JOURNAL_KEEP
+
+
+# Longest prefix with a precomputed top list
+PREFIX_DEPTH = 3
+# Most results one query can return
+MAX_RESULTS = 50
+# Longer prefixes matching more keys than this are answered from the postings
+RANGE_SCAN_LIMIT = 5000
+# Postings walked in rank order before switching to a list intersection
+POSTINGS_WALK_LIMIT = 300
+# Candidates few enough to verify without intersecting further lists
+INTERSECT_ENOUGH = 200
+# Names changed since the last refresh above which a full rebuild is cheaper
+INCREMENTAL_LIMIT = 5000
+# Query results cached per worker process
+RESULT_CACHE_SIZE = 1024
+# Names sharing the most grams with a fuzzy query that get an edit-distance check
+FUZZY_CANDIDATES = 300
+# Largest edit distance accepted, as a fraction of the query length
+FUZZY_DISTANCE_RATIO = 0.34
+
+EXACT, PREFIX, SUBSTRING = 0, 1, 2
+MATCH_LABELS = {EXACT: 'exact', PREFIX: 'prefix', SUBSTRING: 'substring'}
+
+
+def name_keys(name, normalized, variant_keys=()):
+    """
+    Distinct non-empty index keys of a name: its original form, its variant
+    keys and, always last, its normalized form
+    """
+    original = HTML_TAG_RE.sub('', name or '').lower().strip()
+    keys = tuple(dict.fromkeys(key for key in (original, *variant_keys) if key and key != normalized))
+    return keys + (normalized,) if normalized else keys
+
+
+def query_keys(q):
+    """Forms of the user's query matched against the index keys"""
+    return name_keys(q, Name.normalize_for_search(q))
+
+
+def grams(key):
+    """Bigrams and trigrams of a key (a 2-character key is its own gram)"""
+    result = set()
+    for size in (2, 3):
+        for i in range(len(key) - size + 1):
+            result.add(key[i:i + size])
+    return result
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance of a and b, or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    # Only cells within `limit` of the diagonal can stay under the limit
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i, char in enumerate(a, 1):
+        current = [i if i <= limit else over] + [over] * len(b)
+        low = max(1, i - limit)
+        high = min(len(b), i + limit)
+        best = current[0]
+        for j in range(low, high + 1):
+            cost = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char != b[j - 1]),
+            )
+            current[j] = cost
+            if cost < best:
+                best = cost
+        if best > limit:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+def variant_keys(name_ids=None):
+    """Name id -> normalized keys of its variants and correspondences"""
+    rows = NameVariant.objects.exclude(key='')
+    if name_ids is not None:
+        rows = rows.filter(name_id__in=name_ids)
+    keys = {}
+    for name_id, key in rows.order_by('name_id', 'kind', 'position').values_list('name_id', 'key'):
+        keys.setdefault(name_id, []).append(key)
+    return keys
+
+
+def search_gram_candidates(key):
+    """Grams of a query key whose posting lists all contain its matches"""
+    size = min(3, len(key))
+    return {key[i:i + size] for i in range(len(key) - size + 1)}
+
+
+class TypeaheadIndex:
+    """Per-process typeahead index, refreshed from the DataChange journal"""
+
+    def __init__(self, result_cache_size=RESULT_CACHE_SIZE):
+        self.result_cache_size = result_cache_size
+        self.version = None
+        self.lock = threading.Lock()
+        self.results = OrderedDict()
+        self.attested = AttestedNames()
+        self.clear()
+
+    def clear(self):
+        self.slots = {}          # name id -> slot
+        self.ids = []            # slot -> name id (None when free)
+        self.labels = []         # slot -> name
+        self.type_ids = []       # slot -> name_type_id
+        self.counts = []         # slot -> attestation count
+        self.keys = []           # slot -> index keys
+        self.rank = []           # slot -> sort key within a tier
+        self.free = []
+        self.sorted_keys = []    # sorted (key, slot)
+        self.exact = {}          # key -> [slot]
+        self.postings = {}       # gram -> [slot] in rank order
+        self.posting_arrays = {} # gram -> sorted array of its slots
+        self.gram_sizes = []     # slot -> number of distinct grams
+        self.key_lengths = []    # slot -> length of the normalized key
+        self.columns = None      # numpy copies of the two lists above
+        self.prefix_top = {}     # short prefix -> best slots in rank order
+        self.dirty_prefixes = set()
+        self.results.clear()
+
+    # -------------------------------------------------------------------------
+    # Querying
+    # -------------------------------------------------------------------------
+
+    def search(self, q, limit=20):
+        """Ranked matches for `q` as (name id, name, name_type_id, count, match) tuples"""
+        with self.lock:
+            self.refresh()
+            return self.query(q, limit)
+
+    def query(self, q, limit=20):
+        """Like search(), without bringing the index up to date first"""
+        limit = max(1, min(limit, MAX_RESULTS))
+        cache_key = (q, limit)
+        if cache_key in self.results:
+            self.results.move_to_end(cache_key)
+            return self.results[cache_key]
+
+        result = [
+            (self.ids[slot], self.labels[slot], self.type_ids[slot], self.counts[slot], MATCH_LABELS[tier])
+            for slot, tier in self.match(query_keys(q), limit)
+        ]
+        self.results[cache_key] = result
+        while len(self.results) > self.result_cache_size:
+            self.results.popitem(last=False)
+        return result
+
+    def match(self, keys, limit):
+        """Best `limit` (slot, tier) pairs for the query forms `keys`"""
+        tiers = {}
+        for key in keys:
+            for slot in self.exact.get(key, ())[:limit]:
+                tiers[slot] = EXACT
+
+        prefixed = set()
+        for key in keys:
+            prefixed.update(self.prefix_matches(key, limit))
+        for slot in heapq.nsmallest(limit, prefixed - tiers.keys(), key=self.rank.__getitem__):
+            tiers[slot] = PREFIX
+
+        need = limit - len(tiers)
+        if need > 0:
+            contained = set()
+            for key in keys:
+                contained.update(self.substring_matches(key, need, tiers))
+            for slot in heapq.nsmallest(need, contained, key=self.rank.__getitem__):
+                tiers[slot] = SUBSTRING
+
+        ranked = sorted(tiers.items(), key=lambda item: (item[1], self.rank[item[0]]))
+        return ranked[:limit]
+
+    def prefix_matches(self, key, limit):
+        """Best slots with a key starting with `key`, in rank order"""
+        if len(key) < 2:
+            return []
+        if len(key) <= PREFIX_DEPTH:
+            if key in self.dirty_prefixes:
+                self.prefix_top[key] = self.best_with_prefix(key, MAX_RESULTS)
+                self.dirty_prefixes.discard(key)
+            return self.prefix_top.get(key, [])[:limit]
+        return self.best_with_prefix(key, limit)
+
+    def best_with_prefix(self, key, limit):
+        lo = bisect_left(self.sorted_keys, (key,))
+        hi = bisect_left(self.sorted_keys, (key + '\U0010ffff',), lo)
+        if hi - lo > RANGE_SCAN_LIMIT:
+            # Many matches: the rank-ordered postings reach the best ones sooner
+            return self.walk_postings(key, limit, (), prefix=True)
+        slots = {slot for _, slot in self.sorted_keys[lo:hi]}
+        return heapq.nsmallest(limit, slots, key=self.rank.__getitem__)
+
+    def substring_matches(self, key, need, exclude):
+        """Up to `need` best slots containing `key`, skipping `exclude`"""
+        if len(key) < 2:
+            return []
+        return self.walk_postings(key, need, exclude)
+
+    def walk_postings(self, key, limit, exclude, prefix=False):
+        """First `limit` slots (in rank order) with a key containing (or starting with) `key`"""
+        candidates = sorted(search_gram_candidates(key), key=lambda gram: len(self.postings.get(gram, ())))
+        keys = self.keys
+        found = []
+        for i, slot in enumerate(self.postings.get(candidates[0], ())):
+            if i == POSTINGS_WALK_LIMIT and not prefix and len(candidates) > 1:
+                # Few matches so far: intersect the posting lists instead
+                return self.intersect_postings(key, limit, exclude, prefix, candidates)
+            if slot in exclude:
+                continue
+            for k in keys[slot]:
+                if (k.startswith(key) if prefix else key in k):
+                    found.append(slot)
+                    break
+            if len(found) >= limit:
+                break
+        return found
+
+    def posting_array(self, gram):
+        """Posting list of a gram as a sorted array (cached until the list changes)"""
+        array = self.posting_arrays.get(gram)
+        if array is None:
+            array = np.sort(np.asarray(self.postings.get(gram, ()), dtype=np.int32))
+            self.posting_arrays[gram] = array
+        return array
+
+    def intersect_postings(self, key, limit, exclude, prefix, candidates):
+        common = self.posting_array(candidates[0])
+        for gram in candidates[1:]:
+            if len(common) <= INTERSECT_ENOUGH:
+                break
+            common = np.intersect1d(common, self.posting_array(gram), assume_unique=True)
+        keys = self.keys
+        matched = [
+            slot for slot in common.tolist()
+            if slot not in exclude and any((k.startswith(key) if prefix else key in k) for k in keys[slot])
+        ]
+        return heapq.nsmallest(limit, matched, key=self.rank.__getitem__)
+
+    # -------------------------------------------------------------------------
+    # Fuzzy matching
+    # -------------------------------------------------------------------------
+
+    def nearest(self, q, k=10, max_distance=None):
+        """
+        The k names closest to `q` by edit distance, as (name id, name,
+        name_type_id, count, distance) tuples ordered by distance and rank
+        """
+        with self.lock:
+            self.refresh()
+            return self.closest(q, k, max_distance)
+
+    def closest(self, q, k=10, max_distance=None):
+        """Like nearest(), without bringing the index up to date first"""
+        key = Name.normalize_for_search(q)
+        if len(key) < 2:
+            return []
+        if max_distance is None:
+            max_distance = max(1, round(len(key) * FUZZY_DISTANCE_RATIO))
+
+        # Candidates: names of a possible length with the most bi-/trigrams in
+        # common with the query, relative to their size (Dice coefficient)
+        key_grams = grams(key)
+        arrays = [self.posting_array(gram) for gram in key_grams]
+        arrays = [array for array in arrays if len(array)]
+        if not arrays:
+            return []
+        if self.columns is None:
+            self.columns = (np.array(self.gram_sizes, dtype=np.int32), np.array(self.key_lengths, dtype=np.int32))
+        gram_sizes, key_lengths = self.columns
+        shared = np.bincount(np.concatenate(arrays), minlength=len(self.ids))
+        candidates = np.flatnonzero(shared)
+        candidates = candidates[np.abs(key_lengths[candidates] - len(key)) <= max_distance]
+        if len(candidates) > FUZZY_CANDIDATES:
+            score = shared[candidates] / (gram_sizes[candidates] + len(key_grams))
+            candidates = candidates[np.argpartition(score, -FUZZY_CANDIDATES)[-FUZZY_CANDIDATES:]]
+
+        matches = []
+        for slot in candidates.tolist():
+            if self.ids[slot] is None:
+                continue
+            # The normalized form is the last index key of a name
+            distance = edit_distance(key, self.keys[slot][-1], max_distance)
+            if distance <= max_distance:
+                matches.append((distance, self.rank[slot], slot))
+        return [
+            (self.ids[slot], self.labels[slot], self.type_ids[slot], self.counts[slot], distance)
+            for distance, _, slot in heapq.nsmallest(k, matches)
+        ]
+
+    # -------------------------------------------------------------------------
+    # Building and incremental refresh
+    # -------------------------------------------------------------------------
+
+    def refresh(self):
+        """Bring the index up to the current name/instance data version"""
+        version = current_version('name', 'instance')
+        if version == self.version:
+            return
+        if self.version is None or not 0 < version - self.version < JOURNAL_KEEP:
+            self.build(version)
+            return
+
+        changes = DataChange.objects.filter(
+            id__gt=self.version, id__lte=version, model_type__in=['name', 'instance']
+        ).values_list('model_type', 'action', 'object_id')
+        changed = {'name': set(), 'instance': set()}
+        for model_type, action, object_id in changes:
+            if action == 'bulk' or object_id is None:
+                self.build(version)
+                return
+            changed[model_type].add(object_id)
+        if len(changed['name']) + len(changed['instance']) > INCREMENTAL_LIMIT:
+            self.build(version)
+            return
+
+        # Names the changed attestations belonged to before and belong to now
+        recount = self.attested.update(changed['instance']) - changed['name']
+        self.update_names(changed['name'])
+        self.update_counts(self.attested.counts(recount), recount)
+        self.version = version
+        self.results.clear()
+
+    def build(self, version):
+        """Index every name from scratch"""
+        self.attested.load()
+        self.load(Name.objects.values_list('id', 'name', 'name_type_id'), self.attested.counts(), variant_keys())
+        self.version = version
+
+    def load(self, rows, counts, variants=None):
+        """
+        Index (id, name, name_type_id) rows with attestation counts and
+        variant keys by name id
+        """
+        self.clear()
+        rows = list(rows)
+        variants = variants or {}
+        normalized = Name.normalize_many(name for _, name, _ in rows)
+        self.gram_sizes = [0] * len(rows)
+        self.key_lengths = [0] * len(rows)
+
+        for slot, ((name_id, name, type_id), norm) in enumerate(zip(rows, normalized)):
+            keys = name_keys(name, norm, variants.get(name_id, ()))
+            self.slots[name_id] = slot
+            self.ids.append(name_id)
+            self.labels.append(name)
+            self.type_ids.append(type_id)
+            self.counts.append(counts.get(name_id, 0))
+            self.keys.append(keys)
+            self.rank.append((-self.counts[slot], keys[0] if keys else '', name_id))
+
+        # Filling posting and prefix lists in rank order keeps them sorted
+        sorted_keys = []
+        for slot in sorted(range(len(rows)), key=self.rank.__getitem__):
+            keys = self.keys[slot]
+            prefixes = set()
+            for key in keys:
+                sorted_keys.append((key, slot))
+                self.exact.setdefault(key, []).append(slot)
+                prefixes.update(key[:size] for size in range(2, min(len(key), PREFIX_DEPTH) + 1))
+            for prefix in prefixes:
+                top = self.prefix_top.setdefault(prefix, [])
+                if len(top) < MAX_RESULTS:
+                    top.append(slot)
+            slot_grams = set().union(*map(grams, keys))
+            for gram in slot_grams:
+                self.postings.setdefault(gram, []).append(slot)
+            self.gram_sizes[slot] = len(slot_grams)
+            self.key_lengths[slot] = len(keys[-1]) if keys else 0
+        sorted_keys.sort()
+        self.sorted_keys = sorted_keys
+        # Long lists are the ones intersected; converting them on first use is slow
+        for gram, postings in self.postings.items():
+            if len(postings) > POSTINGS_WALK_LIMIT:
+                self.posting_array(gram)
+
+    def update_names(self, name_ids):
+        """Re-index some names after saves or deletes"""
+        rows = Name.objects.filter(id__in=name_ids).values_list('id', 'name', 'name_type_id')
+        rows = {row[0]: row for row in rows}
+        counts = self.attested.counts(rows.keys()) if rows else {}
+        variants = variant_keys(rows.keys()) if rows else {}
+        for name_id in name_ids:
+            if name_id in self.slots:
+                self.remove(self.slots[name_id])
+            if name_id in rows:
+                _, name, type_id = rows[name_id]
+                self.add(name_id, name, type_id, counts.get(name_id, 0), variants.get(name_id, ()))
+
+    def update_counts(self, counts, name_ids):
+        """Move those of some names whose attestation count changed"""
+        for name_id in name_ids:
+            slot = self.slots.get(name_id)
+            if slot is None:
+                continue
+            count = counts.get(name_id, 0)
+            if count != self.counts[slot]:
+                self.unlink(slot)
+                self.counts[slot] = count
+                self.rank[slot] = (-count,) + self.rank[slot][1:]
+                self.link(slot)
+
+    def add(self, name_id, name, type_id, count, variants=()):
+        keys = name_keys(name, Name.normalize_for_search(name), variants)
+        slot = self.free.pop() if self.free else len(self.ids)
+        if slot == len(self.ids):
+            for column in (self.ids, self.labels, self.type_ids, self.counts, self.keys, self.rank,
+                           self.gram_sizes, self.key_lengths):
+                column.append(None)
+        self.slots[name_id] = slot
+        self.ids[slot] = name_id
+        self.labels[slot] = name
+        self.type_ids[slot] = type_id
+        self.counts[slot] = count
+        self.keys[slot] = keys
+        self.rank[slot] = (-count, keys[0] if keys else '', name_id)
+        for key in keys:
+            insort(self.sorted_keys, (key, slot))
+        self.link(slot)
+
+    def remove(self, slot):
+        self.unlink(slot)
+        for key in self.keys[slot]:
+            i = bisect_left(self.sorted_keys, (key, slot))
+            if i < len(self.sorted_keys) and self.sorted_keys[i] == (key, slot):
+                del self.sorted_keys[i]
+        del self.slots[self.ids[slot]]
+        self.ids[slot] = None
+        self.keys[slot] = ()
+        self.free.append(slot)
+
+    def link(self, slot):
+        """Insert a slot into the rank-ordered structures"""
+        rank = self.rank.__getitem__
+        for key in self.keys[slot]:
+            insort(self.exact.setdefault(key, []), slot, key=rank)
+        slot_grams = set().union(*map(grams, self.keys[slot]))
+        for gram in slot_grams:
+            insort(self.postings.setdefault(gram, []), slot, key=rank)
+            self.posting_arrays.pop(gram, None)
+        self.gram_sizes[slot] = len(slot_grams)
+        self.key_lengths[slot] = len(self.keys[slot][-1]) if self.keys[slot] else 0
+        self.columns = None
+        self.mark_prefixes(slot)
+
+    def unlink(self, slot):
+        """Take a slot out of the rank-ordered structures"""
+        for key in self.keys[slot]:
+            self.exact[key].remove(slot)
+            if not self.exact[key]:
+                del self.exact[key]
+        for gram in set().union(*map(grams, self.keys[slot])):
+            self.postings[gram].remove(slot)
+            self.posting_arrays.pop(gram, None)
+        self.columns = None
+        self.mark_prefixes(slot)
+
+    def mark_prefixes(self, slot):
+        for key in self.keys[slot]:
+            for size in range(2, min(len(key), PREFIX_DEPTH) + 1):
+                self.dirty_prefixes.add(key[:size])
+
+
+index = TypeaheadIndex()
+
+
+def name_typeahead(q, limit=20):
+    """Ranked typeahead matches for `q` from the process-wide index"""
+    return index.search(q, limit)
+
+
+def nearest_names(q, k=10):
+    """The k names closest to `q` by edit distance, from the process-wide index"""
+    return index.nearest(q, k)
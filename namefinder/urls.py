@@ -10,6 +10,7 @@ urlpatterns = [
     path('name/<int:pk>/', views.name_detail, name='name_detail'),
     path('fragments/', views.fragment_search, name='fragment_search'),
     path('fragment/<int:pk>/', views.fragment_detail, name='fragment_detail'),
+    path('spellings/', views.spelling_search, name='spelling_search'),
     path('cth/', views.cth_search, name='cth_search'),
     path('cth/<str:cth_number>/', views.cth_detail, name='cth_detail'),
     path('about/', views.about, name='about'),
@@ -51,7 +52,13 @@ urlpatterns = [
     path('api/fragment/create/', api_views.api_fragment_create, name='api_fragment_create'),
     path('api/revert/<int:pk>/', api_views.api_revert_change, name='api_revert_change'),
     path('api/network/', api_views.api_network_data, name='api_network_data'),
+    path('api/network/stats/', api_views.api_network_stats, name='api_network_stats'),
+    path('api/network/metrics/', api_views.api_network_metrics, name='api_network_metrics'),
+    path('api/network/jobs/<uuid:pk>/', api_views.api_network_job, name='api_network_job'),
+    path('api/network/jobs/<uuid:pk>/result/', api_views.api_network_job_result, name='api_network_job_result'),
     path('api/name/search/', api_views.api_name_search, name='api_name_search'),
+    path('api/name/match/', api_views.api_name_match, name='api_name_match'),
+    path('api/search/facets/', api_views.api_search_facets, name='api_search_facets'),
     
     # Network visualization
     path('network/', views.network, name='network'),
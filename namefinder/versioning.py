@@ -0,0 +1,83 @@
+"""
+Data version tracking for in-process caches and indexes.
+
+Every write to a tracked model appends a DataChange row (see signals.py);
+the highest id is the data version. Caches store the version they were
+built at and compare it with current_version() before answering, which
+keeps gunicorn workers consistent with each other without a shared cache.
+Indexes that patch themselves from the journal instead of rebuilding
+look up the names of changed attestations in an AttestedNames map: a
+deleted attestation has no row left to say which name it belonged to.
+"""
+import numpy as np
+from django.db.models import Max
+from .models import DataChange, Instance
+
+
+# Journal rows kept when pruning (the latest row per model type always stays)
+JOURNAL_KEEP = 10000
+PRUNE_EVERY = 1000
+
+
+def current_version(*model_types):
+    """Latest journal id, optionally restricted to some model types"""
+    changes = DataChange.objects.all()
+    if model_types:
+        changes = changes.filter(model_type__in=model_types)
+    return changes.aggregate(version=Max('id'))['version'] or 0
+
+
+def record_change(model_type, action, object_id=None):
+    """Append a journal row and return the new data version"""
+    change = DataChange.objects.create(model_type=model_type, action=action, object_id=object_id)
+    if change.id % PRUNE_EVERY == 0:
+        prune_changes(change.id)
+    return change.id
+
+
+def prune_changes(version):
+    """Drop old journal rows, keeping the latest one of each model type"""
+    latest = DataChange.objects.values('model_type').annotate(latest=Max('id')).values_list('latest', flat=True)
+    DataChange.objects.filter(id__lte=version - JOURNAL_KEEP).exclude(id__in=list(latest)).delete()
+
+
+class AttestedNames:
+    """Name id of every attestation (0 for none), as arrays sorted by attestation id"""
+
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.names = np.zeros(0, dtype=np.int64)
+
+    def load(self, rows=None):
+        """Load (id, name_id) rows sorted by id, by default every attestation"""
+        if rows is None:
+            rows = Instance.objects.order_by('id').values_list('id', 'name_id')
+        table = np.array([(pk, name_id or 0) for pk, name_id in rows], dtype=np.int64).reshape(-1, 2)
+        self.ids, self.names = table[:, 0].copy(), table[:, 1].copy()
+
+    def update(self, pks):
+        """Re-read some attestations; returns the ids of the names they had before and have now"""
+        if not pks:
+            return set()
+        pks = np.array(sorted(pks), dtype=np.int64)
+        at = np.minimum(np.searchsorted(self.ids, pks), max(len(self.ids) - 1, 0))
+        known = at[self.ids[at] == pks] if len(self.ids) else at[:0]
+        before = self.names[known]
+        rows = np.array(
+            [(pk, name_id or 0) for pk, name_id in Instance.objects.filter(pk__in=pks.tolist()).values_list('id', 'name_id')],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        keep = np.ones(len(self.ids), dtype=bool)
+        keep[known] = False
+        ids = np.concatenate([self.ids[keep], rows[:, 0]])
+        order = np.argsort(ids, kind='stable')
+        self.ids, self.names = ids[order], np.concatenate([self.names[keep], rows[:, 1]])[order]
+        return (set(before.tolist()) | set(rows[:, 1].tolist())) - {0}
+
+    def counts(self, name_ids=None):
+        """Attestations per name id, for some names or all of them"""
+        names = self.names[self.names > 0]
+        if name_ids is not None:
+            names = names[np.isin(names, list(name_ids))]
+        values, counts = np.unique(names, return_counts=True)
+        return dict(zip(values.tolist(), counts.tolist()))
@@ -1,19 +1,26 @@
-import re
 import csv
+from urllib.parse import urlencode
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import HttpResponse
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
+from django.db.models import Count
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .models import (
     Name, Instance, Fragment, Series, PublicationType,
-    NameType, WritingType, CompletenessType, Milieu, Determinative
+    NameType, WritingType, CompletenessType, Milieu, Determinative, spelling_signs
 )
+from .lookups import lookups
+from .pagination import KeysetPaginator
 from .forms import (
     LoginForm, NameForm, FragmentForm, InstanceForm, InstanceInlineForm
 )
+from .regex_engine import RegexTooExpensive
+from .search import filter_names, search_filter, search_ordering, spelling_search as search_spellings, date_filter, date_choices as search_date_choices, SORT_RELEVANCE, SORT_ALPHABETICAL
+from .typeahead import nearest_names
+from .facets import facet_counts
+from .cooccurrence import co_occurring_names
 
 
 def index(request):
@@ -25,50 +32,23 @@ def index(request):
     selected_completeness = request.GET.get('completeness', '')
     selected_milieu = request.GET.get('milieu', '')
     selected_date = request.GET.get('date', '')
-    page_number = request.GET.get('page', 1)
+    sort = request.GET.get('sort', '')
+    cursor = request.GET.get('cursor')
     
     # Get filter options
-    name_types = NameType.objects.all()
-    writing_types = WritingType.objects.all()
-    completeness_types = CompletenessType.objects.all()
-    milieus = Milieu.objects.all()
+    tables = lookups()
+    name_types = tables.all(NameType)
+    writing_types = tables.all(WritingType)
+    completeness_types = tables.all(CompletenessType)
+    milieus = tables.all(Milieu)
     
-    # Get distinct dates for filter dropdown
-    date_choices = Fragment.objects.exclude(
-        date__isnull=True
-    ).exclude(date='').values_list('date', flat=True).distinct().order_by('date')
+    # Distinct dates for the filter dropdown, served from the NameDate index
+    date_choices = search_date_choices()
     
     names = Name.objects.select_related(
         'name_type', 'writing_type', 'completeness', 'milieu'
     )
     
-    # Apply search
-    if query:
-        if use_regex:
-            try:
-                # Test if it's a valid regex
-                re.compile(query)
-                # Use regex on the query field (normalized)
-                names = names.filter(
-                    Q(query__iregex=query) | 
-                    Q(name__iregex=query) |
-                    Q(variant_forms__iregex=query)
-                )
-            except re.error:
-                # Invalid regex, fall back to contains search
-                names = names.filter(
-                    Q(query__icontains=query) | 
-                    Q(name__icontains=query)
-                )
-        else:
-            # Normalize the search query for matching
-            normalized_query = Name.normalize_for_search(query)
-            names = names.filter(
-                Q(query__icontains=normalized_query) | 
-                Q(name__icontains=query) |
-                Q(variant_forms__icontains=query)
-            )
-    
     # Apply filters
     if selected_name_type:
         names = names.filter(name_type_id=selected_name_type)
@@ -79,42 +59,104 @@ def index(request):
     if selected_milieu:
         names = names.filter(milieu_id=selected_milieu)
     if selected_date:
-        # Filter names that have at least one instance on a fragment with this date
-        names = names.filter(instances__fragment__date=selected_date).distinct()
+        # Names with at least one attestation on a fragment with this date
+        names = names.filter(date_filter(selected_date))
+    filtered_names = names
     
-    # Order results
-    names = names.order_by('query', 'name')
+    # Apply search
+    regex_too_expensive = False
+    try:
+        search = search_filter(query, use_regex)
+        names = names.filter(search)
+    except RegexTooExpensive:
+        regex_too_expensive = True
+        names = names.none()
+    
+    # Rank plain searches by relevance, computed in the database
+    names, ordering = search_ordering(names, query, use_regex, sort)
+    
+    # Paginate by seeking on the sort key; counts are cached per filter set
+    filters = {
+        'q': query,
+        'regex': use_regex,
+        'name_type': selected_name_type,
+        'writing_type': selected_writing_type,
+        'completeness': selected_completeness,
+        'milieu': selected_milieu,
+        'date': selected_date,
+    }
+    paginator = KeysetPaginator(names, ordering, 50, count_key=filters)  # 50 names per page
+    page_obj = paginator.get_page(cursor)
     
-    # Paginate
-    paginator = Paginator(names, 50)  # 50 names per page
-    page_obj = paginator.get_page(page_number)
+    # Hits each filter value would leave, shown next to the options; the
+    # search is the page's own (a regex ran once, above)
+    facets = None
+    if not regex_too_expensive:
+        facets = facet_counts(filters, Name.objects.filter(search) if query else None)
+    
+    def options(choices, facet, key=lambda choice: choice.pk):
+        return [(choice, facets[facet].get(key(choice), 0) if facets else None) for choice in choices]
+    
+    # Nothing found: suggest the nearest names by edit distance
+    suggestions = []
+    if query and not use_regex and not regex_too_expensive and paginator.count == 0:
+        suggestions = fuzzy_suggestions(filtered_names, query)
+    
+    # Current filters as a query string for the pagination links
+    filter_params = request.GET.copy()
+    filter_params.pop('cursor', None)
+    filter_params.pop('page', None)
     
     context = {
         'names': page_obj,
         'page_obj': page_obj,
+        'filter_querystring': filter_params.urlencode(),
         'query': query,
         'use_regex': use_regex,
+        'regex_too_expensive': regex_too_expensive,
+        'suggestions': suggestions,
         'name_types': name_types,
         'writing_types': writing_types,
         'completeness_types': completeness_types,
         'milieus': milieus,
         'date_choices': date_choices,
+        'facets': facets,
+        'name_type_options': options(name_types, 'name_type'),
+        'writing_type_options': options(writing_types, 'writing_type'),
+        'completeness_options': options(completeness_types, 'completeness'),
+        'milieu_options': options(milieus, 'milieu'),
+        'date_options': options(date_choices, 'date', key=lambda date: date),
         'selected_name_type': selected_name_type,
         'selected_writing_type': selected_writing_type,
         'selected_completeness': selected_completeness,
         'selected_milieu': selected_milieu,
         'selected_date': selected_date,
+        'sort': sort or SORT_RELEVANCE,
+        'sort_relevance': SORT_RELEVANCE,
+        'sort_alphabetical': SORT_ALPHABETICAL,
     }
     
     return render(request, 'namefinder/index.html', context)
 
 
+def fuzzy_suggestions(names, query, limit=10):
+    """Names from `names` closest to `query` by edit distance, nearest first"""
+    # Ask for more than needed since the filters may drop some
+    nearest = nearest_names(query, limit * 5)
+    distances = {name_id: distance for name_id, _, _, _, distance in nearest}
+    order = {name_id: i for i, (name_id, *_) in enumerate(nearest)}
+    suggestions = sorted(names.filter(pk__in=list(distances)), key=lambda name: order[name.pk])[:limit]
+    for name in suggestions:
+        name.distance = distances[name.pk]
+    return suggestions
+
+
 def name_detail(request, pk):
     """Detail page for a single name"""
     name = get_object_or_404(
         Name.objects.select_related(
             'name_type', 'writing_type', 'completeness', 'milieu'
-        ).prefetch_related('determinatives'),
+        ).prefetch_related('determinatives', 'variants'),
         pk=pk
     )
     
@@ -129,27 +171,30 @@ def name_detail(request, pk):
         ).order_by('fragment__series__name', 'fragment__fragment_number', 'line')
     
     determinatives = name.determinatives.all()
+    variants = [v for v in name.variants.all() if v.kind == 'variant']
+    correspondences = [v for v in name.variants.all() if v.kind == 'correspondence']
     
-    # Get co-occurring names (names that appear on the same fragments)
-    fragment_ids = instances.values_list('fragment_id', flat=True).distinct()
-    co_occurring = Name.objects.filter(
-        instances__fragment_id__in=fragment_ids
-    ).exclude(pk=pk).annotate(
-        co_occurrence_count=Count('instances', filter=Q(instances__fragment_id__in=fragment_ids))
-    ).select_related('name_type').order_by('-co_occurrence_count', 'name')[:50]  # Limit to top 50
+    # Get co-occurring names (names that appear on the same fragments) from the graph store
+    if name.name_type and name.name_type.name == 'place':
+        co_occurring = []
+    else:
+        co_occurring = co_occurring_names(name, limit=50)  # Limit to top 50
     
     # Get all options for inline editing dropdowns
-    name_types = NameType.objects.all()
-    writing_types = WritingType.objects.all()
-    completeness_types = CompletenessType.objects.all()
-    milieus = Milieu.objects.all()
-    all_determinatives = Determinative.objects.all()
+    tables = lookups()
+    name_types = tables.all(NameType)
+    writing_types = tables.all(WritingType)
+    completeness_types = tables.all(CompletenessType)
+    milieus = tables.all(Milieu)
+    all_determinatives = tables.all(Determinative)
     # Note: fragments are loaded via AJAX autocomplete, not passed to context
     
     context = {
         'name': name,
         'instances': instances,
         'determinatives': determinatives,
+        'variants': variants,
+        'correspondences': correspondences,
         'co_occurring_names': co_occurring,
         # For inline editing
         'name_types': name_types,
@@ -174,15 +219,12 @@ def fragment_search(request):
     fragments_for_series = None
     selected_series_name = ''
     
-    if selected_series:
-        try:
-            series_obj = Series.objects.get(pk=selected_series)
-            selected_series_name = series_obj.name
-            fragments_for_series = Fragment.objects.filter(
-                series_id=selected_series
-            ).select_related('publication_type').prefetch_related('instances').order_by('fragment_number')
-        except Series.DoesNotExist:
-            pass
+    series_obj = lookups().get(Series, selected_series) if selected_series else None
+    if series_obj:
+        selected_series_name = series_obj.name
+        fragments_for_series = Fragment.objects.filter(
+            series_id=series_obj.pk
+        ).select_related('publication_type').prefetch_related('instances').order_by('fragment_number')
     
     context = {
         'series_list': series_list,
@@ -195,6 +237,33 @@ def fragment_search(request):
     return render(request, 'namefinder/fragment_search.html', context)
 
 
+def spelling_search(request):
+    """Sign-level search over attestation spellings (e.g. "ta-ḫa")"""
+    query = request.GET.get('q', '').strip()
+    cursor = request.GET.get('cursor')
+    
+    page_obj = None
+    names = []
+    if query:
+        instances = search_spellings(query)
+        # Names with the most matching attestations first
+        names = instances.order_by().values('name_id', 'name__name').annotate(
+            attestations=Count('id')
+        ).order_by('-attestations', 'name__name')[:30]
+        paginator = KeysetPaginator(instances, ['sign_key', 'id'], 50, count_key={'spelling': query})
+        page_obj = paginator.get_page(cursor)
+    
+    context = {
+        'query': query,
+        'signs': spelling_signs(query),
+        'names': names,
+        'page_obj': page_obj,
+        'filter_querystring': urlencode({'q': query}),
+    }
+    
+    return render(request, 'namefinder/spelling_search.html', context)
+
+
 def cth_search(request):
     """Search page for CTH (Catalogue des Textes Hittites) with dropdown"""
     import re
@@ -320,11 +389,12 @@ def fragment_detail(request, pk):
     ).order_by('line', 'name__name')
     
     # Get all options for inline editing dropdowns
-    series_list = Series.objects.all()
-    publication_types = PublicationType.objects.all()
-    name_types = NameType.objects.all()
-    writing_types = WritingType.objects.all()
-    all_determinatives = Determinative.objects.all()
+    tables = lookups()
+    series_list = tables.all(Series)
+    publication_types = tables.all(PublicationType)
+    name_types = tables.all(NameType)
+    writing_types = tables.all(WritingType)
+    all_determinatives = tables.all(Determinative)
     all_names = Name.objects.select_related('name_type').order_by('name')
     
     context = {
@@ -348,7 +418,7 @@ def about(request):
         'names': Name.objects.count(),
         'instances': Instance.objects.count(),
         'fragments': Fragment.objects.count(),
-        'series': Series.objects.count(),
+        'series': len(lookups().all(Series)),
     }
     
     context = {
@@ -428,33 +498,20 @@ def export_search_csv(request):
     selected_writing_type = request.GET.get('writing_type', '')
     selected_completeness = request.GET.get('completeness', '')
     selected_milieu = request.GET.get('milieu', '')
+    sort = request.GET.get('sort', '')
     
     names = Name.objects.select_related(
         'name_type', 'writing_type', 'completeness', 'milieu'
     )
     
     # Apply search (same logic as index view)
-    if query:
-        if use_regex:
-            try:
-                re.compile(query)
-                names = names.filter(
-                    Q(query__iregex=query) | 
-                    Q(name__iregex=query) |
-                    Q(variant_forms__iregex=query)
-                )
-            except re.error:
-                names = names.filter(
-                    Q(query__icontains=query) | 
-                    Q(name__icontains=query)
-                )
-        else:
-            normalized_query = Name.normalize_for_search(query)
-            names = names.filter(
-                Q(query__icontains=normalized_query) | 
-                Q(name__icontains=query) |
-                Q(variant_forms__icontains=query)
-            )
+    try:
+        names = filter_names(names, query, use_regex)
+    except RegexTooExpensive:
+        return HttpResponse(
+            'This regex pattern is too expensive to run. Please make it more specific.',
+            status=400, content_type='text/plain'
+        )
     
     # Apply filters
     if selected_name_type:
@@ -466,7 +523,9 @@ def export_search_csv(request):
     if selected_milieu:
         names = names.filter(milieu_id=selected_milieu)
     
-    names = names.order_by('query', 'name')
+    # Same order as the search page
+    names, ordering = search_ordering(names, query, use_regex, sort)
+    names = names.order_by(*ordering)
     
     # Create CSV response
     response = HttpResponse(content_type='text/csv')
@@ -808,8 +867,9 @@ def instance_delete(request, pk):
 
 def network(request):
     """Network visualization page for co-occurrence of names"""
-    name_types = NameType.objects.all()
-    milieus = Milieu.objects.all()
+    tables = lookups()
+    name_types = tables.all(NameType)
+    milieus = tables.all(Milieu)
     
     # Get all series for filter
     series_list = Series.objects.annotate(
@@ -819,5 +879,6 @@ def network(request):
     context = {
         'name_types': name_types,
         'series_list': series_list,
+        'date_choices': search_date_choices(),
     }
     return render(request, 'namefinder/network.html', context)